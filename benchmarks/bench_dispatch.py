@@ -0,0 +1,71 @@
+"""Микробенчмарк накладных расходов диспетчеризации visitor (на один узел)
+
+   Обработчики диспетчеров временно заменяются пустой функцией, поэтому измеряется только
+   стоимость вызова через диспетчер по сравнению с прямым вызовом обработчика.
+
+   Запуск: python benchmarks/bench_dispatch.py [src-file ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from compiler_demo import rd_parser, semantic_checker, msil, jbc
+
+
+def all_nodes(root):
+    nodes, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.childs)
+    return nodes
+
+
+def noop(*args, **kw):
+    return None
+
+
+def bench(visitor_cls, method_name, nodes, extra_args, repeat=20):
+    method = getattr(visitor_cls, method_name)
+    dispatcher = method.dispatcher
+    saved = dict(dispatcher.targets)
+    nodes = [node for node in nodes if type(node) in saved]
+    visitor = visitor_cls.__new__(visitor_cls)
+    try:
+        for typ in saved:
+            dispatcher.add_target(typ, noop)
+        best_dispatch = best_direct = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for node in nodes:
+                method(visitor, node, *extra_args)
+            best_dispatch = min(best_dispatch, time.perf_counter() - start)
+            start = time.perf_counter()
+            for node in nodes:
+                noop(visitor, node, *extra_args)
+            best_direct = min(best_direct, time.perf_counter() - start)
+    finally:
+        for typ, target in saved.items():
+            dispatcher.add_target(typ, target)
+    return len(nodes), (best_dispatch - best_direct) / len(nodes) * 1e9
+
+
+def main():
+    files = sys.argv[1:] or [os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', '5.txt')]
+    src = '\n'.join(open(f, encoding='utf-8').read() for f in files)
+    prog = rd_parser.parse(src * 100)
+    nodes = all_nodes(prog)
+    for visitor_cls, method_name, extra_args in (
+        (semantic_checker.SemanticChecker, 'semantic_check', (None, )),
+        (msil.MsilCodeGenerator, 'msil_gen', ()),
+        (jbc.JbcCodeGenerator, 'jbc_gen', ()),
+    ):
+        count, overhead = bench(visitor_cls, method_name, nodes, extra_args)
+        print(f'{visitor_cls.__name__}.{method_name}: {count} nodes, dispatch overhead {overhead:.0f} ns/node')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Отчет о работе peephole-оптимизатора: количество инструкций до и после оптимизации,
+   количество замененных (переписанных или удаленных) инструкций и размер кода в байтах
+
+   Короткие формы (ldc.i4.N, ldloc.N, iconst_N, iload_N и т.п.) заменяют одну инструкцию одной,
+   поэтому их эффект виден только в количестве замененных инструкций и в размере кода.
+
+   Запуск: python benchmarks/peephole_report.py [src-file ...]
+"""
+
+import difflib
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from compiler_demo import rd_parser, semantic_base, semantic_checker, optimizer, ir, msil, jbc, class_file
+from compiler_demo.code_gen_base import CodeLabel
+
+
+# инструкции MSIL, кодируемые двумя байтами (префикс 0xFE)
+MSIL_TWO_BYTE_OPCODES = ('ceq', 'cgt', 'cgt.un', 'clt', 'clt.un', 'tail.')
+# инструкции MSIL с 4-байтовым операндом (токен метаданных или смещение перехода)
+MSIL_TOKEN_OPCODES = ('call', 'callvirt', 'newobj', 'ldstr', 'ldsfld', 'stsfld', 'ldc.i4',
+                      'br', 'brtrue', 'brfalse', 'beq', 'bne.un', 'bge', 'bgt', 'ble', 'blt',
+                      'bge.un', 'bgt.un', 'ble.un', 'blt.un')
+
+
+def msil_instruction_size(line):
+    """Размер инструкции MSIL в байтах (по кодированию ECMA-335)
+    """
+
+    op = line.code.split(' ', 1)[0]
+    if op in ('ldloc', 'stloc', 'ldarg', 'starg'):
+        return 4
+    if op in MSIL_TWO_BYTE_OPCODES or op.endswith('.s'):
+        return 2
+    if op == 'ldc.r8':
+        return 9
+    if op in MSIL_TOKEN_OPCODES:
+        return 5
+    return 1
+
+
+def msil_code_size(lines):
+    return sum(msil_instruction_size(line) for line in lines)
+
+
+def jbc_code_size(lines):
+    # размер считается так же, как при записи class-файла (в т.ч. ldc/ldc_w по номеру константы)
+    method = class_file.MethodBuilder(class_file.ConstantPool(), 0, 'size', '()V', 0)
+    for line in lines:
+        method.add(line.code, line.params)
+    return sum(instr.size for instr in method.instrs)
+
+
+GENERATORS = (
+    ('msil', lambda file_name: msil.MsilCodeGenerator(), msil_code_size),
+    ('jbc', lambda file_name: jbc.JbcCodeGenerator(file_name), jbc_code_size),
+)
+
+
+def compile_program(src):
+    prog = rd_parser.parse(src)
+    semantic_checker.SemanticChecker().check(prog, semantic_checker.prepare_global_scope())
+    return ir.build_ir(optimizer.optimize(prog))
+
+
+def instructions(gen):
+    return [line for line in gen.code_lines if gen.peephole_optimizer.is_instruction(line)]
+
+
+def instruction_key(line):
+    # метки сравниваются по объекту (номера меткам назначаются только при выводе кода)
+    return (line.code, ) + tuple(id(p) if isinstance(p, CodeLabel) else str(p) for p in line.params)
+
+
+def rewritten_count(before, after):
+    """Количество инструкций исходного кода, которые peephole-оптимизатор заменил или удалил
+    """
+
+    matcher = difflib.SequenceMatcher(None, [instruction_key(line) for line in before],
+                                      [instruction_key(line) for line in after], autojunk=False)
+    return len(before) - sum(block.size for block in matcher.get_matching_blocks())
+
+
+def peephole_stats(prog, file_name):
+    stats = []
+    for name, make_gen, code_size in GENERATORS:
+        gen = make_gen(file_name)
+        gen.gen_program(prog)
+        before = instructions(gen)
+        gen.peephole()
+        after = instructions(gen)
+        stats.append((name, len(before), len(after), rewritten_count(before, after),
+                      code_size(before), code_size(after)))
+    return stats
+
+
+def change(before, after):
+    return '{} -> {} ({:+.1%})'.format(before, after, after / before - 1 if before else 0)
+
+
+def main():
+    files = sys.argv[1:] or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          '..', 'tests', '*.txt')))
+    print('{:<12}{:<6}{:>24}{:>12}{:>26}'.format('file', '', 'instructions', 'rewritten', 'code size, bytes'))
+    for file_name in files:
+        with open(file_name, encoding='utf-8') as f:
+            src = f.read()
+        try:
+            prog = compile_program(src)
+        except semantic_base.SemanticException as e:
+            print('{:<12}skipped: {}'.format(os.path.basename(file_name), e.message))
+            continue
+        for name, count_before, count_after, rewritten, size_before, size_after in peephole_stats(prog, file_name):
+            print('{:<12}{:<6}{:>24}{:>12}{:>26}'.format(os.path.basename(file_name), name,
+                                                         change(count_before, count_after), rewritten,
+                                                         change(size_before, size_after)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,60 @@
 from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_right
 from contextlib import suppress
-from typing import Optional, Union, Tuple, Callable
+from typing import Any, Optional, Union, Tuple, Callable
 
 from compiler_demo.semantic_base import TYPE_CONVERTIBILITY, BinOp, \
     TypeDesc, IdentDesc, IdentScope, SemanticException
 
 
+class SourcePositions:
+    """Индекс начал строк исходного кода для вычисления строки и позиции по смещению в тексте
+       (смещения переводов строк хранятся в массиве, поиск строки - бинарный)
+    """
+
+    def __init__(self, src: str) -> None:
+        self.src = src
+        self.newlines = array('q')
+        find = src.find
+        i = find('\n')
+        while i >= 0:
+            self.newlines.append(i)
+            i = find('\n', i + 1)
+
+    def row_col(self, loc: int) -> Tuple[int, int]:
+        """Строка и позиция символа исходного кода
+           (символы возврата каретки не учитываются, позиция первого символа строки - 2)
+        :param loc: смещение символа в тексте
+        :return: строка, позиция
+        """
+
+        row = bisect_right(self.newlines, loc)
+        line_start = self.newlines[row - 1] + 1 if row > 0 else 0
+        if line_start > loc:
+            # сам символ перевода строки относится к следующей строке
+            col = 0
+        else:
+            col = loc - line_start + 1 - self.src.count('\r', line_start, loc + 1)
+        return row + 1, col + 1
+
+
 class AstNode(ABC):
     """Базовый абстрактый класс узла AST-дерева
     """
 
+    # у узлов нет __dict__, поэтому в props допустимы только объявленные атрибуты (loc, positions)
+    __slots__ = ('_row', '_col', 'loc', 'positions', 'node_type', 'node_ident')
+
     init_action: Callable[['AstNode'], None] = None
 
     def __init__(self, row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__()
-        self.row = row
-        self.col = col
+        self._row = row
+        self._col = col
+        # смещение узла в исходном коде и индекс для вычисления по нему строки и позиции (при первом обращении)
+        self.loc: Optional[int] = None
+        self.positions: Optional[SourcePositions] = None
         for k, v in props.items():
             setattr(self, k, v)
         if AstNode.init_action is not None:
@@ -23,6 +62,28 @@ class AstNode(ABC):
         self.node_type: Optional[TypeDesc] = None
         self.node_ident: Optional[IdentDesc] = None
 
+    def _resolve_position(self) -> None:
+        if self._row is None and self._col is None and self.loc is not None and self.positions is not None:
+            self._row, self._col = self.positions.row_col(self.loc)
+
+    @property
+    def row(self) -> Optional[int]:
+        self._resolve_position()
+        return self._row
+
+    @row.setter
+    def row(self, value: Optional[int]) -> None:
+        self._row = value
+
+    @property
+    def col(self) -> Optional[int]:
+        self._resolve_position()
+        return self._col
+
+    @col.setter
+    def col(self, value: Optional[int]) -> None:
+        self._col = value
+
     @abstractmethod
     def __str__(self) -> str:
         pass
@@ -48,36 +109,42 @@ class AstNode(ABC):
     """Чтобы среда не "ругалась" в модуле semantic_checker
     """
 
-    def semantic_check(self, checker, scope: IdentScope) -> None:
-        checker.semantic_check(self, scope)
+    def semantic_check(self, checker, scope: IdentScope) -> Any:
+        return checker.semantic_check(self, scope)
 
     """Чтобы среда не "ругалась" в модуле msil
     """
 
-    def msil_gen(self, generator) -> None:
-        generator.msil_gen(self)
+    def msil_gen(self, generator) -> Any:
+        return generator.msil_gen(self)
 
     """Чтобы среда не "ругалась" в модуле jbc
     """
 
-    def jbc_gen(self, generator) -> None:
-        generator.jbc_gen(self)
+    def jbc_gen(self, generator) -> Any:
+        return generator.jbc_gen(self)
 
     """Чтобы среда не "ругалась" в модуле llvm
     """
 
-    def llvm_gen(self, generator) -> None:
-        generator.llvm_gen(self)
+    def llvm_gen(self, generator) -> Any:
+        return generator.llvm_gen(self)
 
     @property
     def tree(self) -> [str, ...]:
-        r = [self.to_str_full()]
-        childs = self.childs
-        for i, child in enumerate(childs):
-            ch0, ch = '├', '│'
-            if i == len(childs) - 1:
-                ch0, ch = '└', ' '
-            r.extend(((ch0 if j == 0 else ch) + ' ' + s for j, s in enumerate(child.tree)))
+        r = []
+        # элементы стека: (узел, префикс первой строки узла, префикс строк потомков)
+        stack = [(self, '', '')]
+        while stack:
+            node, first_prefix, prefix = stack.pop()
+            r.append(first_prefix + node.to_str_full())
+            childs = node.childs
+            last = len(childs) - 1
+            for i in range(last, -1, -1):
+                if i == last:
+                    stack.append((childs[i], prefix + '└ ', prefix + '  '))
+                else:
+                    stack.append((childs[i], prefix + '├ ', prefix + '│ '))
         return tuple(r)
 
     def __getitem__(self, index):
@@ -88,6 +155,8 @@ class _GroupNode(AstNode):
     """Класс для группировки других узлов (вспомогательный, в синтаксисе нет соотвествия)
     """
 
+    __slots__ = ('name', '_childs')
+
     def __init__(self, name: str, *childs: AstNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -106,19 +175,21 @@ class ExprNode(AstNode, ABC):
     """Абстракный класс для выражений в AST-дереве
     """
 
-    pass
+    __slots__ = ()
 
 
 class LiteralNode(ExprNode):
     """Класс для представления в AST-дереве литералов (числа, строки, логическое значение)
     """
 
+    __slots__ = ('literal', 'value')
+
     def __init__(self, literal: str,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
         self.literal = literal
         if literal in ('true', 'false'):
-            self.value = bool(literal)
+            self.value = literal == 'true'
         else:
             self.value = eval(literal)
 
@@ -130,6 +201,8 @@ class IdentNode(ExprNode):
     """Класс для представления в AST-дереве идентификаторов
     """
 
+    __slots__ = ('name',)
+
     def __init__(self, name: str,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -144,6 +217,8 @@ class TypeNode(IdentNode):
        (при появлении составных типов данных должен быть расширен)
     """
 
+    __slots__ = ('type',)
+
     def __init__(self, name: str,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(name, row=row, col=col, **props)
@@ -159,6 +234,8 @@ class BinOpNode(ExprNode):
     """Класс для представления в AST-дереве бинарных операций
     """
 
+    __slots__ = ('op', 'arg1', 'arg2')
+
     def __init__(self, op: BinOp, arg1: ExprNode, arg2: ExprNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -179,6 +256,8 @@ class CallNode(ExprNode):
        (в языке программирования может быть как expression, так и statement)
     """
 
+    __slots__ = ('func', 'params')
+
     def __init__(self, func: IdentNode, *params: ExprNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -198,6 +277,8 @@ class TypeConvertNode(ExprNode):
        (в языке программирования может быть как expression, так и statement)
     """
 
+    __slots__ = ('expr', 'type')
+
     def __init__(self, expr: ExprNode, type_: TypeDesc,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -225,7 +306,7 @@ def type_convert(expr: ExprNode, type_: TypeDesc, except_node: Optional[AstNode]
 
     if expr.node_type is None:
         except_node.semantic_error('Тип выражения не определен')
-    if expr.node_type == type_:
+    if expr.node_type is type_:
         return expr
     if expr.node_type.is_simple and type_.is_simple and \
             expr.node_type.base_type in TYPE_CONVERTIBILITY and type_.base_type in TYPE_CONVERTIBILITY[
@@ -241,6 +322,8 @@ class StmtNode(ExprNode, ABC):
     """Абстракный класс для деклараций или инструкций в AST-дереве
     """
 
+    __slots__ = ()
+
     def to_str_full(self):
         return self.to_str()
 
@@ -249,6 +332,8 @@ class AssignNode(ExprNode):
     """Класс для представления в AST-дереве оператора присваивания
     """
 
+    __slots__ = ('var', 'val')
+
     def __init__(self, var: IdentNode, val: ExprNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -267,6 +352,8 @@ class VarsNode(StmtNode):
     """Класс для представления в AST-дереве объявления переменнных
     """
 
+    __slots__ = ('type', 'vars')
+
     def __init__(self, type_: TypeNode, *vars_: Union[IdentNode, 'AssignNode'],
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -285,6 +372,8 @@ class ReturnNode(StmtNode):
     """Класс для представления в AST-дереве оператора return
     """
 
+    __slots__ = ('val',)
+
     def __init__(self, val: ExprNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -302,6 +391,8 @@ class IfNode(StmtNode):
     """Класс для представления в AST-дереве условного оператора
     """
 
+    __slots__ = ('cond', 'then_stmt', 'else_stmt')
+
     def __init__(self, cond: ExprNode, then_stmt: StmtNode, else_stmt: Optional[StmtNode] = None,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -321,6 +412,8 @@ class WhileNode(StmtNode):
     """Класс для представления в AST-дереве условного оператора
     """
 
+    __slots__ = ('cond', 'body')
+
     def __init__(self, cond: ExprNode, body: Optional[StmtNode],
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -339,6 +432,8 @@ class ForNode(StmtNode):
     """Класс для представления в AST-дереве цикла for
     """
 
+    __slots__ = ('init', 'cond', 'step', 'body')
+
     def __init__(self, init: Optional[StmtNode], cond: Optional[ExprNode],
                  step: Optional[StmtNode], body: Optional[StmtNode],
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
@@ -360,6 +455,8 @@ class ParamNode(StmtNode):
     """Класс для представления в AST-дереве объявления параметра функции
     """
 
+    __slots__ = ('type', 'name')
+
     def __init__(self, type_: TypeNode, name: IdentNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -378,6 +475,8 @@ class FuncNode(StmtNode):
     """Класс для представления в AST-дереве объявления функции
     """
 
+    __slots__ = ('type', 'name', 'params', 'body')
+
     def __init__(self, type_: TypeNode, name: IdentNode, params: Tuple[ParamNode], body: StmtNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -395,9 +494,11 @@ class FuncNode(StmtNode):
 
 
 class MapType(StmtNode):
+    __slots__ = ('key_type', 'value_type', 'name')
+
     def __init__(self, key_type: IdentNode, value_type: IdentNode, name: str, row: Optional[int] = None,
-                 line: Optional[int] = None, **props):
-        super().__init__(row=row, line=line, **props)
+                 col: Optional[int] = None, **props):
+        super().__init__(row=row, col=col, **props)
         self.key_type = key_type
         self.value_type = value_type
         self.name = name
@@ -411,6 +512,8 @@ class MapType(StmtNode):
 
 
 class MapDeclarationNode(StmtNode):
+    __slots__ = ('key_type', 'value_type', 'name')
+
     def __init__(self, key_type: IdentNode, value_type: IdentNode, name: str, **props):
         super().__init__(**props)
         self.key_type = key_type
@@ -426,6 +529,8 @@ class MapDeclarationNode(StmtNode):
 
 
 class MapAccessNode(StmtNode):
+    __slots__ = ('name', 'key_expr', 'value_expr')
+
     def __init__(self, name: str, key_expr: IdentNode, value_expr: IdentNode, **props):
         super().__init__(**props)
         self.name = name
@@ -444,6 +549,8 @@ class StmtListNode(StmtNode):
     """Класс для представления в AST-дереве последовательности инструкций
     """
 
+    __slots__ = ('stmts', 'program')
+
     def __init__(self, *stmts: StmtNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -460,3 +567,54 @@ class StmtListNode(StmtNode):
 
 EMPTY_STMT = StmtListNode()
 EMPTY_IDENT = IdentDesc('', TypeDesc.VOID)
+
+
+def is_const_true(expr: Optional[AstNode]) -> bool:
+    """Проверка, что выражение - литерал true (например, условие бесконечного цикла)
+    """
+
+    return isinstance(expr, LiteralNode) and expr.value is True
+
+
+def is_self_call(expr: Optional[AstNode], func: IdentDesc) -> bool:
+    """Проверка, что выражение - вызов функции func (например, рекурсивный вызов в return)
+    """
+
+    return isinstance(expr, CallNode) and expr.func.node_ident is func
+
+
+def always_returns(stmt: AstNode) -> bool:
+    """Проверка, что выполнение инструкции не может продолжиться со следующей инструкции: все пути
+       заканчиваются оператором return (или бесконечным циклом, т.к. break в языке нет)
+
+       Для последовательности инструкций учитывается только последняя инструкция, не считая объявлений
+       функций и переменных без инициализации, для которых код не генерируется
+       (инструкции после return удаляются при оптимизации, а такие объявления сохраняются).
+    :param stmt: инструкция
+    :return: True, если все пути выполнения инструкции заканчиваются return
+    """
+
+    stack = [stmt]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ReturnNode):
+            continue
+        if isinstance(node, StmtListNode):
+            last = next((stmt for stmt in reversed(node.stmts) if not (
+                isinstance(stmt, FuncNode) or
+                isinstance(stmt, VarsNode) and not any(isinstance(var, AssignNode) for var in stmt.vars)
+            )), None)
+            if last is None:
+                return False
+            stack.append(last)
+        elif isinstance(node, IfNode):
+            if not node.else_stmt:
+                return False
+            stack.append(node.then_stmt)
+            stack.append(node.else_stmt)
+        elif isinstance(node, (WhileNode, ForNode)):
+            if not is_const_true(node.cond):
+                return False
+        else:
+            return False
+    return True
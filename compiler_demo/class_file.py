@@ -0,0 +1,496 @@
+import os
+import struct
+import zipfile
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from compiler_demo.code_gen_base import CodeLabel, CodeLine
+from compiler_demo.jbc import JbcException
+
+
+# runtime, добавляемый в jar-файл программы
+RUNTIME_CLASS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'runtime-java',
+                                  'CompilerDemo', 'Runtime.class')
+RUNTIME_CLASS_ENTRY = 'CompilerDemo/Runtime.class'
+
+ACCESS_FLAGS = {
+    'public': 0x0001,
+    'private': 0x0002,
+    'protected': 0x0004,
+    'static': 0x0008,
+    'final': 0x0010,
+}
+ACC_SUPER = 0x0020
+
+TYPE_DESCRIPTORS = {
+    'void': 'V',
+    'int': 'I',
+    'double': 'D',
+    'boolean': 'Z',
+    'long': 'J',
+    'float': 'F',
+    'char': 'C',
+    'byte': 'B',
+    'short': 'S',
+}
+
+# инструкции без операндов: код, изменение глубины стека (в словах)
+SIMPLE_OPCODES: Dict[str, Tuple[int, int]] = {
+    'nop': (0x00, 0),
+    'aconst_null': (0x01, 1),
+    'iconst_m1': (0x02, 1),
+    'iconst_0': (0x03, 1),
+    'iconst_1': (0x04, 1),
+    'iconst_2': (0x05, 1),
+    'iconst_3': (0x06, 1),
+    'iconst_4': (0x07, 1),
+    'iconst_5': (0x08, 1),
+    'dconst_0': (0x0e, 2),
+    'dconst_1': (0x0f, 2),
+    'pop': (0x57, -1),
+    'pop2': (0x58, -2),
+    'dup': (0x59, 1),
+    'dup_x1': (0x5a, 1),
+    'dup_x2': (0x5b, 1),
+    'dup2': (0x5c, 2),
+    'swap': (0x5f, 0),
+    'iadd': (0x60, -1),
+    'dadd': (0x63, -2),
+    'isub': (0x64, -1),
+    'dsub': (0x67, -2),
+    'imul': (0x68, -1),
+    'dmul': (0x6b, -2),
+    'idiv': (0x6c, -1),
+    'ddiv': (0x6f, -2),
+    'irem': (0x70, -1),
+    'drem': (0x73, -2),
+    'ineg': (0x74, 0),
+    'dneg': (0x77, 0),
+    'iand': (0x7e, -1),
+    'ior': (0x80, -1),
+    'ixor': (0x82, -1),
+    'i2d': (0x87, 1),
+    'd2i': (0x8e, -1),
+    'dcmpl': (0x97, -3),
+    'dcmpg': (0x98, -3),
+    'ireturn': (0xac, -1),
+    'dreturn': (0xaf, -2),
+    'areturn': (0xb0, -1),
+    'return': (0xb1, 0),
+}
+# инструкции перехода: код, изменение глубины стека
+JUMP_OPCODES: Dict[str, Tuple[int, int]] = {
+    'ifeq': (0x99, -1),
+    'ifne': (0x9a, -1),
+    'iflt': (0x9b, -1),
+    'ifge': (0x9c, -1),
+    'ifgt': (0x9d, -1),
+    'ifle': (0x9e, -1),
+    'if_icmpeq': (0x9f, -2),
+    'if_icmpne': (0xa0, -2),
+    'if_icmplt': (0xa1, -2),
+    'if_icmpge': (0xa2, -2),
+    'if_icmpgt': (0xa3, -2),
+    'if_icmple': (0xa4, -2),
+    'if_acmpeq': (0xa5, -2),
+    'if_acmpne': (0xa6, -2),
+    'goto': (0xa7, 0),
+    'ifnull': (0xc6, -1),
+    'ifnonnull': (0xc7, -1),
+}
+# инструкции работы с локальными переменными: код (с номером слота в операнде), код короткой формы xload_0,
+# изменение глубины стека (размер значения в словах)
+LOCAL_OPCODES: Dict[str, Tuple[int, int, int]] = {
+    'iload': (0x15, 0x1a, 1),
+    'dload': (0x18, 0x26, 2),
+    'aload': (0x19, 0x2a, 1),
+    'istore': (0x36, 0x3b, -1),
+    'dstore': (0x39, 0x47, -2),
+    'astore': (0x3a, 0x4b, -1),
+}
+MEMBER_OPCODES = {
+    'getstatic': 0xb2,
+    'putstatic': 0xb3,
+    'invokevirtual': 0xb6,
+    'invokespecial': 0xb7,
+    'invokestatic': 0xb8,
+}
+NO_FALL_THROUGH = ('goto', 'ireturn', 'dreturn', 'areturn', 'return')
+OP_BIPUSH = 0x10
+OP_SIPUSH = 0x11
+OP_LDC = 0x12
+OP_LDC_W = 0x13
+OP_LDC2_W = 0x14
+OP_IINC = 0x84
+OP_NEW = 0xbb
+OP_WIDE = 0xc4
+
+
+def type_descriptor(type_name: str) -> str:
+    """Дескриптор типа в class-файле (java.lang.String -> Ljava/lang/String;, int[] -> [I)
+    """
+
+    type_name = type_name.strip()
+    if type_name.endswith('[]'):
+        return '[' + type_descriptor(type_name[:-2])
+    if type_name in TYPE_DESCRIPTORS:
+        return TYPE_DESCRIPTORS[type_name]
+    return f'L{internal_name(type_name)};'
+
+
+def internal_name(class_name: str) -> str:
+    return class_name.replace('.', '/')
+
+
+def value_size(descriptor: str) -> int:
+    """Размер значения типа на стеке (в словах)
+    """
+
+    return 0 if descriptor == 'V' else 2 if descriptor in ('D', 'J') else 1
+
+
+def method_descriptor(return_type: str, params: str) -> Tuple[str, int, int]:
+    """Дескриптор метода по типам в синтаксисе ассемблера ("int f(double x, java.lang.String)")
+    :return: дескриптор, размер параметров и размер возвращаемого значения (в словах)
+    """
+
+    param_descs = [type_descriptor(param.split()[0]) for param in params.split(',') if param.strip()]
+    return_desc = type_descriptor(return_type)
+    return f'({"".join(param_descs)}){return_desc}', sum(value_size(d) for d in param_descs), value_size(return_desc)
+
+
+def modified_utf8(s: str) -> bytes:
+    """Строка в модифицированной кодировке UTF-8 class-файлов: кодируются символы UTF-16
+       (символы вне BMP - суррогатными парами), символ 0 - двумя байтами
+    """
+
+    utf16 = s.encode('utf-16-be', 'surrogatepass')
+    result = bytearray()
+    for i in range(0, len(utf16), 2):
+        code = (utf16[i] << 8) | utf16[i + 1]
+        if 0 < code < 0x80:
+            result.append(code)
+        elif code < 0x800:
+            result += bytes((0xc0 | (code >> 6), 0x80 | (code & 0x3f)))
+        else:
+            result += bytes((0xe0 | (code >> 12), 0x80 | ((code >> 6) & 0x3f), 0x80 | (code & 0x3f)))
+    return bytes(result)
+
+
+class ConstantPool:
+    """Пул констант class-файла (одинаковые константы добавляются один раз)
+    """
+
+    def __init__(self) -> None:
+        self.entries: List[bytes] = []
+        self.indexes: Dict[Tuple, int] = {}
+        self.count = 1
+
+    def add(self, key: Tuple, data: bytes, slots: int = 1) -> int:
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = self.count
+            self.entries.append(data)
+            self.count += slots
+            if self.count > 0xffff:
+                raise JbcException('Переполнение пула констант')
+        return index
+
+    def utf8(self, s: str) -> int:
+        data = modified_utf8(s)
+        if len(data) > 0xffff:
+            raise JbcException('Слишком длинная строковая константа')
+        return self.add(('utf8', s), struct.pack('>BH', 1, len(data)) + data)
+
+    def integer(self, value: int) -> int:
+        return self.add(('int', value), struct.pack('>Bi', 3, (value + 0x80000000) % 0x100000000 - 0x80000000))
+
+    def double(self, value: float) -> int:
+        data = struct.pack('>Bd', 6, value)
+        # ключ - двоичное представление (различаются 0.0 и -0.0, NaN равен себе)
+        return self.add(('double', data), data, 2)
+
+    def class_(self, name: str) -> int:
+        return self.add(('class', name), struct.pack('>BH', 7, self.utf8(internal_name(name))))
+
+    def string(self, s: str) -> int:
+        return self.add(('string', s), struct.pack('>BH', 8, self.utf8(s)))
+
+    def name_and_type(self, name: str, descriptor: str) -> int:
+        return self.add(('nat', name, descriptor), struct.pack('>BHH', 12, self.utf8(name), self.utf8(descriptor)))
+
+    def member(self, tag: int, class_name: str, name: str, descriptor: str) -> int:
+        return self.add(('member', tag, class_name, name, descriptor),
+                        struct.pack('>BHH', tag, self.class_(class_name), self.name_and_type(name, descriptor)))
+
+    def to_bytes(self) -> bytes:
+        return struct.pack('>H', self.count) + b''.join(self.entries)
+
+
+class Instruction:
+    """Инструкция метода: код, операнды (без смещения перехода), изменение глубины стека
+    """
+
+    __slots__ = ('op', 'data', 'stack', 'target', 'offset', 'labels')
+
+    def __init__(self, op: str, data: bytes, stack: int, target: Optional[CodeLabel] = None) -> None:
+        self.op = op
+        self.data = data
+        self.stack = stack
+        self.target = target
+        self.offset = 0
+        # метки инструкции (и строк только с меткой перед ней)
+        self.labels: List[CodeLabel] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + (2 if self.target is not None else 0)
+
+
+class MethodBuilder:
+    """Код метода: кодирование инструкций, разрешение меток, вычисление max_stack и max_locals
+    """
+
+    def __init__(self, pool: ConstantPool, access: int, name: str, descriptor: str, params_size: int) -> None:
+        self.pool = pool
+        self.access = access
+        self.name = name
+        self.descriptor = descriptor
+        self.instrs: List[Instruction] = []
+        self.labels: List[CodeLabel] = []
+        self.max_locals = params_size
+
+    def add_label(self, label: CodeLabel) -> None:
+        self.labels.append(label)
+
+    def add(self, code: str, params: Iterable[Union[str, int, CodeLabel]]) -> None:
+        op, _, operand = code.partition(' ')
+        target = None
+        operands = [operand] if operand else []
+        for param in params:
+            if isinstance(param, CodeLabel):
+                target = param
+            else:
+                operands.append(str(param))
+        instr = self.encode(op, ' '.join(operands), target)
+        instr.labels, self.labels = self.labels, []
+        self.instrs.append(instr)
+
+    def local(self, index: int, size: int) -> None:
+        self.max_locals = max(self.max_locals, index + size)
+
+    def encode(self, op: str, operand: str, target: Optional[CodeLabel]) -> Instruction:
+        if op in SIMPLE_OPCODES:
+            opcode, stack = SIMPLE_OPCODES[op]
+            return Instruction(op, bytes((opcode, )), stack)
+        if op in JUMP_OPCODES:
+            if target is None:
+                raise JbcException(f'Нет метки перехода в инструкции {op}')
+            opcode, stack = JUMP_OPCODES[op]
+            return Instruction(op, bytes((opcode, )), stack, target)
+        base, _, short_index = op.partition('_')
+        if base in LOCAL_OPCODES:
+            opcode, short_opcode, stack = LOCAL_OPCODES[base]
+            index = int(short_index if short_index else operand)
+            self.local(index, abs(stack))
+            if short_index and index <= 3:
+                return Instruction(op, bytes((short_opcode + index, )), stack)
+            if index <= 0xff:
+                return Instruction(op, bytes((opcode, index)), stack)
+            return Instruction(op, struct.pack('>BBH', OP_WIDE, opcode, index), stack)
+        if op == 'iinc':
+            index, const = (int(value) for value in operand.split())
+            self.local(index, 1)
+            if index <= 0xff and -128 <= const <= 127:
+                return Instruction(op, struct.pack('>BBb', OP_IINC, index, const), 0)
+            return Instruction(op, struct.pack('>BBHh', OP_WIDE, OP_IINC, index, const), 0)
+        if op == 'bipush':
+            return Instruction(op, struct.pack('>Bb', OP_BIPUSH, int(operand)), 1)
+        if op == 'sipush':
+            return Instruction(op, struct.pack('>Bh', OP_SIPUSH, int(operand)), 1)
+        if op in ('ldc', 'ldc_w'):
+            if operand.startswith('"'):
+                index = self.pool.string(operand[1:-1])
+            else:
+                index = self.pool.integer(int(operand))
+            if index <= 0xff:
+                return Instruction(op, bytes((OP_LDC, index)), 1)
+            return Instruction(op, struct.pack('>BH', OP_LDC_W, index), 1)
+        if op == 'ldc2_w':
+            return Instruction(op, struct.pack('>BH', OP_LDC2_W, self.pool.double(float(operand.rstrip('dD')))), 2)
+        if op == 'new':
+            return Instruction(op, struct.pack('>BH', OP_NEW, self.pool.class_(operand)), 1)
+        if op in MEMBER_OPCODES:
+            # Class#type name или Class#type name(params)
+            class_name, _, member = operand.partition('#')
+            member_type, _, name = member.partition(' ')
+            if '(' in name:
+                name, _, params = name.partition('(')
+                descriptor, params_size, return_size = method_descriptor(member_type, params.rstrip(')'))
+                index = self.pool.member(10, class_name, name, descriptor)
+                stack = return_size - params_size - (0 if op == 'invokestatic' else 1)
+            else:
+                descriptor = type_descriptor(member_type)
+                index = self.pool.member(9, class_name, name, descriptor)
+                stack = value_size(descriptor) if op == 'getstatic' else -value_size(descriptor)
+            return Instruction(op, struct.pack('>BH', MEMBER_OPCODES[op], index), stack)
+        raise JbcException(f'Неподдерживаемая инструкция {op}')
+
+    def max_stack(self) -> int:
+        """Максимальная глубина стека по всем путям выполнения (обход графа переходов)
+        """
+
+        positions = {id(label): i for i, instr in enumerate(self.instrs) for label in instr.labels}
+        depths: List[Optional[int]] = [None] * len(self.instrs)
+        max_depth = 0
+        work = [(0, 0)] if self.instrs else []
+        while work:
+            i, depth = work.pop()
+            while i < len(self.instrs) and depths[i] is None:
+                depths[i] = depth
+                instr = self.instrs[i]
+                depth += instr.stack
+                if depth < 0:
+                    raise JbcException(f'Отрицательная глубина стека в методе {self.name}')
+                max_depth = max(max_depth, depth)
+                if instr.target is not None:
+                    work.append((positions[id(instr.target)], depth))
+                if instr.op in NO_FALL_THROUGH:
+                    break
+                i += 1
+        return max_depth
+
+    def code(self) -> bytes:
+        offset = 0
+        offsets: Dict[int, int] = {}
+        for instr in self.instrs:
+            instr.offset = offset
+            for label in instr.labels:
+                offsets[id(label)] = offset
+            offset += instr.size
+        if offset > 0xffff:
+            raise JbcException(f'Слишком большой код метода {self.name}')
+        code = bytearray()
+        for instr in self.instrs:
+            code += instr.data
+            if instr.target is not None:
+                if id(instr.target) not in offsets:
+                    raise JbcException(f'Метка {instr.target} не найдена в методе {self.name}')
+                code += struct.pack('>h', offsets[id(instr.target)] - instr.offset)
+        return bytes(code)
+
+    def to_bytes(self) -> bytes:
+        code = self.code()
+        code_attr = struct.pack('>HHI', self.max_stack(), self.max_locals, len(code)) + code + \
+            struct.pack('>HH', 0, 0)
+        return struct.pack('>HHHH', self.access, self.pool.utf8(self.name), self.pool.utf8(self.descriptor), 1) + \
+            struct.pack('>HI', self.pool.utf8('Code'), len(code_attr)) + code_attr
+
+
+class ClassFileWriter:
+    """Запись class-файла по коду, сгенерированному JbcCodeGenerator (синтаксис ассемблера ProGuard):
+       объявления класса, полей и методов, инструкции методов с метками
+    """
+
+    def __init__(self) -> None:
+        self.pool = ConstantPool()
+        self.version = 6
+        self.access = 0
+        self.class_name: Optional[str] = None
+        self.super_name = 'java.lang.Object'
+        self.fields: List[bytes] = []
+        self.methods: List[bytes] = []
+        self.method: Optional[MethodBuilder] = None
+        self.depth = 0
+
+    @staticmethod
+    def access_flags(words: List[str]) -> Tuple[int, List[str]]:
+        access = 0
+        while words and words[0] in ACCESS_FLAGS:
+            access |= ACCESS_FLAGS[words.pop(0)]
+        return access, words
+
+    def add_line(self, line: CodeLine) -> None:
+        code = (line.code or '').strip()
+        if self.method is not None:
+            if line.label is not None:
+                self.method.add_label(line.label)
+            if code == '}':
+                self.methods.append(self.method.to_bytes())
+                self.method = None
+            elif code and code != '{':
+                self.method.add(code, line.params)
+            return
+        if not code:
+            return
+        if code == '{':
+            self.depth += 1
+        elif code == '}':
+            self.depth -= 1
+        elif code.startswith('version '):
+            self.version = int(code[len('version '):].rstrip(';').strip().split('.')[-1])
+        elif self.depth == 0:
+            # public class Name extends Super
+            access, words = self.access_flags(code.split())
+            if not words or words[0] != 'class' or len(words) < 2:
+                raise JbcException(f'Неверное объявление класса: {code}')
+            self.access = access | ACC_SUPER
+            self.class_name = words[1]
+            if len(words) >= 4 and words[2] == 'extends':
+                self.super_name = words[3]
+        elif code.endswith(';'):
+            access, words = self.access_flags(code.rstrip(';').split())
+            field_type, name = words
+            self.fields.append(struct.pack('>HHHH', access, self.pool.utf8(name),
+                                           self.pool.utf8(type_descriptor(field_type)), 0))
+        else:
+            # public static type name(params)
+            head, _, params = code.partition('(')
+            access, words = self.access_flags(head.split())
+            return_type, name = words
+            descriptor, params_size, _ = method_descriptor(return_type, params.rstrip(')'))
+            if not access & ACCESS_FLAGS['static']:
+                params_size += 1
+            self.method = MethodBuilder(self.pool, access, name, descriptor, params_size)
+
+    def write(self, code_lines: Iterable[CodeLine]) -> bytes:
+        """Запись class-файла
+        :param code_lines: код класса (JbcCodeGenerator.code_lines)
+        :return: содержимое class-файла
+        """
+
+        for line in code_lines:
+            self.add_line(line)
+        if self.class_name is None:
+            raise JbcException('Нет объявления класса')
+        this_class = self.pool.class_(self.class_name)
+        super_class = self.pool.class_(self.super_name)
+        body = struct.pack('>HHHH', self.access, this_class, super_class, 0) + \
+            struct.pack('>H', len(self.fields)) + b''.join(self.fields) + \
+            struct.pack('>H', len(self.methods)) + b''.join(self.methods) + \
+            struct.pack('>H', 0)
+        # версия class-файла: Java 6 - 50.0
+        return struct.pack('>IHH', 0xcafebabe, 0, 44 + self.version) + self.pool.to_bytes() + body
+
+
+def write_jar(file: Union[str, os.PathLike], class_name: str, class_bytes: bytes,
+              runtime_class_file: str = RUNTIME_CLASS_FILE) -> None:
+    """Запись исполняемого jar-файла: класс программы и runtime
+    :param file: имя jar-файла
+    :param class_name: имя класса программы (с методом main)
+    :param class_bytes: содержимое class-файла программы
+    :param runtime_class_file: class-файл runtime
+    """
+
+    manifest = f'Manifest-Version: 1.0\r\nMain-Class: {class_name}\r\nCreated-By: compiler_demo\r\n\r\n'
+    try:
+        with open(runtime_class_file, 'rb') as f:
+            runtime = f.read()
+    except OSError as e:
+        raise JbcException(f'Не удалось прочитать class-файл runtime: {e}') from e
+    try:
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as jar:
+            jar.writestr('META-INF/MANIFEST.MF', manifest)
+            jar.writestr(f'{internal_name(class_name)}.class', class_bytes)
+            jar.writestr(RUNTIME_CLASS_ENTRY, runtime)
+    except OSError as e:
+        raise JbcException(f'Не удалось записать jar-файл: {e}') from e
@@ -1,7 +1,10 @@
-from typing import List, Union
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, TextIO, Tuple, Union
 
-from compiler_demo.ast import AstNode, VarsNode
-from compiler_demo.semantic_base import BaseType
+from compiler_demo.ast import AstNode, BinOpNode, FuncNode, ReturnNode, is_self_call
+from compiler_demo.ir import IrInstr, IrJump, IrBranch, IrReturn, BasicBlock, IrFunction, Liveness
+from compiler_demo.semantic_base import BaseType, BinOp, TypeDesc, IdentDesc
+from compiler_demo.traversal import walk
 
 
 DEFAULT_TYPE_VALUES = {
@@ -11,6 +14,9 @@ DEFAULT_TYPE_VALUES = {
     BaseType.STR: ''
 }
 
+# количество строк кода, записываемых в поток за одну операцию при потоковом выводе
+WRITE_CHUNK_LINES = 1024
+
 
 class CodeLabel:
     def __init__(self, prefix: str = 'L'):
@@ -48,24 +54,295 @@ class CodeLine:
         return line
 
 
-def find_vars_decls(node: AstNode) -> List[VarsNode]:
-    vars_nodes: List[VarsNode] = []
+def has_tail_self_calls(func: FuncNode) -> bool:
+    """Проверка, что в функции есть хвостовые рекурсивные вызовы (return f(...) в функции f)
+    """
 
-    def find(node: AstNode) -> None:
-        for n in (node.childs or []):
-            if isinstance(n, VarsNode):
-                vars_nodes.append(n)
-            else:
-                find(n)
+    found = False
+
+    def find(n: AstNode) -> bool:
+        nonlocal found
+        if isinstance(n, ReturnNode) and is_self_call(n.val, func.name.node_ident):
+            found = True
+        return not found
+
+    walk(func.body, find)
+    return found
+
+
+def allocate_slots(liveness: Liveness, vars_: Sequence[IdentDesc], fixed: Optional[Dict[IdentDesc, int]] = None,
+                   first_slot: int = 0, size: Callable[[IdentDesc], int] = lambda var: 1,
+                   typed: bool = False) -> Dict[IdentDesc, int]:
+    """Назначение слотов переменным раскраской графа интерференции: переменные, значения которых не нужны
+       одновременно, занимают один слот. Переменные обрабатываются в порядке убывания частоты использования,
+       каждая получает первый свободный слот, поэтому часто используемые переменные попадают в слоты
+       с короткими инструкциями загрузки (ldloc.0-3, iload_0-3 и т.п.)
+    :param liveness: анализ живых переменных функции
+    :param vars_: переменные, которым назначаются слоты (переменные, к которым нет обращений, пропускаются)
+    :param fixed: переменные с заранее назначенными слотами (например, параметры)
+    :param first_slot: первый слот для назначения
+    :param size: кол-во слотов, занимаемых переменной
+    :param typed: в слоте могут храниться значения только одного типа (типы слотов объявляются заранее)
+    :return: слоты переменных (включая fixed)
+    """
+
+    slots: Dict[IdentDesc, int] = dict(fixed or {})
+    slot_types: Dict[int, TypeDesc] = {}
+    for var in sorted((var for var in vars_ if var in liveness.weights), key=lambda var: -liveness.weights[var]):
+        busy: Set[int] = set()
+        for other in liveness.interference[var]:
+            if other in slots:
+                busy.update(range(slots[other], slots[other] + size(other)))
+        slot = first_slot
+        while any(s in busy for s in range(slot, slot + size(var))) or \
+                (typed and slot_types.get(slot, var.type) is not var.type):
+            slot += 1
+        slots[var] = slot
+        slot_types[slot] = var.type
+    return slots
+
+
+def concat_operands(node: AstNode) -> List[AstNode]:
+    """Операнды цепочки конкатенаций строк (a + b + c + ...) в порядке вычисления
+    :param node: выражение (если это не конкатенация строк, то результат - само выражение)
+    :return: операнды, не являющиеся конкатенацией строк
+    """
+
+    operands: List[AstNode] = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if isinstance(n, BinOpNode) and n.op == BinOp.ADD and n.node_type is TypeDesc.STR:
+            stack.append(n.arg2)
+            stack.append(n.arg1)
+        else:
+            operands.append(n)
+    return operands
+
+
+class PeepholeOptimizer(ABC):
+    """Базовый класс оконной (peephole) оптимизации последовательности инструкций
+
+       Правила (метод rewrite) применяются к последним инструкциям уже обработанной части кода,
+       между которыми нет меток (на метку может быть переход, поэтому через нее окно не распространяется).
+       Также удаляются переходы на следующую инструкцию и неиспользуемые метки.
+       Проходы повторяются, пока код изменяется.
+    """
 
-    find(node)
-    return vars_nodes
+    # максимальный размер окна правил
+    window_size = 4
+    # инструкции безусловного перехода
+    jumps: Tuple[str, ...] = ()
+    # инструкции условного перехода -> инструкции, снимающие со стека значения, проверяемые переходом
+    cond_jumps: Dict[str, Tuple[str, ...]] = {}
 
+    @abstractmethod
+    def is_instruction(self, line: CodeLine) -> bool:
+        pass
+
+    def rewrite(self, window: Sequence[CodeLine]) -> Optional[Tuple[int, Sequence[Tuple]]]:
+        """Правила оптимизации
+        :param window: последние инструкции (последняя - только что добавленная)
+        :return: кол-во последних инструкций, которые надо заменить, и инструкции для замены
+                 (кортежи: инструкция, параметры) или None, если ни одно правило не применимо
+        """
+
+        return None
+
+    def passes(self) -> Tuple[Callable[[List[CodeLine]], Tuple[List[CodeLine], bool]], ...]:
+        """Проходы оптимизации (каждый возвращает новый код и признак того, что код изменился)
+        """
+
+        return self.remove_jumps_to_next, self.remove_unused_labels, self.apply_rules
+
+    def optimize(self, code_lines: List[CodeLine]) -> List[CodeLine]:
+        changed = True
+        while changed:
+            changed = False
+            for pass_ in self.passes():
+                code_lines, pass_changed = pass_(code_lines)
+                changed = changed or pass_changed
+        return code_lines
+
+    def remove_jumps_to_next(self, code_lines: List[CodeLine]) -> Tuple[List[CodeLine], bool]:
+        result: List[CodeLine] = []
+        changed = False
+        for i, line in enumerate(code_lines):
+            if (line.code in self.jumps or line.code in self.cond_jumps) and line.params and \
+                    isinstance(line.params[0], CodeLabel):
+                j = i + 1
+                while j < len(code_lines) and code_lines[j].label and not code_lines[j].code and \
+                        code_lines[j].label is not line.params[0]:
+                    j += 1
+                if j < len(code_lines) and code_lines[j].label is line.params[0]:
+                    changed = True
+                    if line.label:
+                        result.append(CodeLine(None, label=line.label, indent=line.indent))
+                    for code in self.cond_jumps.get(line.code, ()):
+                        result.append(CodeLine(code, indent=line.indent))
+                    continue
+            result.append(line)
+        return result, changed
+
+    @staticmethod
+    def remove_unused_labels(code_lines: List[CodeLine]) -> Tuple[List[CodeLine], bool]:
+        used = set(id(param) for line in code_lines for param in line.params if isinstance(param, CodeLabel))
+        result: List[CodeLine] = []
+        changed = False
+        for line in code_lines:
+            if line.label and id(line.label) not in used:
+                changed = True
+                if not line.code:
+                    continue
+                line.label = None
+            result.append(line)
+        return result, changed
+
+    def apply_rules(self, code_lines: List[CodeLine]) -> Tuple[List[CodeLine], bool]:
+        result: List[CodeLine] = []
+        changed = False
+        for line in code_lines:
+            result.append(line)
+            while self.is_instruction(result[-1]):
+                # окно: последние инструкции, метка может быть только у первой
+                start = len(result) - 1
+                while start > 0 and len(result) - start < self.window_size and not result[start].label and \
+                        self.is_instruction(result[start - 1]):
+                    start -= 1
+                replace = self.rewrite(result[start:])
+                if replace is None:
+                    break
+                count, new_lines = replace
+                label = result[-count].label
+                del result[-count:]
+                indent = line.indent
+                for code, *params in new_lines:
+                    result.append(CodeLine(code, *params, indent=indent))
+                if label:
+                    if new_lines:
+                        result[-len(new_lines)].label = label
+                    else:
+                        result.append(CodeLine(None, label=label, indent=indent))
+                changed = True
+                if not result:
+                    break
+        return result, changed
+
+
+class CodeGenerator(ABC):
+    # оконный оптимизатор сгенерированного кода (определяется в генераторах для конкретных платформ)
+    peephole_optimizer: Optional[PeepholeOptimizer] = None
+    # инструкция безусловного перехода
+    jump_cmd: Optional[str] = None
+    # инструкция загрузки null (значение строковой переменной, которой не присваивалось значение)
+    null_cmd: Optional[str] = None
+
+    def __init__(self, tail_recursion: bool = False):
+        """
+        :param tail_recursion: заменять хвостовые рекурсивные вызовы (return f(...) в функции f)
+                               присваиванием параметрам и переходом в начало функции
+        """
 
-class CodeGenerator:
-    def __init__(self):
         self.code_lines: List[CodeLine] = []
         self.indent = ''
+        self.tail_recursion = tail_recursion
+        # генерируемая функция и метка ее начала для хвостовых рекурсивных вызовов (если они заменяются переходом)
+        self.func: Optional[IrFunction] = None
+        self.tail_call_label: Optional[CodeLabel] = None
+
+    def start_func(self, func: IrFunction) -> None:
+        """Начало генерации тела функции (после объявлений): при необходимости - метка для хвостовых рекурсивных вызовов
+        """
+
+        self.func = func
+        self.tail_call_label = None
+        if self.tail_recursion and func.node is not None and has_tail_self_calls(func.node):
+            self.tail_call_label = CodeLabel()
+            self.add(self.tail_call_label)
+
+    def end_func(self) -> None:
+        self.func = None
+        self.tail_call_label = None
+
+    def is_tail_call_jump(self, node: Union[ReturnNode, IrReturn]) -> bool:
+        """Проверка, что return надо заменить переходом в начало функции
+        """
+
+        return self.tail_call_label is not None and is_self_call(node.val, self.func.node.name.node_ident)
+
+    def init_var_gen(self, var: IdentDesc) -> None:
+        """Присваивание переменной значения, которое она имеет при входе в функцию до первого присваивания
+           (как и у статических полей: строки - null, остальные типы - значения по умолчанию)
+        """
+
+        base_type = var.type.base_type
+        if base_type == BaseType.STR:
+            self.add(self.null_cmd)
+        else:
+            self.push_const(base_type, DEFAULT_TYPE_VALUES[base_type])
+        self.store_gen(var)
+
+    @abstractmethod
+    def instr_gen(self, instr: IrInstr) -> None:
+        """Генерация инструкции промежуточного представления (кроме переходов)
+        """
+
+        pass
+
+    @abstractmethod
+    def cond_gen(self, node: AstNode, label: CodeLabel, jump_if: bool) -> None:
+        """Генерация условного перехода по значению логического выражения
+        """
+
+        pass
+
+    def blocks_gen(self, func: IrFunction) -> None:
+        """Генерация кода тела функции по графу потока управления: блоки в порядке размещения,
+           переход на следующий блок не генерируется, метки - только у блоков, на которые есть переходы
+        """
+
+        blocks = func.blocks
+        labels: Dict[BasicBlock, CodeLabel] = {}
+
+        def label(block: BasicBlock) -> CodeLabel:
+            if block not in labels:
+                labels[block] = CodeLabel()
+            return labels[block]
+
+        # метки создаются до генерации кода, т.к. переходы могут быть и вперед, и назад
+        for i, block in enumerate(blocks):
+            next_block = blocks[i + 1] if i + 1 < len(blocks) else None
+            term = block.terminator
+            if isinstance(term, IrJump) and term.target is not next_block:
+                label(term.target)
+            elif isinstance(term, IrBranch):
+                # условие вычисляется и при совпадении блоков обеих ветвей (в нем могут быть вызовы функций)
+                if term.if_true is next_block:
+                    label(term.if_false)
+                else:
+                    label(term.if_true)
+                    if term.if_false is not next_block:
+                        label(term.if_false)
+
+        for i, block in enumerate(blocks):
+            next_block = blocks[i + 1] if i + 1 < len(blocks) else None
+            if block in labels:
+                self.add(labels[block])
+            for instr in block.instrs:
+                yield self.instr_gen(instr)
+            term = block.terminator
+            if isinstance(term, IrJump):
+                if term.target is not next_block:
+                    self.add(self.jump_cmd, labels[term.target])
+            elif isinstance(term, IrBranch):
+                if term.if_true is next_block:
+                    yield self.cond_gen(term.cond, labels[term.if_false], False)
+                else:
+                    yield self.cond_gen(term.cond, labels[term.if_true], True)
+                    if term.if_false is not next_block:
+                        self.add(self.jump_cmd, labels[term.if_false])
+            else:
+                yield self.instr_gen(term)
 
     def add(self, code: str, *params: Union[str, int, CodeLabel], label: CodeLabel = None):
         if isinstance(code, CodeLabel):
@@ -76,15 +353,54 @@ class CodeGenerator:
         if code and len(code) > 0 and code[-1] == '{':
             self.indent = self.indent + '  '
 
-    @property
-    def code(self) -> [str, ...]:
+    def peephole(self) -> None:
+        """Оконная оптимизация сгенерированного кода
+        """
+
+        if self.peephole_optimizer is not None:
+            self.code_lines = self.peephole_optimizer.optimize(self.code_lines)
+
+    def instruction_count(self) -> int:
+        if self.peephole_optimizer is None:
+            return 0
+        return sum(1 for line in self.code_lines if self.peephole_optimizer.is_instruction(line))
+
+    def number_labels(self) -> None:
+        """Нумерация меток в порядке их появления в коде (до вывода строк, т.к. переходы могут быть вперед)
+        """
+
         index = 0
         for cl in self.code_lines:
-            line = cl.code
             if cl.label:
                 cl.label.index = index
                 index += 1
-        code: List[str] = []
+
+    def lines(self) -> Iterator[str]:
+        """Строки сгенерированного кода (формируются по одной при выводе)
+        """
+
+        self.number_labels()
         for cl in self.code_lines:
-            code.append(str(cl))
-        return code
+            yield str(cl)
+
+    def write(self, out: TextIO, chunk_lines: int = WRITE_CHUNK_LINES) -> None:
+        """Потоковый вывод сгенерированного кода: строки формируются по одной и записываются порциями,
+           поэтому весь текст программы в памяти не создается
+        :param out: поток для вывода (sys.stdout, открытый текстовый файл, io.StringIO и т.п.)
+        :param chunk_lines: количество строк в одной порции записи
+        """
+
+        chunk: List[str] = []
+        for line in self.lines():
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                chunk.append('')
+                out.write('\n'.join(chunk))
+                chunk.clear()
+        if chunk:
+            chunk.append('')
+            out.write('\n'.join(chunk))
+
+    @property
+    def code(self) -> [str, ...]:
+        return list(self.lines())
@@ -0,0 +1,330 @@
+import json
+import mmap
+import struct
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from compiler_demo.semantic_base import BaseType, BinOp, ScopeType, TypeDesc, IdentDesc
+from compiler_demo.ast import AstNode, SourcePositions, EMPTY_STMT, _GroupNode, LiteralNode, IdentNode, TypeNode, \
+    BinOpNode, CallNode, TypeConvertNode, AssignNode, VarsNode, ReturnNode, IfNode, WhileNode, ForNode, ParamNode, \
+    FuncNode, StmtListNode
+
+
+# коды видов узлов (индекс в кортеже)
+KINDS = (
+    _GroupNode, LiteralNode, IdentNode, TypeNode, BinOpNode, CallNode, TypeConvertNode, AssignNode,
+    VarsNode, ReturnNode, IfNode, WhileNode, ForNode, ParamNode, FuncNode, StmtListNode
+)
+KIND_CODES = {cls: code for code, cls in enumerate(KINDS)}
+OPS = tuple(BinOp)
+OP_CODES = {op: code for code, op in enumerate(OPS)}
+
+# kind - вид узла, parent, first_child, next_sibling, end - индексы узлов (-1 - нет), узлы пронумерованы в прямом
+# порядке обхода, поэтому поддерево узла i - это узлы [i, end[i]); op - код бинарной операции, type и ident - индексы
+# в таблицах типов и идентификаторов (node_type и node_ident), str - индекс в таблице строк (имя, литерал, тип
+# для VarsNode и ParamNode), loc - смещение в исходном коде, flags - признаки (FLAG_*)
+COLUMNS = ('kind', 'parent', 'first_child', 'next_sibling', 'end', 'op', 'type', 'ident', 'str', 'loc', 'flags')
+
+FLAG_PROGRAM = 1
+FLAG_EMPTY_STMT = 2
+
+FILE_MAGIC = b'FLATAST1'
+
+Column = Union[array, memoryview, 'np.ndarray']
+
+
+class FlatAstException(Exception):
+    """Класс для исключений при построении плоского представления AST-дерева
+    """
+
+    def __init__(self, message, **kwargs) -> None:
+        self.message = message
+
+
+class FlatAst:
+    """Плоское представление AST-дерева: параллельные массивы (int32) по столбцам COLUMNS
+       и таблицы строк, типов и идентификаторов (без повторов).
+
+       Массивы поддерживают buffer protocol (numpy.frombuffer и т.п. работают без копирования),
+       после load() они отображаются из файла в память.
+    """
+
+    def __init__(self) -> None:
+        for name in COLUMNS:
+            setattr(self, name, array('i'))
+        self.strings: List[str] = []
+        self.types: List[TypeDesc] = []
+        self.idents: List[IdentDesc] = []
+        # исходные узлы (если представление построено по AST-дереву) и индекс для позиций узлов
+        self.nodes: Optional[List[AstNode]] = None
+        self.positions: Optional[SourcePositions] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def childs(self, index: int) -> List[int]:
+        result = []
+        child = self.first_child[index]
+        while child >= 0:
+            result.append(int(child))
+            child = self.next_sibling[child]
+        return result
+
+    def count(self, cls: type, index: int = 0) -> int:
+        """Кол-во узлов заданного вида в поддереве узла index
+        """
+
+        return _count(self.kind, KIND_CODES[cls], index, self.end[index] if len(self) else 0)
+
+    def find(self, cls: type, index: int = 0) -> List[int]:
+        """Индексы узлов заданного вида в поддереве узла index (кроме него самого)
+        """
+
+        return _find_all(self.kind, KIND_CODES[cls], index + 1, self.end[index] if len(self) else 0)
+
+    def find_vars_decls(self, index: int = 0) -> List[int]:
+        """Объявления переменных в поддереве (аналог ir.find_var_idents, но возвращаются индексы узлов VarsNode;
+           внутри VarsNode других объявлений быть не может, поэтому достаточно найти все VarsNode в поддереве)
+        """
+
+        return self.find(VarsNode, index)
+
+    def type_histogram(self) -> Dict[str, int]:
+        """Кол-во узлов каждого типа (по node_type)
+        """
+
+        if np is not None and isinstance(self.type, np.ndarray):
+            codes, counts = np.unique(self.type, return_counts=True)
+            histogram = zip(codes.tolist(), counts.tolist())
+        else:
+            histogram = Counter(self.type).items()
+        return {str(self.types[code]): count for code, count in histogram if code >= 0}
+
+    def save(self, path: str) -> None:
+        header = json.dumps({
+            'count': len(self),
+            'strings': self.strings,
+            'types': [_type_to_json(type_, self.types) for type_ in self.types],
+            'idents': [(ident.name, self.types.index(ident.type), ident.scope.value, ident.index, ident.built_in)
+                       for ident in self.idents],
+        }, ensure_ascii=False).encode('utf-8')
+        header += b' ' * (-(len(FILE_MAGIC) + 4 + len(header)) % 4)
+        with open(path, 'wb') as f:
+            f.write(FILE_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for name in COLUMNS:
+                column = getattr(self, name)
+                f.write(column.tobytes() if isinstance(column, array) else bytes(column))
+
+    @staticmethod
+    def load(path: str) -> 'FlatAst':
+        """Загрузка из файла (массивы не копируются, а отображаются в память)
+        """
+
+        flat = FlatAst()
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise FlatAstException('Неверный формат файла {}'.format(path))
+        header_len, = struct.unpack_from('<I', mm, len(FILE_MAGIC))
+        offset = len(FILE_MAGIC) + 4
+        header = json.loads(mm[offset:offset + header_len].decode('utf-8'))
+        offset += header_len
+
+        flat.strings = header['strings']
+        for type_json in header['types']:
+            flat.types.append(_type_from_json(type_json, flat.types))
+        for name, type_code, scope, index, built_in in header['idents']:
+            ident = IdentDesc(name, flat.types[type_code], ScopeType(scope), index)
+            ident.built_in = built_in
+            flat.idents.append(ident)
+
+        count = header['count']
+        for name in COLUMNS:
+            if np is not None:
+                column = np.frombuffer(mm, dtype=np.int32, count=count, offset=offset)
+            else:
+                column = memoryview(mm)[offset:offset + count * 4].cast('i')
+            setattr(flat, name, column)
+            offset += count * 4
+        flat._mmap = mm
+        return flat
+
+
+def _count(column: Column, value: int, start: int, end: int) -> int:
+    if np is not None and isinstance(column, np.ndarray):
+        return int(np.count_nonzero(column[start:end] == value))
+    if isinstance(column, array) and start == 0 and end == len(column):
+        return column.count(value)
+    return len(_find_all(column, value, start, end))
+
+
+def _find_all(column: Column, value: int, start: int, end: int) -> List[int]:
+    if np is not None and isinstance(column, np.ndarray):
+        return (np.flatnonzero(column[start:end] == value) + start).tolist()
+    result = []
+    if isinstance(column, array):
+        # поиск средствами array (без перебора элементов в цикле на python)
+        index = column.index
+        with_value = start
+        while True:
+            try:
+                with_value = index(value, with_value, end)
+            except ValueError:
+                return result
+            result.append(with_value)
+            with_value += 1
+    return [i for i in range(start, end) if column[i] == value]
+
+
+def _type_to_json(type_: TypeDesc, types: List[TypeDesc]) -> Union[str, list]:
+    if type_.is_simple:
+        return type_.base_type.value
+    return [types.index(type_.return_type), [types.index(param) for param in type_.params]]
+
+
+def _type_from_json(type_json: Union[str, list], types: List[TypeDesc]) -> TypeDesc:
+    if isinstance(type_json, str):
+        return TypeDesc.from_base_type(BaseType(type_json))
+    return_type, params = type_json
+    return TypeDesc.func_type(types[return_type], tuple(types[param] for param in params))
+
+
+def to_flat(root: AstNode) -> FlatAst:
+    """Построение плоского представления по AST-дереву (по AstNode.childs, без рекурсии)
+    """
+
+    flat = FlatAst()
+    flat.nodes = []
+    flat.positions = root.positions
+    columns = [getattr(flat, name) for name in COLUMNS]
+    kind, parent, first_child, next_sibling, end, op, type_, ident, str_, loc, flags = columns
+    string_codes: Dict[str, int] = {}
+    type_codes: Dict[str, int] = {}
+    ident_codes: Dict[int, int] = {}
+
+    def string_code(s: str) -> int:
+        code = string_codes.get(s)
+        if code is None:
+            code = string_codes[s] = len(flat.strings)
+            flat.strings.append(s)
+        return code
+
+    def type_code(t: Optional[TypeDesc]) -> int:
+        if t is None:
+            return -1
+        code = type_codes.get(str(t))
+        if code is None:
+            # для функций сначала добавляются типы результата и параметров
+            if t.func:
+                type_code(t.return_type)
+                for param in t.params:
+                    type_code(param)
+            code = type_codes[str(t)] = len(flat.types)
+            flat.types.append(t)
+        return code
+
+    def ident_code(i: Optional[IdentDesc]) -> int:
+        if i is None:
+            return -1
+        code = ident_codes.get(id(i))
+        if code is None:
+            code = ident_codes[id(i)] = len(flat.idents)
+            flat.idents.append(i)
+            type_code(i.type)
+        return code
+
+    last_child: Dict[int, int] = {}
+    stack = [(root, -1)]
+    while stack:
+        node, parent_index = stack.pop()
+        cls = type(node)
+        if cls not in KIND_CODES:
+            raise FlatAstException('Узел {} не поддерживается в плоском представлении'.format(cls.__name__))
+        index = len(kind)
+        flat.nodes.append(node)
+        kind.append(KIND_CODES[cls])
+        parent.append(parent_index)
+        first_child.append(-1)
+        next_sibling.append(-1)
+        end.append(index + 1)
+        op.append(OP_CODES[node.op] if cls is BinOpNode else -1)
+        type_.append(type_code(node.node_type))
+        ident.append(ident_code(node.node_ident))
+        if cls in (LiteralNode, ):
+            str_.append(string_code(node.literal))
+        elif cls in (IdentNode, TypeNode, _GroupNode):
+            str_.append(string_code(node.name))
+        elif cls in (VarsNode, ParamNode):
+            str_.append(string_code(node.type.name))
+        else:
+            str_.append(-1)
+        loc.append(node.loc if node.loc is not None else -1)
+        flags.append((FLAG_PROGRAM if cls is StmtListNode and node.program else 0) |
+                     (FLAG_EMPTY_STMT if node is EMPTY_STMT else 0))
+
+        if parent_index >= 0:
+            if first_child[parent_index] < 0:
+                first_child[parent_index] = index
+            else:
+                next_sibling[last_child[parent_index]] = index
+            last_child[parent_index] = index
+        for child in reversed(node.childs):
+            stack.append((child, index))
+
+    # потомки всегда идут после родителя, поэтому границы поддеревьев можно собрать обратным проходом
+    for index in range(len(kind) - 1, 0, -1):
+        if end[index] > end[parent[index]]:
+            end[parent[index]] = end[index]
+    return flat
+
+
+def from_flat(flat: FlatAst, index: int = 0) -> AstNode:
+    """Восстановление AST-дерева (поддерева узла index) по плоскому представлению (без рекурсии)
+    """
+
+    strings, types, idents = flat.strings, flat.types, flat.idents
+    kind, str_, type_, ident, loc, flags = flat.kind, flat.str, flat.type, flat.ident, flat.loc, flat.flags
+    nodes: Dict[int, AstNode] = {}
+    # узлы создаются в обратном порядке, т.е. к моменту создания узла все его потомки уже созданы
+    for i in range(flat.end[index] - 1, index - 1, -1):
+        cls = KINDS[kind[i]]
+        childs = [nodes.pop(child) for child in flat.childs(i)]
+        name = strings[str_[i]] if str_[i] >= 0 else None
+        if flags[i] & FLAG_EMPTY_STMT:
+            nodes[i] = EMPTY_STMT
+            continue
+        if cls is _GroupNode:
+            node = _GroupNode(name, *childs)
+        elif cls in (LiteralNode, IdentNode, TypeNode):
+            node = cls(name)
+        elif cls is BinOpNode:
+            node = BinOpNode(OPS[flat.op[i]], *childs)
+        elif cls is CallNode:
+            node = CallNode(*childs)
+        elif cls is TypeConvertNode:
+            node = TypeConvertNode(childs[0].childs[0], types[type_[i]])
+        elif cls in (VarsNode, ParamNode):
+            node = cls(TypeNode(name), *childs)
+        elif cls is FuncNode:
+            type_group, params_group, body = childs
+            node = FuncNode(TypeNode(type_group.name), type_group.childs[0], tuple(params_group.childs), body)
+        else:
+            node = cls(*childs)
+        if cls is StmtListNode:
+            node.program = bool(flags[i] & FLAG_PROGRAM)
+        node.node_type = types[type_[i]] if type_[i] >= 0 else None
+        node.node_ident = idents[ident[i]] if ident[i] >= 0 else None
+        if loc[i] >= 0:
+            node.loc = int(loc[i])
+            node.positions = flat.positions
+        nodes[i] = node
+    return nodes[index]
@@ -0,0 +1,780 @@
+from abc import ABC
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from compiler_demo import visitor
+from compiler_demo.traversal import run, walk
+from compiler_demo.semantic_base import TypeDesc, IdentDesc, ScopeType
+from compiler_demo.ast import AstNode, ExprNode, LiteralNode, IdentNode, VarsNode, FuncNode, AssignNode, ReturnNode, \
+    IfNode, WhileNode, ForNode, StmtListNode
+
+
+class IrInstr(ABC):
+    """Базовый класс инструкции промежуточного представления (IR)
+
+       Операнды инструкций - проверенные выражения AST-дерева (деревья выражений сохраняются, т.к. генераторы
+       кода для стековых машин вычисляют их без временных переменных, в т.ч. логические выражения -
+       условными переходами), переменные - описания идентификаторов (IdentDesc).
+    """
+
+    __slots__ = ('node', )
+
+    def __init__(self, node: Optional[AstNode]) -> None:
+        # узел AST-дерева, из которого получена инструкция
+        self.node = node
+
+    @property
+    def exprs(self) -> Tuple[ExprNode, ...]:
+        """Выражения, вычисляемые инструкцией (в порядке вычисления)
+        """
+
+        return ()
+
+
+class IrAssign(IrInstr):
+    """Присваивание значения выражения переменной: var = val
+    """
+
+    __slots__ = ('var', 'val')
+
+    def __init__(self, var: IdentDesc, val: ExprNode, node: Optional[AstNode] = None) -> None:
+        super().__init__(node)
+        self.var = var
+        self.val = val
+
+    @property
+    def exprs(self) -> Tuple[ExprNode, ...]:
+        return (self.val, )
+
+    def __str__(self) -> str:
+        return f'{self.var.name} ='
+
+
+class IrEval(IrInstr):
+    """Вычисление выражения ради побочных эффектов (вызов функции как инструкция)
+    """
+
+    __slots__ = ('expr', )
+
+    def __init__(self, expr: ExprNode, node: Optional[AstNode] = None) -> None:
+        super().__init__(node)
+        self.expr = expr
+
+    @property
+    def exprs(self) -> Tuple[ExprNode, ...]:
+        return (self.expr, )
+
+    def __str__(self) -> str:
+        return 'eval'
+
+
+class IrTerminator(IrInstr, ABC):
+    """Базовый класс инструкции, завершающей базовый блок
+    """
+
+    __slots__ = ()
+
+    @property
+    def targets(self) -> Tuple['BasicBlock', ...]:
+        """Блоки, на которые передается управление
+        """
+
+        return ()
+
+
+class IrJump(IrTerminator):
+    """Безусловный переход
+    """
+
+    __slots__ = ('target', )
+
+    def __init__(self, target: 'BasicBlock', node: Optional[AstNode] = None) -> None:
+        super().__init__(node)
+        self.target = target
+
+    @property
+    def targets(self) -> Tuple['BasicBlock', ...]:
+        return (self.target, )
+
+    def __str__(self) -> str:
+        return f'jump B{self.target.index}'
+
+
+class IrBranch(IrTerminator):
+    """Условный переход по значению логического выражения
+    """
+
+    __slots__ = ('cond', 'if_true', 'if_false')
+
+    def __init__(self, cond: ExprNode, if_true: 'BasicBlock', if_false: 'BasicBlock',
+                 node: Optional[AstNode] = None) -> None:
+        super().__init__(node)
+        self.cond = cond
+        self.if_true = if_true
+        self.if_false = if_false
+
+    @property
+    def exprs(self) -> Tuple[ExprNode, ...]:
+        return (self.cond, )
+
+    @property
+    def targets(self) -> Tuple['BasicBlock', ...]:
+        return self.if_true, self.if_false
+
+    def __str__(self) -> str:
+        return f'branch B{self.if_true.index} B{self.if_false.index}'
+
+
+class IrReturn(IrTerminator):
+    """Возврат из функции (val = None - возврат значения по умолчанию для типа функции
+       при достижении конца тела функции)
+    """
+
+    __slots__ = ('val', 'type')
+
+    def __init__(self, val: Optional[ExprNode], type_: TypeDesc, node: Optional[AstNode] = None) -> None:
+        super().__init__(node)
+        self.val = val
+        self.type = type_
+
+    @property
+    def exprs(self) -> Tuple[ExprNode, ...]:
+        return (self.val, ) if self.val is not None else ()
+
+    def __str__(self) -> str:
+        return 'return'
+
+
+class BasicBlock:
+    """Базовый блок: последовательность инструкций без переходов, завершающаяся переходом или возвратом
+    """
+
+    __slots__ = ('index', 'instrs', 'terminator', 'preds')
+
+    def __init__(self) -> None:
+        self.index: Optional[int] = None
+        self.instrs: List[IrInstr] = []
+        self.terminator: Optional[IrTerminator] = None
+        self.preds: List['BasicBlock'] = []
+
+    @property
+    def succs(self) -> Tuple['BasicBlock', ...]:
+        return self.terminator.targets if self.terminator is not None else ()
+
+    def __str__(self) -> str:
+        return f'B{self.index}'
+
+
+class IrFunction:
+    """Функция в промежуточном представлении: граф потока управления из базовых блоков
+       (blocks - в порядке размещения в коде, первый блок - вход в функцию)
+    """
+
+    __slots__ = ('node', 'params', 'locals', 'return_type', 'blocks', 'ssa', 'liveness')
+
+    def __init__(self, node: Optional[FuncNode], params: List[IdentDesc], locals_: List[IdentDesc],
+                 return_type: TypeDesc) -> None:
+        # None - главная функция программы (глобальный код)
+        self.node = node
+        self.params = params
+        # локальные переменные в порядке объявления
+        self.locals = locals_
+        self.return_type = return_type
+        self.blocks: List[BasicBlock] = []
+        self.ssa: Optional[SsaForm] = None
+        self.liveness: Optional[Liveness] = None
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.node.name.name if self.node is not None else None
+
+    @property
+    def entry(self) -> BasicBlock:
+        return self.blocks[0]
+
+    @property
+    def tree(self) -> List[str]:
+        lines = [f'func {self.name or "<main>"}:']
+        for block in self.blocks:
+            lines.append(f'  {block}: <- {", ".join(str(pred) for pred in block.preds)}')
+            if self.ssa is not None:
+                lines.extend(f'    {phi}' for phi in self.ssa.phis.get(block, ()))
+            for instr in (*block.instrs, block.terminator):
+                lines.append(f'    {instr}')
+                lines.extend(f'      {line}' for expr in instr.exprs for line in expr.tree)
+        return lines
+
+
+class IrProgram:
+    """Программа в промежуточном представлении
+    """
+
+    __slots__ = ('globals', 'funcs', 'main')
+
+    def __init__(self, globals_: List[IdentDesc], funcs: List[IrFunction], main: IrFunction) -> None:
+        # глобальные переменные в порядке объявления
+        self.globals = globals_
+        self.funcs = funcs
+        self.main = main
+
+    @property
+    def tree(self) -> List[str]:
+        return [line for func in (*self.funcs, self.main) for line in func.tree]
+
+
+def find_var_idents(root: AstNode, scopes: Tuple[ScopeType, ...]) -> List[IdentDesc]:
+    """Переменные, объявленные в поддереве, в порядке объявления
+    :param root: корень поддерева
+    :param scopes: области видимости переменных
+    """
+
+    idents: List[IdentDesc] = []
+
+    def find(node: AstNode) -> None:
+        if isinstance(node, VarsNode):
+            for var in node.vars:
+                ident = (var.var if isinstance(var, AssignNode) else var).node_ident
+                if ident.scope in scopes:
+                    idents.append(ident)
+
+    walk(root, find)
+    return idents
+
+
+def find_escaping_globals(funcs: Iterable[FuncNode]) -> Set[IdentDesc]:
+    """Анализ "убегания" глобальных переменных: переменные, к которым обращаются функции (чтение или
+       присваивание). Остальные глобальные переменные используются только в главной функции программы
+       (глобальном коде) и могут быть ее локальными переменными вместо статических полей класса
+    :param funcs: объявления функций
+    """
+
+    escaping: Set[IdentDesc] = set()
+
+    def find(node: AstNode) -> None:
+        if isinstance(node, IdentNode) and node.node_ident is not None and \
+                node.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
+            escaping.add(node.node_ident)
+
+    for func in funcs:
+        walk(func.body, find)
+    return escaping
+
+
+class IrBuilder:
+    """Построение промежуточного представления проверенного AST-дерева
+
+       Блоки добавляются в функцию в момент начала их заполнения, поэтому порядок размещения блоков
+       соответствует порядку инструкций в исходном коде. Инструкции после return попадают в блок,
+       на который нет переходов, и удаляются вместе с другими недостижимыми блоками.
+    """
+
+    def __init__(self, promote_globals: bool = True) -> None:
+        """
+        :param promote_globals: глобальные переменные, к которым нет обращений из функций,
+                                делать локальными переменными главной функции
+        """
+
+        self.promote_globals = promote_globals
+
+    def build(self, prog: StmtListNode) -> IrProgram:
+        func_nodes = [stmt for stmt in prog.stmts if isinstance(stmt, FuncNode)]
+        globals_ = find_var_idents(prog, (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL))
+        if self.promote_globals:
+            escaping = find_escaping_globals(func_nodes)
+            for ident in globals_:
+                if ident not in escaping:
+                    ident.scope = ScopeType.LOCAL
+            globals_ = [ident for ident in globals_ if ident in escaping]
+        funcs = [self.build_func(stmt, stmt.body) for stmt in func_nodes]
+        main_stmts = StmtListNode(*(stmt for stmt in prog.stmts if not isinstance(stmt, FuncNode)))
+        main = self.build_func(None, main_stmts)
+        return IrProgram(globals_, funcs, main)
+
+    def build_func(self, node: Optional[FuncNode], body: AstNode) -> IrFunction:
+        if node is not None:
+            func = IrFunction(node, [param.node_ident for param in node.params],
+                              find_var_idents(node, (ScopeType.LOCAL, )), node.name.node_ident.type.return_type)
+        else:
+            func = IrFunction(None, [], find_var_idents(body, (ScopeType.LOCAL, )), TypeDesc.VOID)
+        self.func = func
+        self.block = BasicBlock()
+        self.place(self.block)
+        run(self.lower_node(body))
+        self.terminate(IrReturn(None, func.return_type))
+        simplify_cfg(func)
+        func.ssa = SsaForm(func)
+        func.liveness = Liveness(func)
+        return func
+
+    def place(self, block: BasicBlock) -> None:
+        """Начало заполнения блока (блок размещается после ранее заполненных)
+        """
+
+        self.func.blocks.append(block)
+        self.block = block
+
+    def terminate(self, terminator: IrTerminator) -> None:
+        # после завершения блока инструкции (до размещения следующего блока) недостижимы
+        if self.block.terminator is None:
+            self.block.terminator = terminator
+        else:
+            self.place(BasicBlock())
+            self.block.terminator = terminator
+
+    def branch(self, cond: ExprNode, if_true: BasicBlock, if_false: BasicBlock, node: AstNode) -> None:
+        # при константном условии - безусловный переход
+        if isinstance(cond, LiteralNode) and cond.node_type is TypeDesc.BOOL:
+            self.terminate(IrJump(if_true if cond.value else if_false, node))
+        else:
+            self.terminate(IrBranch(cond, if_true, if_false, node))
+
+    def add(self, instr: IrInstr) -> None:
+        if self.block.terminator is not None:
+            self.place(BasicBlock())
+        self.block.instrs.append(instr)
+
+    @visitor.on('AstNode')
+    def lower_node(self, AstNode):
+        """
+        Нужен для работы модуля visitor (инициализации диспетчера)
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def lower_node(self, node: AstNode) -> None:
+        # выражение как инструкция (вызов функции)
+        self.add(IrEval(node, node))
+
+    @visitor.when(AssignNode)
+    def lower_node(self, node: AssignNode) -> None:
+        self.add(IrAssign(node.var.node_ident, node.val, node))
+
+    @visitor.when(VarsNode)
+    def lower_node(self, node: VarsNode) -> None:
+        for var in node.vars:
+            if isinstance(var, AssignNode):
+                yield self.lower_node(var)
+
+    @visitor.when(ReturnNode)
+    def lower_node(self, node: ReturnNode) -> None:
+        self.terminate(IrReturn(node.val, self.func.return_type, node))
+
+    @visitor.when(IfNode)
+    def lower_node(self, node: IfNode) -> None:
+        then_block = BasicBlock()
+        end_block = BasicBlock()
+        else_block = BasicBlock() if node.else_stmt else end_block
+        self.branch(node.cond, then_block, else_block, node)
+        self.place(then_block)
+        yield self.lower_node(node.then_stmt)
+        self.terminate(IrJump(end_block))
+        if node.else_stmt:
+            self.place(else_block)
+            yield self.lower_node(node.else_stmt)
+            self.terminate(IrJump(end_block))
+        self.place(end_block)
+
+    @visitor.when(WhileNode)
+    def lower_node(self, node: WhileNode) -> None:
+        cond_block = BasicBlock()
+        body_block = BasicBlock()
+        end_block = BasicBlock()
+        self.terminate(IrJump(cond_block))
+        self.place(cond_block)
+        self.branch(node.cond, body_block, end_block, node)
+        self.place(body_block)
+        yield self.lower_node(node.body)
+        self.terminate(IrJump(cond_block))
+        self.place(end_block)
+
+    @visitor.when(ForNode)
+    def lower_node(self, node: ForNode) -> None:
+        yield self.lower_node(node.init)
+        cond_block = BasicBlock()
+        body_block = BasicBlock()
+        end_block = BasicBlock()
+        self.terminate(IrJump(cond_block))
+        self.place(cond_block)
+        # отсутствующее условие (EMPTY_STMT) - бесконечный цикл
+        if isinstance(node.cond, StmtListNode):
+            self.terminate(IrJump(body_block, node))
+        else:
+            self.branch(node.cond, body_block, end_block, node)
+        self.place(body_block)
+        yield self.lower_node(node.body)
+        yield self.lower_node(node.step)
+        self.terminate(IrJump(cond_block))
+        self.place(end_block)
+
+    @visitor.when(FuncNode)
+    def lower_node(self, node: FuncNode) -> None:
+        pass
+
+    @visitor.when(StmtListNode)
+    def lower_node(self, node: StmtListNode) -> None:
+        for stmt in node.stmts:
+            yield self.lower_node(stmt)
+
+
+def simplify_cfg(func: IrFunction) -> None:
+    """Упрощение графа потока управления (общее для всех генераторов кода): переходы на пустые блоки
+       из одного безусловного перехода заменяются переходами на их цель, недостижимые блоки удаляются
+    """
+
+    def final_target(block: BasicBlock) -> BasicBlock:
+        visited = set()
+        while not block.instrs and isinstance(block.terminator, IrJump) and block not in visited \
+                and block is not func.entry:
+            visited.add(block)
+            block = block.terminator.target
+        return block
+
+    for block in func.blocks:
+        term = block.terminator
+        if isinstance(term, IrJump):
+            term.target = final_target(term.target)
+        elif isinstance(term, IrBranch):
+            term.if_true = final_target(term.if_true)
+            term.if_false = final_target(term.if_false)
+
+    reachable = {func.entry}
+    stack = [func.entry]
+    while stack:
+        for succ in stack.pop().succs:
+            if succ not in reachable:
+                reachable.add(succ)
+                stack.append(succ)
+    func.blocks = [block for block in func.blocks if block in reachable]
+    for index, block in enumerate(func.blocks):
+        block.index = index
+        block.preds = []
+    for block in func.blocks:
+        for succ in block.succs:
+            if block not in succ.preds:
+                succ.preds.append(block)
+
+
+class SsaValue:
+    """Значение переменной в SSA-форме (версия переменной)
+    """
+
+    __slots__ = ('var', 'version', 'block', 'instr')
+
+    def __init__(self, var: IdentDesc, version: int, block: BasicBlock, instr: Optional[IrInstr]) -> None:
+        self.var = var
+        self.version = version
+        # блок и инструкция (IrAssign или Phi), определяющие значение; для версии 0 (значение при входе
+        # в функцию: аргумент или неинициализированная переменная) - входной блок и None
+        self.block = block
+        self.instr = instr
+
+    def __str__(self) -> str:
+        return f'{self.var.name}.{self.version}'
+
+
+class Phi:
+    """phi-функция: значение переменной в начале блока, зависящее от блока, из которого передано управление
+    """
+
+    __slots__ = ('value', 'args')
+
+    def __init__(self, value: SsaValue) -> None:
+        self.value = value
+        self.args: Dict[BasicBlock, SsaValue] = {}
+
+    def __str__(self) -> str:
+        args = ', '.join(f'{block}: {value}' for block, value in self.args.items())
+        return f'{self.value} = phi({args})'
+
+
+class SsaForm:
+    """SSA-форма функции для переменных, хранящихся в слотах (параметры и локальные переменные):
+       каждому присваиванию (IrAssign) и каждому использованию переменной (IdentNode в выражениях инструкций)
+       сопоставляется версия переменной, в начале блоков, где сходятся разные версии, - phi-функции.
+
+       Инструкции IR при этом не изменяются (версии хранятся отдельно), поэтому выход из SSA-формы
+       тривиален: все версии переменной используют ее слот. Построение - по фронтам доминирования
+       (Cytron et al.) с деревом доминаторов, вычисленным алгоритмом Cooper, Harvey, Kennedy.
+    """
+
+    def __init__(self, func: IrFunction) -> None:
+        self.func = func
+        self.vars: List[IdentDesc] = [*func.params, *func.locals]
+        self.values: List[SsaValue] = []
+        self.phis: Dict[BasicBlock, List[Phi]] = {}
+        self.defs: Dict[IrAssign, SsaValue] = {}
+        self.uses: Dict[IdentNode, SsaValue] = {}
+        self.idom: Dict[BasicBlock, BasicBlock] = {}
+        self._maybe_uninitialized: Optional[List[IdentDesc]] = None
+        self.build_dominators()
+        self.insert_phis()
+        self.rename()
+
+    def build_dominators(self) -> None:
+        entry = self.func.entry
+        # обратный постпорядок обхода в глубину
+        order: List[BasicBlock] = []
+        visited = {entry}
+        stack = [(entry, iter(entry.succs))]
+        while stack:
+            block, succs = stack[-1]
+            succ = next(succs, None)
+            if succ is None:
+                stack.pop()
+                order.append(block)
+            elif succ not in visited:
+                visited.add(succ)
+                stack.append((succ, iter(succ.succs)))
+        order.reverse()
+        number = {block: i for i, block in enumerate(order)}
+
+        def intersect(a: BasicBlock, b: BasicBlock) -> BasicBlock:
+            while a is not b:
+                while number[a] > number[b]:
+                    a = self.idom[a]
+                while number[b] > number[a]:
+                    b = self.idom[b]
+            return a
+
+        self.idom = {entry: entry}
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                new_idom = None
+                for pred in block.preds:
+                    if pred in self.idom:
+                        new_idom = pred if new_idom is None else intersect(pred, new_idom)
+                if self.idom.get(block) is not new_idom:
+                    self.idom[block] = new_idom
+                    changed = True
+
+        self.frontiers: Dict[BasicBlock, Set[BasicBlock]] = {block: set() for block in order}
+        for block in order:
+            if len(block.preds) > 1:
+                for pred in block.preds:
+                    runner = pred
+                    while runner is not self.idom[block]:
+                        self.frontiers[runner].add(block)
+                        runner = self.idom[runner]
+
+    def insert_phis(self) -> None:
+        var_set = set(self.vars)
+        def_blocks: Dict[IdentDesc, List[BasicBlock]] = {var: [self.func.entry] for var in self.vars}
+        for block in self.func.blocks:
+            for instr in block.instrs:
+                if isinstance(instr, IrAssign) and instr.var in var_set:
+                    def_blocks[instr.var].append(block)
+        for var in self.vars:
+            has_phi: Set[BasicBlock] = set()
+            work = list(def_blocks[var])
+            queued = set(work)
+            while work:
+                for frontier in self.frontiers[work.pop()]:
+                    if frontier not in has_phi:
+                        has_phi.add(frontier)
+                        self.phis.setdefault(frontier, []).append(Phi(SsaValue(var, 0, frontier, None)))
+                        if frontier not in queued:
+                            queued.add(frontier)
+                            work.append(frontier)
+
+    def new_value(self, var: IdentDesc, block: BasicBlock, instr: Optional[IrInstr]) -> SsaValue:
+        value = SsaValue(var, self.versions[var], block, instr)
+        self.versions[var] += 1
+        self.values.append(value)
+        return value
+
+    def rename(self) -> None:
+        self.versions: Dict[IdentDesc, int] = {var: 0 for var in self.vars}
+        entry = self.func.entry
+        current: Dict[IdentDesc, List[SsaValue]] = {var: [self.new_value(var, entry, None)] for var in self.vars}
+        children: Dict[BasicBlock, List[BasicBlock]] = {}
+        for block, idom in self.idom.items():
+            if block is not entry:
+                children.setdefault(idom, []).append(block)
+
+        def record_uses(instr: IrInstr) -> None:
+            def use(node: AstNode) -> None:
+                if isinstance(node, IdentNode) and node.node_ident in current:
+                    self.uses[node] = current[node.node_ident][-1]
+
+            for expr in instr.exprs:
+                walk(expr, use)
+
+        # обход дерева доминаторов: (блок, определенные в блоке переменные - None до обработки блока)
+        stack: List[Tuple[BasicBlock, Optional[List[IdentDesc]]]] = [(entry, None)]
+        while stack:
+            block, defined = stack.pop()
+            if defined is not None:
+                for var in defined:
+                    current[var].pop()
+                continue
+            defined = []
+            for phi in self.phis.get(block, ()):
+                var = phi.value.var
+                phi.value = self.new_value(var, block, phi)
+                current[var].append(phi.value)
+                defined.append(var)
+            for instr in block.instrs:
+                record_uses(instr)
+                if isinstance(instr, IrAssign) and instr.var in current:
+                    value = self.new_value(instr.var, block, instr)
+                    self.defs[instr] = value
+                    current[instr.var].append(value)
+                    defined.append(instr.var)
+            record_uses(block.terminator)
+            for succ in block.succs:
+                for phi in self.phis.get(succ, ()):
+                    phi.args[block] = current[phi.value.var][-1]
+            stack.append((block, defined))
+            stack.extend((child, None) for child in reversed(children.get(block, ())))
+
+    def dominates(self, a: BasicBlock, b: BasicBlock) -> bool:
+        while b is not a:
+            if self.idom[b] is b:
+                return False
+            b = self.idom[b]
+        return True
+
+    def maybe_uninitialized(self) -> List[IdentDesc]:
+        """Локальные переменные, которые могут использоваться до присваивания значения
+        """
+
+        if self._maybe_uninitialized is None:
+            self._maybe_uninitialized = self.find_maybe_uninitialized()
+        return self._maybe_uninitialized
+
+    def find_maybe_uninitialized(self) -> List[IdentDesc]:
+        undefined = set(value for value in self.values if value.instr is None and value.var.scope == ScopeType.LOCAL)
+        phis = [phi for block_phis in self.phis.values() for phi in block_phis]
+        changed = True
+        while changed:
+            changed = False
+            for phi in phis:
+                if phi.value not in undefined and any(arg in undefined for arg in phi.args.values()):
+                    undefined.add(phi.value)
+                    changed = True
+        used = set(value.var for value in self.uses.values() if value in undefined)
+        return [var for var in self.func.locals if var in used]
+
+
+def var_uses(instr: IrInstr, vars_: Set[IdentDesc]) -> Set[IdentDesc]:
+    """Переменные из vars_, значения которых использует инструкция
+    """
+
+    uses: Set[IdentDesc] = set()
+
+    def use(node: AstNode) -> None:
+        if isinstance(node, IdentNode) and node.node_ident in vars_:
+            uses.add(node.node_ident)
+
+    for expr in instr.exprs:
+        walk(expr, use)
+    return uses
+
+
+def loop_depths(func: IrFunction) -> Dict[BasicBlock, int]:
+    """Глубина вложенности циклов для блоков функции (естественные циклы по обратным дугам графа
+       потока управления: переход на блок, доминирующий над текущим)
+    """
+
+    depths = {block: 0 for block in func.blocks}
+    for block in func.blocks:
+        for header in block.succs:
+            if func.ssa.dominates(header, block):
+                # тело цикла - блоки, из которых достижима обратная дуга без прохода через заголовок
+                body = {header, block}
+                stack = [block]
+                while stack:
+                    for pred in stack.pop().preds:
+                        if pred not in body:
+                            body.add(pred)
+                            stack.append(pred)
+                for body_block in body:
+                    depths[body_block] += 1
+    return depths
+
+
+class Liveness:
+    """Анализ живых переменных (слотов: параметров и локальных переменных) на графе потока управления
+
+       Результаты: live_in/live_out - переменные, живые в начале и в конце блоков, interference - граф
+       интерференции (переменные, значения которых нужны одновременно, не могут занимать один слот),
+       weights - "частота" использования переменных (обращения с весом 10 ** глубина вложенности циклов).
+    """
+
+    # ограничение глубины вложенности циклов при вычислении весов переменных
+    MAX_LOOP_DEPTH = 6
+
+    def __init__(self, func: IrFunction) -> None:
+        self.func = func
+        self.vars: List[IdentDesc] = [*func.params, *func.locals]
+        var_set = set(self.vars)
+        self.live_in: Dict[BasicBlock, Set[IdentDesc]] = {}
+        self.live_out: Dict[BasicBlock, Set[IdentDesc]] = {}
+        self.interference: Dict[IdentDesc, Set[IdentDesc]] = {var: set() for var in self.vars}
+        self.weights: Dict[IdentDesc, int] = {}
+
+        # переменные, используемые в блоке до присваивания, и переменные, которым в блоке присваивается значение
+        block_uses: Dict[BasicBlock, Set[IdentDesc]] = {}
+        block_defs: Dict[BasicBlock, Set[IdentDesc]] = {}
+        for block in func.blocks:
+            uses = block_uses[block] = set()
+            defs = block_defs[block] = set()
+            for instr in (*block.instrs, block.terminator):
+                uses.update(var_uses(instr, var_set) - defs)
+                if isinstance(instr, IrAssign) and instr.var in var_set:
+                    defs.add(instr.var)
+            self.live_in[block] = set()
+            self.live_out[block] = set()
+
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(func.blocks):
+                live_out = set()
+                for succ in block.succs:
+                    live_out |= self.live_in[succ]
+                live_in = block_uses[block] | (live_out - block_defs[block])
+                if live_in != self.live_in[block] or live_out != self.live_out[block]:
+                    self.live_in[block] = live_in
+                    self.live_out[block] = live_out
+                    changed = True
+
+        depths = loop_depths(func)
+        for block in func.blocks:
+            weight = 10 ** min(depths[block], self.MAX_LOOP_DEPTH)
+            live = set(self.live_out[block])
+            for instr in reversed((*block.instrs, block.terminator)):
+                if isinstance(instr, IrAssign) and instr.var in var_set:
+                    # присваивание портит слот, поэтому переменная интерферирует со всеми живыми в этой точке
+                    # (даже если само присвоенное значение не используется)
+                    self.add_interference(instr.var, live)
+                    live.discard(instr.var)
+                    self.weights[instr.var] = self.weights.get(instr.var, 0) + weight
+                uses = var_uses(instr, var_set)
+                for var in uses:
+                    self.weights[var] = self.weights.get(var, 0) + weight
+                live |= uses
+
+        # при входе в функцию значения получают все параметры и переменные, живые в начале функции
+        # (неинициализированные переменные - значения по умолчанию)
+        entry_live = [*func.params, *(var for var in func.locals if var in self.live_in[func.entry])]
+        for var in entry_live:
+            self.add_interference(var, entry_live)
+
+    def add_interference(self, var: IdentDesc, others: Iterable[IdentDesc]) -> None:
+        for other in others:
+            if other is not var:
+                self.interference[var].add(other)
+                self.interference[other].add(var)
+
+
+def build_ir(prog: StmtListNode, promote_globals: bool = True) -> IrProgram:
+    """Построение промежуточного представления программы
+    :param prog: корень проверенного (и оптимизированного) AST-дерева
+    :param promote_globals: глобальные переменные, к которым нет обращений из функций,
+                            делать локальными переменными главной функции
+    :return: программа в промежуточном представлении
+    """
+
+    return IrBuilder(promote_globals).build(prog)
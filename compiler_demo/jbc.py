@@ -1,11 +1,15 @@
+import re
+from collections import Counter
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from compiler_demo import visitor
-from compiler_demo.ast import LiteralNode, AssignNode, StmtListNode, FuncNode, IdentNode, ReturnNode, VarsNode, \
-    BinOpNode, TypeConvertNode, CallNode, IfNode, WhileNode, ForNode
-from compiler_demo.code_gen_base import CodeLabel, CodeGenerator, find_vars_decls, DEFAULT_TYPE_VALUES
-from compiler_demo.semantic_base import BaseType, ScopeType, BinOp, TypeDesc
+from compiler_demo.ast import AstNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, CallNode
+from compiler_demo.ir import IrInstr, IrAssign, IrEval, IrReturn, IrFunction, IrProgram
+from compiler_demo.traversal import run
+from compiler_demo.code_gen_base import CodeLabel, CodeLine, CodeGenerator, PeepholeOptimizer, \
+    concat_operands, allocate_slots, DEFAULT_TYPE_VALUES
+from compiler_demo.semantic_base import BaseType, ScopeType, BinOp, TypeDesc, IdentDesc
 
 
 RUNTIME_CLASS_NAME = 'CompilerDemo.Runtime'
@@ -30,6 +34,8 @@ JBC_TYPE_PREFIXES = {
     BaseType.BOOL: 'i',
     BaseType.STR: 'a'
 }
+# типы, значения которых добавляются в StringBuilder без преобразования в строку
+JBC_APPEND_TYPES = (BaseType.INT, BaseType.FLOAT, BaseType.BOOL)
 JBC_COMPARE_SUFFIXES = {
     BinOp.GT: 'gt',
     BinOp.LT: 'lt',
@@ -41,20 +47,122 @@ JBC_COMPARE_SUFFIXES = {
 
 
 class JbcException(Exception):
-    """Класс для исключений во время генерации Java Byte Code
-       (на всякий случай, пока не используется)
+    """Класс для исключений во время генерации Java Byte Code,
+       а также записи class-файла и jar-файла (см. class_file)
     """
 
     def __init__(self, message, **kwargs: Any) -> None:
         self.message = message
 
 
+# условный переход -> переход по противоположному условию
+JBC_INVERTED_JUMPS = {
+    f'{prefix}{cond}': f'{prefix}{inverted}'
+    for prefix in ('if', 'if_icmp')
+    for cond, inverted in (('eq', 'ne'), ('ne', 'eq'), ('lt', 'ge'), ('ge', 'lt'), ('gt', 'le'), ('le', 'gt'))
+}
+JBC_INVERTED_JUMPS.update({
+    'if_acmpeq': 'if_acmpne',
+    'if_acmpne': 'if_acmpeq',
+})
+JBC_INT_CONST_RE = re.compile(r'-?\d+$')
+JBC_LOAD_STORE_RE = re.compile(r'[ida](load|store)$')
+
+
+class JbcPeepholeOptimizer(PeepholeOptimizer):
+    """Оконная оптимизация Java Byte Code: короткие формы инструкций, замена вычисления логического значения
+       сравнения с последующей проверкой (ifeq/ifne) одним условным переходом, удаление переходов на следующую инструкцию
+    """
+
+    jumps = ('goto', )
+    cond_jumps = {
+        jump: ('pop2', ) if jump.startswith('if_') else ('pop', )
+        for jump in JBC_INVERTED_JUMPS
+    }
+
+    def is_instruction(self, line: CodeLine) -> bool:
+        return bool(line.code) and line.code[0] not in '{}' and not line.code.startswith(('public ', 'version '))
+
+    def passes(self):
+        return (self.collapse_bool_branches, ) + super().passes()
+
+    def collapse_bool_branches(self, code_lines: List[CodeLine]) -> Tuple[List[CodeLine], bool]:
+        """Замена "ромба" вычисления логического значения (логические выражения в JbcCodeGenerator.jbc_gen),
+           за которым следует проверка этого значения, одним условным переходом:
+               if_icmpXX T; iconst_0; goto E; T: iconst_1; E: ifeq L  ->  if_icmpYY L
+        """
+
+        refs = Counter(id(param) for line in code_lines for param in line.params if isinstance(param, CodeLabel))
+        result: List[CodeLine] = []
+        changed = False
+        i = 0
+        while i < len(code_lines):
+            jump = self.bool_branch_jump(code_lines[i:i + 7], refs)
+            if jump is None:
+                result.append(code_lines[i])
+                i += 1
+                continue
+            result.append(CodeLine(jump, code_lines[i + 6].params[0], label=code_lines[i].label,
+                                   indent=code_lines[i].indent))
+            changed = True
+            i += 7
+        return result, changed
+
+    @staticmethod
+    def bool_branch_jump(lines: Sequence[CodeLine], refs: Counter) -> Optional[str]:
+        """Проверка последовательности инструкций на "ромб" с последующей проверкой значения
+        :return: условный переход, которым можно заменить последовательность, или None
+        """
+
+        if len(lines) < 7:
+            return None
+        jump, not_taken, goto, true_label, taken, end_label, test = lines
+        if not (jump.code in JBC_INVERTED_JUMPS and jump.params and goto.code == 'goto' and goto.params and
+                test.code in ('ifeq', 'ifne') and test.params):
+            return None
+        if not (true_label.label is not None and true_label.code is None and jump.params[0] is true_label.label and
+                end_label.label is not None and end_label.code is None and goto.params[0] is end_label.label):
+            return None
+        if any(line.label for line in (not_taken, goto, taken, test)) or \
+                refs[id(true_label.label)] != 1 or refs[id(end_label.label)] != 1:
+            return None
+        if {not_taken.code, taken.code} != {'iconst_0', 'iconst_1'}:
+            return None
+        # test срабатывает на значение, получаемое при переходе jump, - сохраняем условие, иначе - инвертируем
+        if (taken.code == 'iconst_0') == (test.code == 'ifeq'):
+            return jump.code
+        return JBC_INVERTED_JUMPS[jump.code]
+
+    def rewrite(self, window: Sequence[CodeLine]) -> Optional[Tuple[int, Sequence[Tuple]]]:
+        last = window[-1]
+
+        if last.code == 'ldc' and len(last.params) == 1 and JBC_INT_CONST_RE.match(str(last.params[0])):
+            value = int(last.params[0])
+            if -1 <= value <= 5:
+                return 1, ((f'iconst_{value}' if value >= 0 else 'iconst_m1', ), )
+            if -128 <= value <= 127:
+                return 1, (('bipush', value), )
+            if -32768 <= value <= 32767:
+                return 1, (('sipush', value), )
+        if last.code == 'ldc2_w' and len(last.params) == 1:
+            value = str(last.params[0]).rstrip('D')
+            if not value.startswith('-') and float(value) in (0.0, 1.0):
+                return 1, ((f'dconst_{int(float(value))}', ), )
+        if last.code and JBC_LOAD_STORE_RE.match(last.code) and len(last.params) == 1 and int(last.params[0]) <= 3:
+            return 1, ((f'{last.code}_{last.params[0]}', ), )
+        return None
+
+
 class JbcCodeGenerator(CodeGenerator):
     """Класс для генерации Java Byte Code
     """
 
-    def __init__(self, file_name: str):
-        super().__init__()
+    peephole_optimizer = JbcPeepholeOptimizer()
+    jump_cmd = 'goto'
+    null_cmd = 'aconst_null'
+
+    def __init__(self, file_name: str, **kwargs: Any):
+        super().__init__(**kwargs)
         self.file_name = file_name
 
     @property
@@ -104,47 +212,85 @@ class JbcCodeGenerator(CodeGenerator):
         elif node.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
             self.add(f'getstatic {self.class_name}#{JBC_TYPE_NAMES[base_type]} _gv{node.node_ident.index}')
 
-    @visitor.when(AssignNode)
-    def jbc_gen(self, node: AssignNode) -> None:
-        node.val.jbc_gen(self)
-        var = node.var
-        base_type = var.node_ident.type.base_type
-        if var.node_ident.scope in [ScopeType.LOCAL, ScopeType.PARAM]:
-            self.add(f'{JBC_TYPE_PREFIXES[base_type]}store', var.node_ident.jbc_offset)
-        elif var.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
-            self.add(f'putstatic {self.class_name}#{JBC_TYPE_NAMES[base_type]} _gv{var.node_ident.index}')
-
-    @visitor.when(VarsNode)
-    def jbc_gen(self, node: VarsNode) -> None:
-        for var in node.vars:
-            if isinstance(var, AssignNode):
-                var.jbc_gen(self)
-
-    def bool_val_gen(self, cmd: str) -> None:
-        true_label = CodeLabel()
-        end_label = CodeLabel()
-        self.add(cmd, true_label)
-        self.add(f'iconst_0')
-        self.add('goto', end_label)
-        self.add(true_label)
-        self.add(f'iconst_1')
-        self.add(end_label)
+    @visitor.on('node')
+    def jbc_cond_gen(self, node: AstNode, label: CodeLabel, jump_if: bool) -> None:
+        """Генерация условного перехода по значению логического выражения (без вычисления значения на стеке)
+        :param node: логическое выражение
+        :param label: метка перехода
+        :param jump_if: значение выражения, при котором выполняется переход (иначе управление переходит дальше)
+        """
+
+    @visitor.when(AstNode)
+    def jbc_cond_gen(self, node: AstNode, label: CodeLabel, jump_if: bool) -> None:
+        yield node.jbc_gen(self)
+        self.add('ifne' if jump_if else 'ifeq', label)
+
+    @visitor.when(LiteralNode)
+    def jbc_cond_gen(self, node: LiteralNode, label: CodeLabel, jump_if: bool) -> None:
+        if bool(node.value) == jump_if:
+            self.add('goto', label)
+
+    @visitor.when(TypeConvertNode)
+    def jbc_cond_gen(self, node: TypeConvertNode, label: CodeLabel, jump_if: bool) -> None:
+        # int как условие: переход по ненулевому значению (без преобразования в boolean)
+        if node.node_type.base_type == BaseType.BOOL and node.expr.node_type.base_type == BaseType.INT:
+            yield node.expr.jbc_gen(self)
+        else:
+            yield node.jbc_gen(self)
+        self.add('ifne' if jump_if else 'ifeq', label)
 
     @visitor.when(BinOpNode)
-    def jbc_gen(self, node: BinOpNode) -> None:
-        node.arg1.jbc_gen(self)
-        node.arg2.jbc_gen(self)
-        if node.op in [BinOp.EQUALS, BinOp.NEQUALS, BinOp.GT, BinOp.LT, BinOp.GE, BinOp.LE]:
-            if node.arg1.node_type == TypeDesc.STR:
+    def jbc_cond_gen(self, node: BinOpNode, label: CodeLabel, jump_if: bool) -> None:
+        if node.op in (BinOp.LOGICAL_AND, BinOp.LOGICAL_OR):
+            # a && b: переход по false - если любой из операндов false, по true - если оба true (для || наоборот)
+            if jump_if == (node.op == BinOp.LOGICAL_OR):
+                yield self.jbc_cond_gen(node.arg1, label, jump_if)
+                yield self.jbc_cond_gen(node.arg2, label, jump_if)
+            else:
+                skip_label = CodeLabel()
+                yield self.jbc_cond_gen(node.arg1, skip_label, not jump_if)
+                yield self.jbc_cond_gen(node.arg2, label, jump_if)
+                self.add(skip_label)
+        elif node.op in JBC_COMPARE_SUFFIXES:
+            yield node.arg1.jbc_gen(self)
+            yield node.arg2.jbc_gen(self)
+            if node.arg1.node_type is TypeDesc.STR:
                 self.add('invokevirtual java.lang.String#int compareTo(java.lang.String)')
-                self.bool_val_gen(f'if{JBC_COMPARE_SUFFIXES[node.op]}')
-            elif node.arg1.node_type == TypeDesc.FLOAT:
-                self.add('dcmpg')
-                self.bool_val_gen(f'if{JBC_COMPARE_SUFFIXES[node.op]}')
+                jump = 'if'
+            elif node.arg1.node_type is TypeDesc.FLOAT:
+                # при NaN dcmpl дает -1, dcmpg - 1, т.е. > и >= (< и <=) с NaN ложны
+                self.add('dcmpl' if node.op in (BinOp.GT, BinOp.GE) else 'dcmpg')
+                jump = 'if'
             else:
-                self.bool_val_gen(f'if_icmp{JBC_COMPARE_SUFFIXES[node.op]}')
-        elif node.op == BinOp.ADD:
-            if node.arg1.node_type == TypeDesc.STR:
+                jump = 'if_icmp'
+            jump += JBC_COMPARE_SUFFIXES[node.op]
+            self.add(jump if jump_if else JBC_INVERTED_JUMPS[jump], label)
+        else:
+            yield node.jbc_gen(self)
+            self.add('ifne' if jump_if else 'ifeq', label)
+
+    @visitor.when(BinOpNode)
+    def jbc_gen(self, node: BinOpNode) -> None:
+        if node.op in (BinOp.LOGICAL_AND, BinOp.LOGICAL_OR) or node.op in JBC_COMPARE_SUFFIXES:
+            # логическое значение вычисляется через условные переходы (логические операции - по короткой схеме)
+            true_label = CodeLabel()
+            end_label = CodeLabel()
+            yield self.jbc_cond_gen(node, true_label, True)
+            self.add(f'iconst_0')
+            self.add('goto', end_label)
+            self.add(true_label)
+            self.add(f'iconst_1')
+            self.add(end_label)
+            return
+        if node.op == BinOp.ADD and node.node_type is TypeDesc.STR:
+            operands = concat_operands(node)
+            if len(operands) > 2:
+                yield self.concat_gen(operands)
+                return
+        yield node.arg1.jbc_gen(self)
+        yield node.arg2.jbc_gen(self)
+        if node.op == BinOp.ADD:
+            if node.arg1.node_type is TypeDesc.STR:
                 self.add(f'invokestatic {RUNTIME_CLASS_NAME}#{JBC_TYPE_NAMES[BaseType.STR]} concat({JBC_TYPE_NAMES[BaseType.STR]}, {JBC_TYPE_NAMES[BaseType.STR]})')
             else:
                 self.add(f'{JBC_TYPE_PREFIXES[node.arg1.node_type.base_type]}add')
@@ -156,10 +302,6 @@ class JbcCodeGenerator(CodeGenerator):
             self.add(f'{JBC_TYPE_PREFIXES[node.arg1.node_type.base_type]}div')
         elif node.op == BinOp.MOD:
             self.add(f'{JBC_TYPE_PREFIXES[node.arg1.node_type.base_type]}rem')
-        elif node.op == BinOp.LOGICAL_AND:
-            self.add('iand')
-        elif node.op == BinOp.LOGICAL_OR:
-            self.add('ior')
         elif node.op == BinOp.BIT_AND:
             self.add('iand')
         elif node.op == BinOp.BIT_OR:
@@ -167,9 +309,26 @@ class JbcCodeGenerator(CodeGenerator):
         else:
             pass
 
+    def concat_gen(self, operands: Sequence[AstNode]) -> None:
+        """Конкатенация строк через один StringBuilder (без промежуточных строк),
+           значения int, double и boolean добавляются без преобразования через Runtime.convert
+        :param operands: операнды цепочки конкатенаций
+        """
+
+        builder = 'java.lang.StringBuilder'
+        self.add(f'new {builder}')
+        self.add('dup')
+        self.add(f'invokespecial {builder}#void <init>()')
+        for operand in operands:
+            if isinstance(operand, TypeConvertNode) and operand.expr.node_type.base_type in JBC_APPEND_TYPES:
+                operand = operand.expr
+            yield operand.jbc_gen(self)
+            self.add(f'invokevirtual {builder}#{builder} append({JBC_TYPE_NAMES[operand.node_type.base_type]})')
+        self.add(f'invokevirtual {builder}#{JBC_TYPE_NAMES[BaseType.STR]} toString()')
+
     @visitor.when(TypeConvertNode)
     def jbc_gen(self, node: TypeConvertNode) -> None:
-        node.expr.jbc_gen(self)
+        yield node.expr.jbc_gen(self)
         # часто встречаемые варианты будет реализовывать в коде, а не через класс Runtime
         if node.node_type.base_type == BaseType.FLOAT and node.expr.node_type.base_type == BaseType.INT:
             self.add('i2d')
@@ -189,114 +348,101 @@ class JbcCodeGenerator(CodeGenerator):
     @visitor.when(CallNode)
     def jbc_gen(self, node: CallNode) -> None:
         for param in node.params:
-            param.jbc_gen(self)
+            yield param.jbc_gen(self)
         class_name = RUNTIME_CLASS_NAME if node.func.node_ident.built_in else self.class_name
         param_types = ', '.join(JBC_TYPE_NAMES[param.node_type.base_type] for param in node.params)
         cmd = f'invokestatic {class_name}#{JBC_TYPE_NAMES[node.node_type.base_type]} {node.func.name}({param_types})'
         self.add(cmd)
 
-    @visitor.when(ReturnNode)
-    def jbc_gen(self, node: ReturnNode) -> None:
-        node.val.jbc_gen(self)
-        self.add(f'{JBC_TYPE_PREFIXES[node.val.node_type.base_type]}return')
-
-    @visitor.when(IfNode)
-    def jbc_gen(self, node: IfNode) -> None:
-        else_label = CodeLabel()
-        end_label = CodeLabel()
-        node.cond.jbc_gen(self)
-        self.add('ifeq', else_label)
-        node.then_stmt.jbc_gen(self)
-        self.add('goto', end_label)
-        self.add(else_label)
-        if node.else_stmt:
-            node.else_stmt.jbc_gen(self)
-        self.add(end_label)
-
-    @visitor.when(WhileNode)
-    def jbc_gen(self, node: WhileNode) -> None:
-        start_label = CodeLabel()
-        end_label = CodeLabel()
-        self.add(start_label)
-        node.cond.jbc_gen(self)
-        end_label = CodeLabel()
-        self.add('ifeq', end_label)
-        node.body.jbc_gen(self)
-        self.add('goto', start_label)
-        self.add(end_label)
-
-    @visitor.when(ForNode)
-    def jbc_gen(self, node: ForNode) -> None:
-        start_label = CodeLabel()
-        end_label = CodeLabel()
-        node.init.jbc_gen(self)
-        self.add(start_label)
-        node.cond.jbc_gen(self)
-        self.add('ifeq', end_label)
-        node.body.jbc_gen(self)
-        node.step.jbc_gen(self)
-        self.add('goto', start_label)
-        self.add(end_label)
-
-    @visitor.when(FuncNode)
-    def jbc_gen(self, func: FuncNode) -> None:
-        var_offset = 0
-        params = ''
-        for p in func.params:
-            p.node_ident.jbc_offset = var_offset
-            var_offset += JBC_TYPE_SIZES[p.type.type.base_type]
-            if len(params) > 0:
-                params += ', '
-            params += f'{JBC_TYPE_NAMES[p.type.type.base_type]} {str(p.name.name)}'
-        self.add(f'public static {JBC_TYPE_NAMES[func.type.type.base_type]} {func.name}({params})')
-        self.add('{')
-
-        local_vars_decls = find_vars_decls(func)
-        for node in local_vars_decls:
-            for var in node.vars:
-                if isinstance(var, AssignNode):
-                    var = var.var
-                if var.node_ident.scope in (ScopeType.LOCAL, ):
-                    var.node_ident.jbc_offset = var_offset
-                    var_offset += JBC_TYPE_SIZES[var.node_type.base_type]
-
-        func.body.jbc_gen(self)
+    def tail_call_gen(self, node: CallNode) -> None:
+        """Хвостовой рекурсивный вызов: присваивание аргументов параметрам и переход в начало функции
+        """
 
-        # при необходимости добавим return
-        if not (isinstance(func.body, ReturnNode) or
-                len(func.body.childs) > 0 and isinstance(func.body.childs[-1], ReturnNode)):
-            if func.type.type.base_type != BaseType.VOID:
-                self.push_const(func.type.type.base_type, DEFAULT_TYPE_VALUES[func.type.type.base_type])
-            self.add(f'{JBC_TYPE_PREFIXES[func.type.type.base_type]}return')
+        for param in node.params:
+            yield param.jbc_gen(self)
+        for param in reversed(self.func.params):
+            self.store_gen(param)
+        # локальные переменные, значения которых могут использоваться до присваивания,
+        # получают те же значения, что и при вызове
+        for var in self.func.ssa.maybe_uninitialized():
+            self.init_var_gen(var)
+        self.add('goto', self.tail_call_label)
+
+    def store_gen(self, var: IdentDesc) -> None:
+        base_type = var.type.base_type
+        if var.scope in [ScopeType.LOCAL, ScopeType.PARAM]:
+            self.add(f'{JBC_TYPE_PREFIXES[base_type]}store', var.jbc_offset)
+        elif var.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
+            self.add(f'putstatic {self.class_name}#{JBC_TYPE_NAMES[base_type]} _gv{var.index}')
+
+    def instr_gen(self, instr: IrInstr) -> None:
+        return self.jbc_gen(instr)
+
+    def cond_gen(self, node: AstNode, label: CodeLabel, jump_if: bool) -> None:
+        return self.jbc_cond_gen(node, label, jump_if)
+
+    @visitor.when(IrAssign)
+    def jbc_gen(self, instr: IrAssign) -> None:
+        yield instr.val.jbc_gen(self)
+        self.store_gen(instr.var)
+
+    @visitor.when(IrEval)
+    def jbc_gen(self, instr: IrEval) -> None:
+        yield instr.expr.jbc_gen(self)
+
+    @visitor.when(IrReturn)
+    def jbc_gen(self, instr: IrReturn) -> None:
+        if instr.val is None:
+            # конец тела функции: возврат значения по умолчанию
+            if instr.type.base_type != BaseType.VOID:
+                self.push_const(instr.type.base_type, DEFAULT_TYPE_VALUES[instr.type.base_type])
+        elif self.is_tail_call_jump(instr):
+            yield self.tail_call_gen(instr.val)
+            return
+        else:
+            yield instr.val.jbc_gen(self)
+        self.add(f'{JBC_TYPE_PREFIXES[instr.type.base_type]}return')
+
+    def func_gen(self, func: IrFunction) -> None:
+        if func.node is not None:
+            first_slot = 0
+            params = ', '.join(f'{JBC_TYPE_NAMES[param.type.base_type]} {param.name}' for param in func.params)
+            self.add(f'public static {JBC_TYPE_NAMES[func.return_type.base_type]} {func.name}({params})')
+        else:
+            # слот 0 главной функции - массив аргументов командной строки
+            first_slot = 1
+            self.add('public static void main(java.lang.String[])')
+        self.add('{')
 
+        params_slots: Dict[IdentDesc, int] = {}
+        var_offset = first_slot
+        for param in func.params:
+            params_slots[param] = var_offset
+            var_offset += JBC_TYPE_SIZES[param.type.base_type]
+        # слоты локальных переменных назначаются по времени жизни переменных: переменные, значения которых
+        # не нужны одновременно, используют один слот (в т.ч. слот параметра, который больше не используется)
+        slots = allocate_slots(func.liveness, func.locals, params_slots, first_slot,
+                               lambda var: JBC_TYPE_SIZES[var.type.base_type])
+        for var, slot in slots.items():
+            var.jbc_offset = slot
+
+        # верификатор JVM не допускает чтения переменной, которой не на всех путях присвоено значение
+        # (в отличие от .locals init в MSIL), поэтому такие переменные инициализируются в начале функции
+        # теми же значениями, что и статические поля (строки - null)
+        for var in func.ssa.maybe_uninitialized():
+            self.init_var_gen(var)
+
+        self.start_func(func)
+        yield self.blocks_gen(func)
+        self.end_func()
         self.add('}')
 
-    @visitor.when(StmtListNode)
-    def jbc_gen(self, node: StmtListNode) -> None:
-        for stmt in node.stmts:
-            stmt.jbc_gen(self)
-
-    def gen_program(self, prog: StmtListNode):
+    def gen_program(self, prog: IrProgram):
         self.start()
-        global_vars_decls = find_vars_decls(prog)
-        for node in global_vars_decls:
-            for var in node.vars:
-                if isinstance(var, AssignNode):
-                    var = var.var
-                if var.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
-                    self.add(f'public static {JBC_TYPE_NAMES[var.node_type.base_type]} _gv{var.node_ident.index};')
-        for stmt in prog.stmts:
-            if isinstance(stmt, FuncNode):
-                self.jbc_gen(stmt)
+        for var in prog.globals:
+            self.add(f'public static {JBC_TYPE_NAMES[var.type.base_type]} _gv{var.index};')
+        for func in prog.funcs:
+            run(self.func_gen(func))
         self.add('')
-        self.add('public static void main(java.lang.String[])')
-        self.add('{')
-        for stmt in prog.childs:
-            if not isinstance(stmt, FuncNode):
-                self.jbc_gen(stmt)
-
-        # т.к. "глобальный" код будет функцией, обязательно надо добавить ret
-        self.add('return')
-
-        self.add('}')
+        run(self.func_gen(prog.main))
         self.end()
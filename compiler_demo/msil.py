@@ -1,10 +1,12 @@
-from typing import List, Union, Any
+from typing import Dict, List, Union, Any, Optional, Sequence, Tuple
 
 from compiler_demo import visitor
-from compiler_demo.semantic_base import BaseType, TypeDesc, ScopeType, BinOp
-from compiler_demo.ast import AstNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, CallNode, \
-    VarsNode, FuncNode, AssignNode, ReturnNode, IfNode, ForNode, StmtListNode, WhileNode
-from compiler_demo.code_gen_base import CodeLabel, CodeLine, CodeGenerator, find_vars_decls, DEFAULT_TYPE_VALUES
+from compiler_demo.semantic_base import BaseType, TypeDesc, ScopeType, BinOp, IdentDesc
+from compiler_demo.ast import AstNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, CallNode
+from compiler_demo.ir import IrInstr, IrAssign, IrEval, IrReturn, IrFunction, IrProgram
+from compiler_demo.traversal import run
+from compiler_demo.code_gen_base import CodeLabel, CodeLine, CodeGenerator, PeepholeOptimizer, \
+    concat_operands, allocate_slots, DEFAULT_TYPE_VALUES
 
 RUNTIME_CLASS_NAME = 'CompilerDemo.Runtime'
 PROGRAM_CLASS_NAME = 'Program'
@@ -27,10 +29,114 @@ class MsilException(Exception):
         self.message = message
 
 
+# сравнение + условный переход -> переход по сравнению (только варианты, совпадающие и для int, и для float с NaN)
+MSIL_COMPARE_JUMPS = {
+    ('ceq', 'brtrue'): 'beq',
+    ('ceq', 'brfalse'): 'bne.un',
+    ('cgt', 'brtrue'): 'bgt',
+    ('clt', 'brtrue'): 'blt',
+}
+# максимальное кол-во строк, для которого есть перегрузка String.Concat (для большего используется массив)
+MSIL_CONCAT_MAX_PARAMS = 4
+# сравнение -> (переход, если сравнение истинно; переход, если сравнение ложно) для int и bool
+MSIL_COMPARE_BRANCHES = {
+    BinOp.EQUALS: ('beq', 'bne.un'),
+    BinOp.NEQUALS: ('bne.un', 'beq'),
+    BinOp.GT: ('bgt', 'ble'),
+    BinOp.LT: ('blt', 'bge'),
+    BinOp.GE: ('bge', 'blt'),
+    BinOp.LE: ('ble', 'bgt'),
+}
+# для float переход по ложному сравнению должен выполняться и для несравнимых значений (NaN)
+MSIL_FLOAT_INVERTED_BRANCHES = {
+    'ble': 'ble.un',
+    'bge': 'bge.un',
+    'blt': 'blt.un',
+    'bgt': 'bgt.un',
+}
+MSIL_INVERTED_JUMPS = {
+    'brtrue': 'brfalse',
+    'brfalse': 'brtrue',
+}
+
+
+class MsilPeepholeOptimizer(PeepholeOptimizer):
+    """Оконная оптимизация MSIL: короткие формы инструкций, инвертирование и слияние условных переходов,
+       удаление переходов на следующую инструкцию
+    """
+
+    jumps = ('br', )
+    cond_jumps = {
+        'brtrue': ('pop', ),
+        'brfalse': ('pop', ),
+        'beq': ('pop', 'pop'),
+        'bne.un': ('pop', 'pop'),
+        'bgt': ('pop', 'pop'),
+        'blt': ('pop', 'pop'),
+        'bge': ('pop', 'pop'),
+        'ble': ('pop', 'pop'),
+        'bgt.un': ('pop', 'pop'),
+        'blt.un': ('pop', 'pop'),
+        'bge.un': ('pop', 'pop'),
+        'ble.un': ('pop', 'pop'),
+    }
+
+    def is_instruction(self, line: CodeLine) -> bool:
+        return bool(line.code) and line.code[0] not in '.{}'
+
+    def rewrite(self, window: Sequence[CodeLine]) -> Optional[Tuple[int, Sequence[Tuple]]]:
+        ops = tuple(line.code for line in window)
+        last = window[-1]
+
+        if last.code == 'ldc.i4' and len(last.params) == 1:
+            value = int(last.params[0])
+            if value == -1:
+                return 1, (('ldc.i4.m1', ), )
+            if 0 <= value <= 8:
+                return 1, ((f'ldc.i4.{value}', ), )
+            if -128 <= value <= 127:
+                return 1, (('ldc.i4.s', value), )
+        if last.code in ('ldloc', 'stloc', 'ldarg', 'starg') and len(last.params) == 1:
+            index = int(last.params[0])
+            if index <= 3 and last.code != 'starg':
+                return 1, ((f'{last.code}.{index}', ), )
+            if index <= 255:
+                return 1, ((f'{last.code}.s', index), )
+
+        # x == 0 (логическое "не") + условный переход -> обратный условный переход
+        if ops[-3:-1] == ('ldc.i4.0', 'ceq') and ops[-1] in MSIL_INVERTED_JUMPS:
+            return 3, ((MSIL_INVERTED_JUMPS[ops[-1]], *last.params), )
+        # x != 0 (x > 0 без знака) + условный переход -> тот же условный переход
+        if ops[-3:-1] == ('ldc.i4.0', 'cgt.un') and ops[-1] in MSIL_INVERTED_JUMPS:
+            return 3, ((ops[-1], *last.params), )
+        if ops[-2:] in MSIL_COMPARE_JUMPS:
+            return 2, ((MSIL_COMPARE_JUMPS[ops[-2:]], *last.params), )
+        # двойное логическое "не" (преобразование int в bool) -> x != 0
+        if ops[-4:] == ('ldc.i4.0', 'ceq', 'ldc.i4.0', 'ceq'):
+            return 4, (('ldc.i4.0', ), ('cgt.un', ))
+        return None
+
+
 class MsilCodeGenerator(CodeGenerator):
     """Класс для генерации MSIL-кода
     """
 
+    peephole_optimizer = MsilPeepholeOptimizer()
+    jump_cmd = 'br'
+    null_cmd = 'ldnull'
+
+    def __init__(self, tail_prefix: bool = False, **kwargs: Any):
+        """
+        :param tail_prefix: добавлять префикс tail. к вызовам пользовательских функций в return
+                            (кадр стека вызывающей функции освобождается до вызова)
+        """
+
+        super().__init__(**kwargs)
+        self.tail_prefix = tail_prefix
+        # слоты .locals локальных переменных генерируемой функции (номера переменных из семантического анализа
+        # не изменяются, т.к. промежуточное представление используется и другими генераторами)
+        self.local_slots: Dict[IdentDesc, int] = {}
+
     def start(self) -> None:
         self.add('.assembly program')
         self.add('{')
@@ -67,61 +173,58 @@ class MsilCodeGenerator(CodeGenerator):
     @visitor.when(IdentNode)
     def msil_gen(self, node: IdentNode) -> None:
         if node.node_ident.scope == ScopeType.LOCAL:
-            self.add('ldloc', node.node_ident.index)
+            self.add('ldloc', self.local_slots[node.node_ident])
         elif node.node_ident.scope == ScopeType.PARAM:
             self.add('ldarg', node.node_ident.index)
         elif node.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
             self.add(f'ldsfld {MSIL_TYPE_NAMES[node.node_ident.type.base_type]} {PROGRAM_CLASS_NAME}::_gv{node.node_ident.index}')
 
-    @visitor.when(AssignNode)
-    def msil_gen(self, node: AssignNode) -> None:
-        node.val.msil_gen(self)
-        var = node.var
-        if var.node_ident.scope == ScopeType.LOCAL:
-            self.add('stloc', var.node_ident.index)
-        elif var.node_ident.scope == ScopeType.PARAM:
-            self.add('starg', var.node_ident.index)
-        elif var.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
-            self.add(f'stsfld {MSIL_TYPE_NAMES[var.node_ident.type.base_type]} Program::_gv{var.node_ident.index}')
-
-    @visitor.when(VarsNode)
-    def msil_gen(self, node: VarsNode) -> None:
-        for var in node.vars:
-            if isinstance(var, AssignNode):
-                var.msil_gen(self)
-
     @visitor.when(BinOpNode)
     def msil_gen(self, node: BinOpNode) -> None:
-        node.arg1.msil_gen(self)
-        node.arg2.msil_gen(self)
+        if node.op in (BinOp.LOGICAL_AND, BinOp.LOGICAL_OR):
+            # логические операции вычисляются по короткой схеме
+            false_label = CodeLabel()
+            end_label = CodeLabel()
+            yield self.msil_cond_gen(node, false_label, False)
+            self.add('ldc.i4.1')
+            self.add('br', end_label)
+            self.add(false_label)
+            self.add('ldc.i4.0')
+            self.add(end_label)
+            return
+        if node.op == BinOp.ADD and node.node_type is TypeDesc.STR:
+            yield self.concat_gen(concat_operands(node))
+            return
+        yield node.arg1.msil_gen(self)
+        yield node.arg2.msil_gen(self)
         if node.op == BinOp.NEQUALS:
-            if node.arg1.node_type == TypeDesc.STR:
+            if node.arg1.node_type is TypeDesc.STR:
                 self.add('call bool [mscorlib]System.String::op_Inequality(string, string)')
             else:
                 self.add('ceq')
                 self.add('ldc.i4.0')
                 self.add('ceq')
         if node.op == BinOp.EQUALS:
-            if node.arg1.node_type == TypeDesc.STR:
+            if node.arg1.node_type is TypeDesc.STR:
                 self.add('call bool [mscorlib]System.String::op_Equality(string, string)')
             else:
                 self.add('ceq')
         elif node.op == BinOp.GT:
-            if node.arg1.node_type == TypeDesc.STR:
+            if node.arg1.node_type is TypeDesc.STR:
                 self.add(f'call {MSIL_TYPE_NAMES[BaseType.INT]} class {RUNTIME_CLASS_NAME}::compare({MSIL_TYPE_NAMES[BaseType.STR]}, {MSIL_TYPE_NAMES[BaseType.STR]})')
                 self.add('ldc.i4.0')
                 self.add('cgt')
             else:
                 self.add('cgt')
         elif node.op == BinOp.LT:
-            if node.arg1.node_type == TypeDesc.STR:
+            if node.arg1.node_type is TypeDesc.STR:
                 self.add(f'call {MSIL_TYPE_NAMES[BaseType.INT]} class {RUNTIME_CLASS_NAME}::compare({MSIL_TYPE_NAMES[BaseType.STR]}, {MSIL_TYPE_NAMES[BaseType.STR]})')
                 self.add('ldc.i4.0')
                 self.add('clt')
             else:
                 self.add('clt')
         elif node.op == BinOp.GE:
-            if node.arg1.node_type == TypeDesc.STR:
+            if node.arg1.node_type is TypeDesc.STR:
                 self.add(f'call {MSIL_TYPE_NAMES[BaseType.INT]} class {RUNTIME_CLASS_NAME}::compare({MSIL_TYPE_NAMES[BaseType.STR]}, {MSIL_TYPE_NAMES[BaseType.STR]})')
                 self.add('ldc.i4', '-1')
                 self.add('cgt')
@@ -130,7 +233,7 @@ class MsilCodeGenerator(CodeGenerator):
                 self.add('ldc.i4.0')
                 self.add('ceq')
         elif node.op == BinOp.LE:
-            if node.arg1.node_type == TypeDesc.STR:
+            if node.arg1.node_type is TypeDesc.STR:
                 self.add(f'call {MSIL_TYPE_NAMES[BaseType.INT]} class {RUNTIME_CLASS_NAME}::compare({MSIL_TYPE_NAMES[BaseType.STR]}, {MSIL_TYPE_NAMES[BaseType.STR]})')
                 self.add('ldc.i4.1')
                 self.add('clt')
@@ -139,10 +242,7 @@ class MsilCodeGenerator(CodeGenerator):
                 self.add('ldc.i4.0')
                 self.add('ceq')
         elif node.op == BinOp.ADD:
-            if node.arg1.node_type == TypeDesc.STR:
-                self.add(f'call {MSIL_TYPE_NAMES[BaseType.STR]} class {RUNTIME_CLASS_NAME}::concat({MSIL_TYPE_NAMES[BaseType.STR]}, {MSIL_TYPE_NAMES[BaseType.STR]})')
-            else:
-                self.add('add')
+            self.add('add')
         elif node.op == BinOp.SUB:
             self.add('sub')
         elif node.op == BinOp.MUL:
@@ -151,10 +251,6 @@ class MsilCodeGenerator(CodeGenerator):
             self.add('div')
         elif node.op == BinOp.MOD:
             self.add('rem')
-        elif node.op == BinOp.LOGICAL_AND:
-            self.add('and')
-        elif node.op == BinOp.LOGICAL_OR:
-            self.add('or')
         elif node.op == BinOp.BIT_AND:
             self.add('and')
         elif node.op == BinOp.BIT_OR:
@@ -162,9 +258,88 @@ class MsilCodeGenerator(CodeGenerator):
         else:
             pass
 
+    @visitor.on('node')
+    def msil_cond_gen(self, node: AstNode, label: CodeLabel, jump_if: bool) -> None:
+        """Генерация условного перехода по значению логического выражения (без вычисления значения на стеке)
+        :param node: логическое выражение
+        :param label: метка перехода
+        :param jump_if: значение выражения, при котором выполняется переход (иначе управление переходит дальше)
+        """
+
+    @visitor.when(AstNode)
+    def msil_cond_gen(self, node: AstNode, label: CodeLabel, jump_if: bool) -> None:
+        yield node.msil_gen(self)
+        self.add('brtrue' if jump_if else 'brfalse', label)
+
+    @visitor.when(LiteralNode)
+    def msil_cond_gen(self, node: LiteralNode, label: CodeLabel, jump_if: bool) -> None:
+        if bool(node.value) == jump_if:
+            self.add('br', label)
+
+    @visitor.when(TypeConvertNode)
+    def msil_cond_gen(self, node: TypeConvertNode, label: CodeLabel, jump_if: bool) -> None:
+        # int как условие: переход по ненулевому значению (без преобразования в bool)
+        if node.node_type.base_type == BaseType.BOOL and node.expr.node_type.base_type == BaseType.INT:
+            yield node.expr.msil_gen(self)
+        else:
+            yield node.msil_gen(self)
+        self.add('brtrue' if jump_if else 'brfalse', label)
+
+    @visitor.when(BinOpNode)
+    def msil_cond_gen(self, node: BinOpNode, label: CodeLabel, jump_if: bool) -> None:
+        if node.op in (BinOp.LOGICAL_AND, BinOp.LOGICAL_OR):
+            # a && b: переход по false - если любой из операндов false, по true - если оба true (для || наоборот)
+            if jump_if == (node.op == BinOp.LOGICAL_OR):
+                yield self.msil_cond_gen(node.arg1, label, jump_if)
+                yield self.msil_cond_gen(node.arg2, label, jump_if)
+            else:
+                skip_label = CodeLabel()
+                yield self.msil_cond_gen(node.arg1, skip_label, not jump_if)
+                yield self.msil_cond_gen(node.arg2, label, jump_if)
+                self.add(skip_label)
+        elif node.op in MSIL_COMPARE_BRANCHES:
+            yield node.arg1.msil_gen(self)
+            yield node.arg2.msil_gen(self)
+            if node.arg1.node_type is TypeDesc.STR:
+                if node.op in (BinOp.EQUALS, BinOp.NEQUALS):
+                    self.add('call bool [mscorlib]System.String::op_Equality(string, string)')
+                    self.add('brtrue' if jump_if == (node.op == BinOp.EQUALS) else 'brfalse', label)
+                    return
+                # строки сравниваются через compare(a, b) <op> 0
+                self.add(f'call {MSIL_TYPE_NAMES[BaseType.INT]} class {RUNTIME_CLASS_NAME}::compare({MSIL_TYPE_NAMES[BaseType.STR]}, {MSIL_TYPE_NAMES[BaseType.STR]})')
+                self.add('ldc.i4.0')
+            branch, inverted_branch = MSIL_COMPARE_BRANCHES[node.op]
+            if not jump_if and node.arg1.node_type is TypeDesc.FLOAT:
+                # отрицание сравнения чисел с плавающей точкой истинно и при NaN (unordered)
+                inverted_branch = MSIL_FLOAT_INVERTED_BRANCHES.get(inverted_branch, inverted_branch)
+            self.add(branch if jump_if else inverted_branch, label)
+        else:
+            yield node.msil_gen(self)
+            self.add('brtrue' if jump_if else 'brfalse', label)
+
+    def concat_gen(self, operands: Sequence[AstNode]) -> None:
+        """Конкатенация строк одним вызовом String.Concat (без промежуточных строк)
+        :param operands: операнды цепочки конкатенаций
+        """
+
+        if len(operands) <= MSIL_CONCAT_MAX_PARAMS:
+            for operand in operands:
+                yield operand.msil_gen(self)
+            params = ', '.join([MSIL_TYPE_NAMES[BaseType.STR]] * len(operands))
+            self.add(f'call {MSIL_TYPE_NAMES[BaseType.STR]} [mscorlib]System.String::Concat({params})')
+            return
+        self.add('ldc.i4', len(operands))
+        self.add('newarr [mscorlib]System.String')
+        for i, operand in enumerate(operands):
+            self.add('dup')
+            self.add('ldc.i4', i)
+            yield operand.msil_gen(self)
+            self.add('stelem.ref')
+        self.add(f'call {MSIL_TYPE_NAMES[BaseType.STR]} [mscorlib]System.String::Concat({MSIL_TYPE_NAMES[BaseType.STR]}[])')
+
     @visitor.when(TypeConvertNode)
     def msil_gen(self, node: TypeConvertNode) -> None:
-        node.expr.msil_gen(self)
+        yield node.expr.msil_gen(self)
         # часто встречаемые варианты будет реализовывать в коде, а не через класс Runtime
         if node.node_type.base_type == BaseType.FLOAT and node.expr.node_type.base_type == BaseType.INT:
             self.add('conv.r8')
@@ -177,124 +352,104 @@ class MsilCodeGenerator(CodeGenerator):
             cmd = f'call {MSIL_TYPE_NAMES[node.node_type.base_type]} class {RUNTIME_CLASS_NAME}::convert({MSIL_TYPE_NAMES[node.expr.node_type.base_type]})'
             self.add(cmd)
 
-    @visitor.when(CallNode)
-    def msil_gen(self, node: CallNode) -> None:
-        for param in node.params:
-            param.msil_gen(self)
+    @staticmethod
+    def call_cmd(node: CallNode) -> str:
         class_name = RUNTIME_CLASS_NAME if node.func.node_ident.built_in else PROGRAM_CLASS_NAME
         param_types = ', '.join(MSIL_TYPE_NAMES[param.node_type.base_type] for param in node.params)
-        cmd = f'call {MSIL_TYPE_NAMES[node.node_type.base_type]} class {class_name}::{node.func.name}({param_types})'
-        self.add(cmd)
+        return f'call {MSIL_TYPE_NAMES[node.node_type.base_type]} class {class_name}::{node.func.name}({param_types})'
 
-    @visitor.when(ReturnNode)
-    def msil_gen(self, node: ReturnNode) -> None:
-        node.val.msil_gen(self)
-        self.add('ret')
+    @visitor.when(CallNode)
+    def msil_gen(self, node: CallNode) -> None:
+        for param in node.params:
+            yield param.msil_gen(self)
+        self.add(self.call_cmd(node))
 
-    @visitor.when(IfNode)
-    def msil_gen(self, node: IfNode) -> None:
-        else_label = CodeLabel()
-        end_label = CodeLabel()
-        node.cond.msil_gen(self)
-        self.add('brfalse', else_label)
-        node.then_stmt.msil_gen(self)
-        self.add('br', end_label)
-        self.add(else_label)
-        if node.else_stmt:
-            node.else_stmt.msil_gen(self)
-        self.add(end_label)
-
-
-
-    @visitor.when(WhileNode)
-    def msil_gen(self, node: WhileNode) -> None:
-        start_label = CodeLabel()
-        end_label = CodeLabel()
-        self.add(start_label)
-        node.cond.msil_gen(self)
-        end_label = CodeLabel()
-        self.add('brfalse', end_label)
-        node.body.msil_gen(self)
-        self.add('br', start_label)
-        self.add(end_label)
-
-    @visitor.when(ForNode)
-    def msil_gen(self, node: ForNode) -> None:
-        start_label = CodeLabel()
-        end_label = CodeLabel()
-        node.init.msil_gen(self)
-        self.add(start_label)
-        node.cond.msil_gen(self)
-        self.add('brfalse', end_label)
-        node.body.msil_gen(self)
-        node.step.msil_gen(self)
-        self.add('br', start_label)
-        self.add(end_label)
-
-    @visitor.when(FuncNode)
-    def msil_gen(self, func: FuncNode) -> None:
-        params = ''
-        for p in func.params:
-            if len(params) > 0:
-                params += ', '
-            params += f'{MSIL_TYPE_NAMES[p.type.type.base_type]} {str(p.name.name)}'
-        self.add(f'.method public static {MSIL_TYPE_NAMES[func.type.type.base_type]} {func.name}({params}) cil managed')
-        self.add('{')
+    def tail_call_gen(self, node: CallNode) -> None:
+        """Хвостовой рекурсивный вызов: присваивание аргументов параметрам и переход в начало функции
+        """
 
-        local_vars_decls = find_vars_decls(func)
-        decl = '.locals init ('
-        count = 0
-        for node in local_vars_decls:
-            for var in node.vars:
-                if isinstance(var, AssignNode):
-                    var = var.var
-                if var.node_ident.scope in (ScopeType.LOCAL, ):
-                    if count > 0:
-                        decl += ', '
-                    decl += f'{MSIL_TYPE_NAMES[var.node_type.base_type]} _v{var.node_ident.index}'
-                    count += 1
-        decl += ')'
-        if count > 0:
-            self.add(decl)
-
-        func.body.msil_gen(self)
-
-        # при необходимости добавим ret
-        if not (isinstance(func.body, ReturnNode) or
-                len(func.body.childs) > 0 and isinstance(func.body.childs[-1], ReturnNode)):
-            if func.type.type.base_type != BaseType.VOID:
-                self.push_const(func.type.type.base_type, DEFAULT_TYPE_VALUES[func.type.type.base_type])
-            self.add('ret')
+        for param in node.params:
+            yield param.msil_gen(self)
+        for param in reversed(self.func.params):
+            self.store_gen(param)
+        # локальные переменные, значения которых могут использоваться до присваивания,
+        # получают те же значения, что и при вызове
+        for var in self.func.ssa.maybe_uninitialized():
+            self.init_var_gen(var)
+        self.add('br', self.tail_call_label)
+
+    def store_gen(self, var: IdentDesc) -> None:
+        if var.scope == ScopeType.LOCAL:
+            self.add('stloc', self.local_slots[var])
+        elif var.scope == ScopeType.PARAM:
+            self.add('starg', var.index)
+        elif var.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
+            self.add(f'stsfld {MSIL_TYPE_NAMES[var.type.base_type]} {PROGRAM_CLASS_NAME}::_gv{var.index}')
+
+    def instr_gen(self, instr: IrInstr) -> None:
+        return self.msil_gen(instr)
+
+    def cond_gen(self, node: AstNode, label: CodeLabel, jump_if: bool) -> None:
+        return self.msil_cond_gen(node, label, jump_if)
+
+    @visitor.when(IrAssign)
+    def msil_gen(self, instr: IrAssign) -> None:
+        yield instr.val.msil_gen(self)
+        self.store_gen(instr.var)
+
+    @visitor.when(IrEval)
+    def msil_gen(self, instr: IrEval) -> None:
+        yield instr.expr.msil_gen(self)
+
+    @visitor.when(IrReturn)
+    def msil_gen(self, instr: IrReturn) -> None:
+        if instr.val is None:
+            # конец тела функции: возврат значения по умолчанию
+            if instr.type.base_type != BaseType.VOID:
+                self.push_const(instr.type.base_type, DEFAULT_TYPE_VALUES[instr.type.base_type])
+        elif self.is_tail_call_jump(instr):
+            yield self.tail_call_gen(instr.val)
+            return
+        elif self.tail_prefix and isinstance(instr.val, CallNode) and not instr.val.func.node_ident.built_in:
+            for param in instr.val.params:
+                yield param.msil_gen(self)
+            self.add('tail.')
+            self.add(self.call_cmd(instr.val))
+        else:
+            yield instr.val.msil_gen(self)
+        self.add('ret')
 
+    def func_gen(self, func: IrFunction) -> None:
+        if func.node is not None:
+            params = ', '.join(f'{MSIL_TYPE_NAMES[param.type.base_type]} {param.name}' for param in func.params)
+            self.add(f'.method public static {MSIL_TYPE_NAMES[func.return_type.base_type]} {func.name}({params}) cil managed')
+            self.add('{')
+        else:
+            self.add('.method public static void Main()')
+            self.add('{')
+            self.add('.entrypoint')
+
+        # слоты .locals назначаются по времени жизни переменных (переменные одного типа, значения которых
+        # не нужны одновременно, используют один слот)
+        self.local_slots = allocate_slots(func.liveness, func.locals, typed=True)
+        slot_types: Dict[int, TypeDesc] = {}
+        for var, slot in self.local_slots.items():
+            slot_types[slot] = var.type
+        if slot_types:
+            decl = ', '.join(f'{MSIL_TYPE_NAMES[slot_types[slot].base_type]} _v{slot}' for slot in range(len(slot_types)))
+            self.add(f'.locals init ({decl})')
+
+        self.start_func(func)
+        yield self.blocks_gen(func)
+        self.end_func()
         self.add('}')
 
-    @visitor.when(StmtListNode)
-    def msil_gen(self, node: StmtListNode) -> None:
-        for stmt in node.stmts:
-            stmt.msil_gen(self)
-
-    def gen_program(self, prog: StmtListNode):
+    def gen_program(self, prog: IrProgram):
         self.start()
-        global_vars_decls = find_vars_decls(prog)
-        for node in global_vars_decls:
-            for var in node.vars:
-                if isinstance(var, AssignNode):
-                    var = var.var
-                if var.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
-                    self.add(f'.field public static {MSIL_TYPE_NAMES[var.node_type.base_type]} _gv{var.node_ident.index}')
-        for stmt in prog.stmts:
-            if isinstance(stmt, FuncNode):
-                self.msil_gen(stmt)
+        for var in prog.globals:
+            self.add(f'.field public static {MSIL_TYPE_NAMES[var.type.base_type]} _gv{var.index}')
+        for func in prog.funcs:
+            run(self.func_gen(func))
         self.add('')
-        self.add('.method public static void Main()')
-        self.add('{')
-        self.add('.entrypoint')
-        for stmt in prog.childs:
-            if not isinstance(stmt, FuncNode):
-                self.msil_gen(stmt)
-
-        # т.к. "глобальный" код будет функцией, обязательно надо добавить ret
-        self.add('ret')
-
-        self.add('}')
+        run(self.func_gen(prog.main))
         self.end()
@@ -0,0 +1,1323 @@
+import copy
+import json
+import math
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from compiler_demo import visitor
+from compiler_demo.traversal import run, walk
+from compiler_demo.semantic_base import BaseType, BinOp, TypeDesc, IdentDesc, ScopeType
+from compiler_demo.ast import AstNode, LiteralNode, IdentNode, BinOpNode, TypeConvertNode, CallNode, \
+    ParamNode, StmtNode, VarsNode, FuncNode, AssignNode, ReturnNode, IfNode, WhileNode, ForNode, StmtListNode, \
+    TypeNode, EMPTY_STMT, always_returns, is_self_call
+from compiler_demo.semantic_checker import BUILT_IN_FUNCTIONS_PURITY
+from compiler_demo.code_gen_base import DEFAULT_TYPE_VALUES
+
+
+INT_MIN = -0x80000000
+INT_MAX = 0x7FFFFFFF
+
+
+def wrap_int(value: int) -> int:
+    """Приведение целого числа к 32-битному со знаком (переполнение как в MSIL и JVM)
+    """
+
+    value &= 0xFFFFFFFF
+    return value - 0x100000000 if value > INT_MAX else value
+
+
+def _int_div(a: int, b: int) -> Optional[int]:
+    # деление с отбрасыванием дробной части (к нулю), как div в MSIL и idiv в JVM;
+    # деление на 0 и INT_MIN / -1 (в MSIL - исключение, в JVM - INT_MIN) не вычисляются
+    if b == 0 or a == INT_MIN and b == -1:
+        return None
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def _int_rem(a: int, b: int) -> Optional[int]:
+    # знак остатка совпадает со знаком делимого, как rem в MSIL и irem в JVM
+    if b == 0 or a == INT_MIN and b == -1:
+        return None
+    r = abs(a) % abs(b)
+    return r if a >= 0 else -r
+
+
+def _float_div(a: float, b: float) -> Optional[float]:
+    return a / b if b != 0 else None
+
+
+def _float_rem(a: float, b: float) -> Optional[float]:
+    return math.fmod(a, b) if b != 0 else None
+
+
+# функции вычисления бинарных операций над константами (по базовому типу операндов после приведения типов);
+# None в качестве результата - операция не вычисляется на этапе компиляции
+CONST_BIN_OPS: Dict[Tuple[BinOp, BaseType], Callable[[Any, Any], Any]] = {
+    (BinOp.ADD, BaseType.INT): lambda a, b: wrap_int(a + b),
+    (BinOp.SUB, BaseType.INT): lambda a, b: wrap_int(a - b),
+    (BinOp.MUL, BaseType.INT): lambda a, b: wrap_int(a * b),
+    (BinOp.DIV, BaseType.INT): _int_div,
+    (BinOp.MOD, BaseType.INT): _int_rem,
+    (BinOp.BIT_AND, BaseType.INT): lambda a, b: a & b,
+    (BinOp.BIT_OR, BaseType.INT): lambda a, b: a | b,
+
+    (BinOp.ADD, BaseType.FLOAT): lambda a, b: a + b,
+    (BinOp.SUB, BaseType.FLOAT): lambda a, b: a - b,
+    (BinOp.MUL, BaseType.FLOAT): lambda a, b: a * b,
+    (BinOp.DIV, BaseType.FLOAT): _float_div,
+    (BinOp.MOD, BaseType.FLOAT): _float_rem,
+
+    (BinOp.LOGICAL_AND, BaseType.BOOL): lambda a, b: a and b,
+    (BinOp.LOGICAL_OR, BaseType.BOOL): lambda a, b: a or b,
+
+    (BinOp.ADD, BaseType.STR): lambda a, b: a + b,
+}
+for base_type in (BaseType.INT, BaseType.FLOAT):
+    CONST_BIN_OPS.update({
+        (BinOp.GT, base_type): lambda a, b: a > b,
+        (BinOp.LT, base_type): lambda a, b: a < b,
+        (BinOp.GE, base_type): lambda a, b: a >= b,
+        (BinOp.LE, base_type): lambda a, b: a <= b,
+    })
+# сравнение строк на больше/меньше не вычисляется: в .NET оно зависит от культуры, в JVM - нет
+for base_type in (BaseType.INT, BaseType.FLOAT, BaseType.BOOL, BaseType.STR):
+    CONST_BIN_OPS.update({
+        (BinOp.EQUALS, base_type): lambda a, b: a == b,
+        (BinOp.NEQUALS, base_type): lambda a, b: a != b,
+    })
+
+# функции вычисления преобразований типов констант (тип значения, требуемый тип);
+# преобразования float и bool в строку не вычисляются, т.к. результат в .NET и JVM различается (1 и 1.0, True и true)
+CONST_TYPE_CONVERTS: Dict[Tuple[BaseType, BaseType], Callable[[Any], Any]] = {
+    (BaseType.INT, BaseType.FLOAT): float,
+    (BaseType.INT, BaseType.BOOL): lambda v: v != 0,
+    (BaseType.INT, BaseType.STR): str,
+}
+
+
+def is_int32(value: Any) -> bool:
+    return isinstance(value, int) and INT_MIN <= value <= INT_MAX
+
+
+def make_literal(value: Any, type_: TypeDesc, origin: AstNode) -> Optional[LiteralNode]:
+    """Создание узла-литерала для вычисленного значения
+    :param value: значение
+    :param type_: тип значения
+    :param origin: узел, вместо которого будет литерал (для сохранения позиции в исходном коде)
+    :return: литерал или None, если значение не может быть записано литералом без потерь
+    """
+
+    base_type = type_.base_type
+    if base_type == BaseType.BOOL:
+        literal = 'true' if value else 'false'
+    elif base_type == BaseType.INT:
+        if not is_int32(value):
+            return None
+        literal = str(value)
+    elif base_type == BaseType.FLOAT:
+        # значение должно быть конечным и точно представимым в записи констант обоих генераторов
+        if not math.isfinite(value) or float(str(value)) != value or float(f'{value:.20f}') != value:
+            return None
+        literal = repr(float(value))
+    elif base_type == BaseType.STR:
+        literal = json.dumps(value, ensure_ascii=False)
+    else:
+        return None
+    node = LiteralNode(literal, row=origin._row, col=origin._col, loc=origin.loc, positions=origin.positions)
+    node.node_type = type_
+    return node
+
+
+def is_const(node: AstNode) -> bool:
+    if not isinstance(node, LiteralNode) or node.node_type is None:
+        return False
+    if node.node_type.base_type == BaseType.INT:
+        return is_int32(node.value)
+    return True
+
+
+class ConstantFolder:
+    """Класс для свертки константных выражений в проверенном AST-дереве
+       (вычисление выполняется по правилам целевых платформ: 32-битные int с переполнением,
+       целочисленное деление с отбрасыванием дробной части, float64)
+
+       Обработчик узла возвращает узел, которым нужно заменить исходный (или сам узел).
+    """
+
+    def fold(self, node: AstNode) -> AstNode:
+        return run(self.fold_node(node))
+
+    @visitor.on('AstNode')
+    def fold_node(self, AstNode):
+        """
+        Нужен для работы модуля visitor (инициализации диспетчера)
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def fold_node(self, node: AstNode) -> AstNode:
+        return node
+
+    @visitor.when(BinOpNode)
+    def fold_node(self, node: BinOpNode) -> AstNode:
+        node.arg1 = yield self.fold_node(node.arg1)
+        node.arg2 = yield self.fold_node(node.arg2)
+        if node.op in (BinOp.LOGICAL_AND, BinOp.LOGICAL_OR) and is_const(node.arg1):
+            # вычисление по короткой схеме: при константном первом операнде второй либо не вычисляется,
+            # либо является результатом
+            return node.arg1 if node.arg1.value == (node.op == BinOp.LOGICAL_OR) else node.arg2
+        if is_const(node.arg1) and is_const(node.arg2):
+            calc = CONST_BIN_OPS.get((node.op, node.arg1.node_type.base_type))
+            if calc is not None and node.arg2.node_type is node.arg1.node_type:
+                value = calc(node.arg1.value, node.arg2.value)
+                if value is not None:
+                    literal = make_literal(value, node.node_type, node)
+                    if literal is not None:
+                        return literal
+        return node
+
+    @visitor.when(TypeConvertNode)
+    def fold_node(self, node: TypeConvertNode) -> AstNode:
+        node.expr = yield self.fold_node(node.expr)
+        if is_const(node.expr):
+            calc = CONST_TYPE_CONVERTS.get((node.expr.node_type.base_type, node.node_type.base_type))
+            if calc is not None:
+                literal = make_literal(calc(node.expr.value), node.node_type, node)
+                if literal is not None:
+                    return literal
+        return node
+
+    @visitor.when(CallNode)
+    def fold_node(self, node: CallNode) -> AstNode:
+        params = []
+        for param in node.params:
+            params.append((yield self.fold_node(param)))
+        node.params = tuple(params)
+        return node
+
+    @visitor.when(AssignNode)
+    def fold_node(self, node: AssignNode) -> AstNode:
+        node.val = yield self.fold_node(node.val)
+        return node
+
+    @visitor.when(VarsNode)
+    def fold_node(self, node: VarsNode) -> AstNode:
+        vars_ = []
+        for var in node.vars:
+            vars_.append((yield self.fold_node(var)))
+        node.vars = tuple(vars_)
+        return node
+
+    @visitor.when(ReturnNode)
+    def fold_node(self, node: ReturnNode) -> AstNode:
+        node.val = yield self.fold_node(node.val)
+        return node
+
+    @visitor.when(IfNode)
+    def fold_node(self, node: IfNode) -> AstNode:
+        node.cond = yield self.fold_node(node.cond)
+        node.then_stmt = yield self.fold_node(node.then_stmt)
+        if node.else_stmt:
+            node.else_stmt = yield self.fold_node(node.else_stmt)
+        return node
+
+    @visitor.when(WhileNode)
+    def fold_node(self, node: WhileNode) -> AstNode:
+        node.cond = yield self.fold_node(node.cond)
+        node.body = yield self.fold_node(node.body)
+        return node
+
+    @visitor.when(ForNode)
+    def fold_node(self, node: ForNode) -> AstNode:
+        node.init = yield self.fold_node(node.init)
+        node.cond = yield self.fold_node(node.cond)
+        node.step = yield self.fold_node(node.step)
+        node.body = yield self.fold_node(node.body)
+        return node
+
+    @visitor.when(FuncNode)
+    def fold_node(self, node: FuncNode) -> AstNode:
+        node.body = yield self.fold_node(node.body)
+        return node
+
+    @visitor.when(StmtListNode)
+    def fold_node(self, node: StmtListNode) -> AstNode:
+        stmts = []
+        for stmt in node.stmts:
+            stmts.append((yield self.fold_node(stmt)))
+        node.stmts = tuple(stmts)
+        return node
+
+
+def is_const_bool(expr: AstNode, value: bool) -> bool:
+    return isinstance(expr, LiteralNode) and expr.node_type is TypeDesc.BOOL and expr.value is value
+
+
+def is_empty_stmt(stmt: AstNode) -> bool:
+    return isinstance(stmt, StmtListNode) and not stmt.stmts
+
+
+class DeadCodeEliminator:
+    """Класс для удаления недостижимого кода: инструкций после return (и бесконечных циклов),
+       ветвей if и циклов с константным условием, пустых блоков и пустых if, вычисление условия которых
+       не имеет побочных эффектов и не может завершиться исключением (см. is_safe)
+
+       Обработчик узла возвращает узел, которым нужно заменить исходный (EMPTY_STMT - инструкция удалена).
+    """
+
+    def eliminate(self, node: AstNode) -> AstNode:
+        return run(self.eliminate_node(node))
+
+    @visitor.on('AstNode')
+    def eliminate_node(self, AstNode):
+        """
+        Нужен для работы модуля visitor (инициализации диспетчера)
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def eliminate_node(self, node: AstNode) -> AstNode:
+        return node
+
+    @visitor.when(IfNode)
+    def eliminate_node(self, node: IfNode) -> AstNode:
+        if is_const_bool(node.cond, True):
+            return (yield self.eliminate_node(node.then_stmt))
+        if is_const_bool(node.cond, False):
+            if node.else_stmt:
+                return (yield self.eliminate_node(node.else_stmt))
+            return EMPTY_STMT
+        node.then_stmt = yield self.eliminate_node(node.then_stmt)
+        if node.else_stmt:
+            node.else_stmt = yield self.eliminate_node(node.else_stmt)
+            if is_empty_stmt(node.else_stmt):
+                node.else_stmt = None
+        if is_empty_stmt(node.then_stmt) and not node.else_stmt and is_safe(node.cond):
+            return EMPTY_STMT
+        return node
+
+    @visitor.when(WhileNode)
+    def eliminate_node(self, node: WhileNode) -> AstNode:
+        if is_const_bool(node.cond, False):
+            return EMPTY_STMT
+        node.body = yield self.eliminate_node(node.body)
+        return node
+
+    @visitor.when(ForNode)
+    def eliminate_node(self, node: ForNode) -> AstNode:
+        if is_const_bool(node.cond, False):
+            # инициализация выполняется (и может иметь побочные эффекты), тело и шаг - никогда
+            return node.init
+        node.body = yield self.eliminate_node(node.body)
+        return node
+
+    @visitor.when(FuncNode)
+    def eliminate_node(self, node: FuncNode) -> AstNode:
+        node.body = yield self.eliminate_node(node.body)
+        return node
+
+    @visitor.when(StmtListNode)
+    def eliminate_node(self, node: StmtListNode) -> AstNode:
+        stmts = []
+        reachable = True
+        for stmt in node.stmts:
+            if not reachable:
+                # после return объявления функций и переменных сохраняются (без инициализации)
+                if isinstance(stmt, FuncNode):
+                    stmts.append((yield self.eliminate_node(stmt)))
+                elif isinstance(stmt, VarsNode):
+                    stmt.vars = tuple(var.var if isinstance(var, AssignNode) else var for var in stmt.vars)
+                    stmts.append(stmt)
+                continue
+            stmt = yield self.eliminate_node(stmt)
+            if is_empty_stmt(stmt):
+                continue
+            stmts.append(stmt)
+            if always_returns(stmt):
+                reachable = False
+        if not stmts and not node.program:
+            return EMPTY_STMT
+        node.stmts = tuple(stmts)
+        return node
+
+
+# тип результата функции -> (операция, нейтральный элемент), результат которой можно накапливать
+# (операция ассоциативна, в т.ч. для int с переполнением)
+ACCUMULATOR_OPS = {
+    (TypeDesc.INT, BinOp.MUL): 1,
+    (TypeDesc.INT, BinOp.ADD): 0,
+    (TypeDesc.STR, BinOp.ADD): '',
+}
+ACCUMULATOR_PARAM_NAME = 'acc$'
+ACCUMULATOR_FUNC_SUFFIX = '$acc'
+
+
+def is_local_value(expr: AstNode) -> bool:
+    """Проверка, что значение выражения зависит только от параметров и локальных переменных функции
+       (без побочных эффектов), т.е. не изменится при вычислении других выражений функции
+    """
+
+    local = True
+
+    def check(node: AstNode) -> bool:
+        nonlocal local
+        if isinstance(node, (CallNode, AssignNode)) or \
+                isinstance(node, IdentNode) and node.node_ident is not None and \
+                node.node_ident.scope not in (ScopeType.LOCAL, ScopeType.PARAM):
+            local = False
+        return local
+
+    walk(expr, check)
+    return local
+
+
+class TailRecursionAccumulator:
+    """Преобразование рекурсии вида return x * f(...) (а также x + f(...) и f(...) * x для int,
+       x + f(...) для string) в хвостовую рекурсию с накапливающим параметром:
+
+           int f(int n) { ... return 1; ... return n * f(n - 1); }
+       ->
+           int f(int n) { return f$acc(n, 1); }
+           int f$acc(int n, int acc$) { ... return acc$ * 1; ... return f$acc(n - 1, acc$ * n); }
+
+       Хвостовые вызовы f$acc самой себя генераторы кода заменяют переходом в начало функции.
+       Множитель x должен зависеть только от параметров и локальных переменных: его вычисление
+       переносится после вычисления аргументов вызова, которые изменить их не могут (присваивание
+       в языке - только оператор).
+    """
+
+    def transform(self, prog: StmtListNode) -> StmtListNode:
+        stmts = []
+        for stmt in prog.stmts:
+            stmts.append(stmt)
+            if isinstance(stmt, FuncNode):
+                acc_func = self.transform_func(stmt)
+                if acc_func is not None:
+                    stmts.append(acc_func)
+        prog.stmts = tuple(stmts)
+        return prog
+
+    @staticmethod
+    def find_returns(func: FuncNode) -> List[ReturnNode]:
+        returns: List[ReturnNode] = []
+
+        def find(node: AstNode) -> bool:
+            if isinstance(node, ReturnNode):
+                returns.append(node)
+            return isinstance(node, StmtNode)
+
+        walk(func.body, find)
+        return returns
+
+    def accumulated_call(self, ret: ReturnNode, func: IdentDesc) -> Optional[Tuple[BinOp, AstNode, CallNode]]:
+        """Разбор return x <op> f(...)
+        :return: операция, x, вызов или None, если return не такого вида
+        """
+
+        val = ret.val
+        if not isinstance(val, BinOpNode) or (val.node_type, val.op) not in ACCUMULATOR_OPS:
+            return None
+        if is_self_call(val.arg2, func) and is_local_value(val.arg1):
+            return val.op, val.arg1, val.arg2
+        # f(...) <op> x -> x <op> f(...) только для коммутативных операций (int)
+        if val.node_type is TypeDesc.INT and is_self_call(val.arg1, func) and is_local_value(val.arg2):
+            return val.op, val.arg2, val.arg1
+        return None
+
+    def transform_func(self, func: FuncNode) -> Optional[FuncNode]:
+        func_ident = func.name.node_ident
+        returns = self.find_returns(func)
+        accumulated = [self.accumulated_call(ret, func_ident) for ret in returns]
+        ops = set(acc[0] for acc in accumulated if acc is not None)
+        if len(ops) != 1:
+            return None
+        op = ops.pop()
+        type_ = func_ident.type.return_type
+        acc_ident = IdentDesc(ACCUMULATOR_PARAM_NAME, type_, ScopeType.PARAM, len(func.params))
+        acc_param = ParamNode(func.type, IdentNode(ACCUMULATOR_PARAM_NAME, row=func.row, col=func.col))
+        acc_param.node_ident = acc_param.name.node_ident = acc_ident
+        acc_param.name.node_type = type_
+        acc_func_ident = IdentDesc(func_ident.name + ACCUMULATOR_FUNC_SUFFIX,
+                                   TypeDesc.func_type(type_, (*func_ident.type.params, type_)))
+        acc_func = FuncNode(func.type, IdentNode(acc_func_ident.name, row=func.row, col=func.col),
+                            (*func.params, acc_param), func.body, row=func.row, col=func.col)
+        acc_func.name.node_ident = acc_func_ident
+        acc_func.name.node_type = acc_func_ident.type
+        acc_func.node_type = TypeDesc.VOID
+
+        def ident(desc: IdentDesc) -> IdentNode:
+            node = IdentNode(desc.name, row=func.row, col=func.col)
+            node.node_ident = desc
+            node.node_type = desc.type
+            return node
+
+        def call(params: Tuple[AstNode, ...], acc: AstNode) -> CallNode:
+            node = CallNode(ident(acc_func_ident), *params, acc, row=func.row, col=func.col)
+            node.node_type = type_
+            return node
+
+        def bin_op(arg1: AstNode, arg2: AstNode) -> BinOpNode:
+            node = BinOpNode(op, arg1, arg2, row=arg2.row, col=arg2.col)
+            node.node_type = type_
+            return node
+
+        # выход из функции без return возвращает значение по умолчанию (как в генераторах кода),
+        # в функции с накапливающим параметром он заменяется явным return, чтобы учесть накопленное значение
+        if not always_returns(func.body):
+            implicit_ret = ReturnNode(make_literal(DEFAULT_TYPE_VALUES[type_.base_type], type_, func),
+                                      row=func.row, col=func.col)
+            implicit_ret.node_type = TypeDesc.VOID
+            func.body.stmts = (*func.body.stmts, implicit_ret)
+            returns.append(implicit_ret)
+            accumulated.append(None)
+
+        start_value = ACCUMULATOR_OPS[(type_, op)]
+        for ret, acc in zip(returns, accumulated):
+            if acc is not None:
+                _, x, self_call = acc
+                ret.val = call(self_call.params, bin_op(ident(acc_ident), x))
+            elif is_self_call(ret.val, func_ident):
+                ret.val = call(ret.val.params, ident(acc_ident))
+            elif is_const(ret.val) and ret.val.value == start_value:
+                ret.val = ident(acc_ident)
+            else:
+                ret.val = bin_op(ident(acc_ident), ret.val)
+
+        start = make_literal(start_value, type_, func)
+        body = StmtListNode(ReturnNode(call(tuple(ident(p.node_ident) for p in func.params), start),
+                                       row=func.row, col=func.col), row=func.row, col=func.col)
+        body.node_type = TypeDesc.VOID
+        body.stmts[0].node_type = TypeDesc.VOID
+        func.body = body
+        return acc_func
+
+
+def is_pure_call(node: CallNode) -> bool:
+    """Проверка, что вызов функции (без учета аргументов) не имеет побочных эффектов и не завершается исключением
+    """
+
+    ident = node.func.node_ident
+    return ident is not None and ident.built_in and BUILT_IN_FUNCTIONS_PURITY.get(ident.name) == (True, False)
+
+
+def may_throw(node: BinOpNode) -> bool:
+    """Проверка, что бинарная операция может завершиться исключением
+       (целочисленное деление на 0 и INT_MIN / -1, сравнение строк со значением null)
+    """
+
+    base_type = node.arg1.node_type.base_type
+    if base_type == BaseType.INT and node.op in (BinOp.DIV, BinOp.MOD):
+        return not is_const(node.arg2) or node.arg2.value in (0, -1)
+    return base_type == BaseType.STR and node.op != BinOp.ADD
+
+
+def is_safe(expr: AstNode) -> bool:
+    """Проверка, что вычисление выражения не имеет побочных эффектов и не завершается исключением
+    """
+
+    safe = True
+
+    def check(node: AstNode) -> bool:
+        nonlocal safe
+        if isinstance(node, CallNode) and not is_pure_call(node) or isinstance(node, BinOpNode) and may_throw(node):
+            safe = False
+        return safe
+
+    walk(expr, check)
+    return safe
+
+
+def expr_key(expr: AstNode, interned: Dict[Tuple, int]) -> Tuple:
+    """Ключ для сравнения выражений без побочных эффектов на совпадение (одинаковые выражения - одинаковые ключи)
+    :param expr: выражение
+    :param interned: номера ключей подвыражений (общие для всех сравниваемых выражений)
+    """
+
+    keys: Dict[int, int] = {}
+
+    def key_of(node: AstNode) -> Tuple:
+        if isinstance(node, LiteralNode):
+            return 'literal', node.node_type, node.literal
+        if isinstance(node, IdentNode):
+            return 'ident', id(node.node_ident)
+        if isinstance(node, BinOpNode):
+            return 'bin_op', node.op, node.node_type, keys[id(node.arg1)], keys[id(node.arg2)]
+        if isinstance(node, TypeConvertNode):
+            return 'convert', node.node_type, keys[id(node.expr)]
+        if isinstance(node, CallNode):
+            return ('call', id(node.func.node_ident), *(keys[id(param)] for param in node.params))
+        return 'node', id(node)
+
+    def post(node: AstNode) -> None:
+        # ключи потомков заменяются номерами (вложенность кортежей не зависит от глубины выражения)
+        keys[id(node)] = interned.setdefault(key_of(node), len(interned))
+
+    walk(expr, post=post, childs=lambda node: node.params if isinstance(node, CallNode) else node.childs)
+    return key_of(expr)
+
+
+def ident_node(ident: IdentDesc, origin: AstNode) -> IdentNode:
+    """Узел-идентификатор для переменной, добавляемой оптимизатором
+    :param ident: описание переменной
+    :param origin: узел, для которого создается переменная (для сохранения позиции в исходном коде)
+    """
+
+    node = IdentNode(ident.name, row=origin.row, col=origin.col)
+    node.node_ident = ident
+    node.node_type = ident.type
+    return node
+
+
+class TempVars:
+    """Временные переменные, добавляемые оптимизатором: в функциях - локальные (номера слотов
+       назначают генераторы кода), в глобальном коде - глобальные (номера продолжают номера глобальных переменных)
+    """
+
+    def __init__(self, prog: StmtListNode, name_format: str) -> None:
+        self.name_format = name_format
+        self.count = 0
+        self.global_index = self.next_index(prog, (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL))
+        self.local_index: Optional[int] = None
+
+    @staticmethod
+    def next_index(root: AstNode, scopes: Tuple[ScopeType, ...]) -> int:
+        # первый свободный номер переменных с областью видимости из scopes
+        index = 0
+
+        def find(node: AstNode) -> None:
+            nonlocal index
+            if isinstance(node, IdentNode) and node.node_ident is not None and node.node_ident.scope in scopes:
+                index = max(index, node.node_ident.index + 1)
+
+        walk(root, find)
+        return index
+
+    def enter_func(self, func: Optional[FuncNode]) -> None:
+        """Переход к функции (None - к глобальному коду)
+        """
+
+        self.local_index = self.next_index(func, (ScopeType.LOCAL, )) if func is not None else None
+
+    def decl(self, val: AstNode) -> Tuple[VarsNode, IdentDesc]:
+        """Объявление новой временной переменной, инициализируемой значением выражения
+        :param val: выражение
+        :return: объявление и описание переменной
+        """
+
+        name = self.name_format.format(self.count)
+        self.count += 1
+        if self.local_index is not None:
+            ident = IdentDesc(name, val.node_type, ScopeType.LOCAL, self.local_index)
+            self.local_index += 1
+        else:
+            ident = IdentDesc(name, val.node_type, ScopeType.GLOBAL_LOCAL, self.global_index)
+            self.global_index += 1
+        assign = AssignNode(ident_node(ident, val), val, row=val.row, col=val.col)
+        assign.node_type = ident.type
+        decl = VarsNode(TypeNode(str(ident.type), row=val.row, col=val.col), assign, row=val.row, col=val.col)
+        decl.node_type = TypeDesc.VOID
+        return decl, ident
+
+
+LICM_TEMP_NAME = 'licm${}'
+
+
+class LoopInvariantCodeMotion:
+    """Вынос из циклов while и for инвариантных выражений: выражения без побочных эффектов и исключений,
+       операнды которых в цикле не изменяются, вычисляются один раз перед циклом во временную переменную:
+
+           for (int i = 0; i < n; i = i + 1) { s = s + a * b; }
+       ->
+           int licm$0 = a * b;
+           for (int i = 0; i < n; i = i + 1) { s = s + licm$0; }
+
+       Глобальные переменные неизменны, если в цикле нет вызовов пользовательских функций.
+       Вложенные циклы обрабатываются первыми, объявления временных
+       переменных вложенного цикла, инвариантные во внешнем, выносятся и из внешнего цикла.
+
+       Обработчик узла возвращает узел, которым нужно заменить исходный (или сам узел).
+    """
+
+    def move(self, prog: StmtListNode) -> StmtListNode:
+        self.func: Optional[FuncNode] = None
+        self.temp_vars = TempVars(prog, LICM_TEMP_NAME)
+        self.interned: Dict[Tuple, int] = {}
+        self.temp_decls: Set[VarsNode] = set()
+        return run(self.move_node(prog))
+
+    @visitor.on('AstNode')
+    def move_node(self, AstNode):
+        """
+        Нужен для работы модуля visitor (инициализации диспетчера)
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def move_node(self, node: AstNode) -> AstNode:
+        return node
+
+    @visitor.when(IfNode)
+    def move_node(self, node: IfNode) -> AstNode:
+        node.then_stmt = yield self.move_node(node.then_stmt)
+        if node.else_stmt:
+            node.else_stmt = yield self.move_node(node.else_stmt)
+        return node
+
+    @visitor.when(WhileNode)
+    def move_node(self, node: WhileNode) -> AstNode:
+        node.body = yield self.move_node(node.body)
+        return (yield self.hoist_loop(node, (node.cond, node.body)))
+
+    @visitor.when(ForNode)
+    def move_node(self, node: ForNode) -> AstNode:
+        node.body = yield self.move_node(node.body)
+        return (yield self.hoist_loop(node, (node.cond, node.body, node.step)))
+
+    @visitor.when(FuncNode)
+    def move_node(self, node: FuncNode) -> AstNode:
+        self.func = node
+        self.temp_vars.enter_func(node)
+        node.body = yield self.move_node(node.body)
+        self.func = None
+        self.temp_vars.enter_func(None)
+        return node
+
+    @visitor.when(StmtListNode)
+    def move_node(self, node: StmtListNode) -> AstNode:
+        stmts = []
+        for stmt in node.stmts:
+            stmts.append((yield self.move_node(stmt)))
+        node.stmts = tuple(stmts)
+        return node
+
+    def hoist_loop(self, loop: StmtNode, parts: Tuple[AstNode, ...]) -> AstNode:
+        """Вынос инвариантных выражений из цикла
+        :param loop: цикл
+        :param parts: части цикла, выполняемые на каждой итерации
+        :return: цикл или блок из объявлений временных переменных и цикла
+        """
+
+        # изменяемые в цикле переменные (инициализация for выполняется после вынесенных выражений,
+        # переменные, объявленные в цикле, до объявления не инициализированы)
+        self.variant = set()
+        self.stable_globals = True
+
+        def find(node: AstNode) -> None:
+            if isinstance(node, AssignNode):
+                self.variant.add(node.var.node_ident)
+            elif isinstance(node, VarsNode):
+                self.variant.update(var.node_ident for var in node.vars if isinstance(var, IdentNode))
+            elif isinstance(node, CallNode) and not node.func.node_ident.built_in:
+                self.stable_globals = False
+
+        for part in (*parts, getattr(loop, 'init', EMPTY_STMT)):
+            walk(part, find)
+
+        self.temps: Dict[Tuple, IdentDesc] = {}
+        self.decls: List[VarsNode] = []
+        if isinstance(loop, ForNode):
+            loop.cond = yield self.hoist_root(loop.cond)
+            loop.step = yield self.hoist_node(loop.step)
+        else:
+            loop.cond = yield self.hoist_root(loop.cond)
+        loop.body = yield self.hoist_node(loop.body)
+        if not self.decls:
+            return loop
+        block = StmtListNode(*self.decls, loop, row=loop.row, col=loop.col)
+        block.node_type = TypeDesc.VOID
+        return block
+
+    def is_invariant_ident(self, node: IdentNode) -> bool:
+        ident = node.node_ident
+        if ident in self.variant:
+            return False
+        return self.stable_globals or ident.scope not in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL)
+
+    def worth_hoisting(self, expr: AstNode) -> bool:
+        # выносятся вычисления; чтение глобальной переменной в функции заменяется чтением локальной
+        if isinstance(expr, IdentNode):
+            return self.func is not None and expr.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL)
+        return isinstance(expr, (BinOpNode, TypeConvertNode, CallNode))
+
+    def temp(self, expr: AstNode) -> IdentNode:
+        """Замена инвариантного выражения временной переменной, вычисляемой перед циклом
+        (одинаковые выражения - одна переменная)
+        """
+
+        key = expr_key(expr, self.interned)
+        ident = self.temps.get(key)
+        if ident is None:
+            decl, ident = self.temp_vars.decl(expr)
+            self.temps[key] = ident
+            self.decls.append(decl)
+            self.temp_decls.add(decl)
+        return ident_node(ident, expr)
+
+    def hoist_root(self, expr: AstNode) -> AstNode:
+        expr, invariant = yield self.hoist_expr(expr)
+        return self.temp(expr) if invariant and self.worth_hoisting(expr) else expr
+
+    @visitor.on('AstNode')
+    def hoist_expr(self, AstNode):
+        """
+        Обработчик выражения внутри цикла: возвращает (выражение, признак инвариантности);
+        из неинвариантного выражения выносятся его инвариантные подвыражения
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def hoist_expr(self, node: AstNode) -> Tuple[AstNode, bool]:
+        return node, False
+
+    @visitor.when(LiteralNode)
+    def hoist_expr(self, node: LiteralNode) -> Tuple[AstNode, bool]:
+        return node, True
+
+    @visitor.when(IdentNode)
+    def hoist_expr(self, node: IdentNode) -> Tuple[AstNode, bool]:
+        return node, self.is_invariant_ident(node)
+
+    @visitor.when(TypeConvertNode)
+    def hoist_expr(self, node: TypeConvertNode) -> Tuple[AstNode, bool]:
+        node.expr, invariant = yield self.hoist_expr(node.expr)
+        return node, invariant
+
+    @visitor.when(BinOpNode)
+    def hoist_expr(self, node: BinOpNode) -> Tuple[AstNode, bool]:
+        arg1, invariant1 = yield self.hoist_expr(node.arg1)
+        arg2, invariant2 = yield self.hoist_expr(node.arg2)
+        node.arg1, node.arg2 = arg1, arg2
+        if invariant1 and invariant2 and not may_throw(node):
+            return node, True
+        if invariant1 and self.worth_hoisting(arg1):
+            node.arg1 = self.temp(arg1)
+        if invariant2 and self.worth_hoisting(arg2):
+            node.arg2 = self.temp(arg2)
+        return node, False
+
+    @visitor.when(CallNode)
+    def hoist_expr(self, node: CallNode) -> Tuple[AstNode, bool]:
+        params = []
+        for param in node.params:
+            params.append((yield self.hoist_expr(param)))
+        node.params = tuple(param for param, _ in params)
+        if all(invariant for _, invariant in params) and is_pure_call(node):
+            return node, True
+        node.params = tuple(self.temp(param) if invariant and self.worth_hoisting(param) else param
+                            for param, invariant in params)
+        return node, False
+
+    @visitor.on('AstNode')
+    def hoist_node(self, AstNode):
+        """
+        Обработчик инструкции внутри цикла
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def hoist_node(self, node: AstNode) -> AstNode:
+        return node
+
+    @visitor.when(CallNode)
+    def hoist_node(self, node: CallNode) -> AstNode:
+        node, _ = yield self.hoist_expr(node)
+        return node
+
+    @visitor.when(AssignNode)
+    def hoist_node(self, node: AssignNode) -> AstNode:
+        node.val = yield self.hoist_root(node.val)
+        return node
+
+    @visitor.when(VarsNode)
+    def hoist_node(self, node: VarsNode) -> AstNode:
+        if node in self.temp_decls:
+            # временная переменная вложенного цикла
+            assign = node.vars[0]
+            val, invariant = yield self.hoist_expr(assign.val)
+            key = expr_key(val, self.interned)
+            if invariant and key not in self.temps:
+                assign.val = val
+                self.temps[key] = assign.var.node_ident
+                self.decls.append(node)
+                return EMPTY_STMT
+            assign.val = self.temp(val) if invariant and self.worth_hoisting(val) else val
+            return node
+        vars_ = []
+        for var in node.vars:
+            vars_.append((yield self.hoist_node(var)))
+        node.vars = tuple(vars_)
+        return node
+
+    @visitor.when(ReturnNode)
+    def hoist_node(self, node: ReturnNode) -> AstNode:
+        node.val = yield self.hoist_root(node.val)
+        return node
+
+    @visitor.when(IfNode)
+    def hoist_node(self, node: IfNode) -> AstNode:
+        node.cond = yield self.hoist_root(node.cond)
+        node.then_stmt = yield self.hoist_node(node.then_stmt)
+        if node.else_stmt:
+            node.else_stmt = yield self.hoist_node(node.else_stmt)
+        return node
+
+    @visitor.when(WhileNode)
+    def hoist_node(self, node: WhileNode) -> AstNode:
+        node.cond = yield self.hoist_root(node.cond)
+        node.body = yield self.hoist_node(node.body)
+        return node
+
+    @visitor.when(ForNode)
+    def hoist_node(self, node: ForNode) -> AstNode:
+        node.init = yield self.hoist_node(node.init)
+        node.cond = yield self.hoist_root(node.cond)
+        node.step = yield self.hoist_node(node.step)
+        node.body = yield self.hoist_node(node.body)
+        return node
+
+    @visitor.when(StmtListNode)
+    def hoist_node(self, node: StmtListNode) -> AstNode:
+        stmts = []
+        for stmt in node.stmts:
+            stmt = yield self.hoist_node(stmt)
+            if not is_empty_stmt(stmt):
+                stmts.append(stmt)
+        node.stmts = tuple(stmts)
+        return node
+
+
+def expr_size(expr: AstNode) -> int:
+    """Размер выражения (количество узлов AST-дерева)
+    """
+
+    size = 0
+
+    def count(node: AstNode) -> None:
+        nonlocal size
+        size += 1
+
+    walk(expr, count)
+    return size
+
+
+def find_user_calls(root: AstNode) -> Set[IdentDesc]:
+    """Пользовательские функции, вызываемые в поддереве
+    """
+
+    calls: Set[IdentDesc] = set()
+
+    def find(node: AstNode) -> None:
+        if isinstance(node, CallNode) and not node.func.node_ident.built_in:
+            calls.add(node.func.node_ident)
+
+    walk(root, find)
+    return calls
+
+
+# максимальный размер (в узлах AST-дерева) тела встраиваемой функции
+INLINE_MAX_SIZE = 12
+INLINE_TEMP_NAME = 'inline${}'
+
+
+class FunctionInliner:
+    """Встраивание небольших нерекурсивных пользовательских функций в места вызова: функций, тело которых -
+       return <выражение>, и void-функций, тело которых - вызовы функций и присваивания глобальным переменным:
+
+           int sq(int x) { return x * x; }   ...   y = sq(a + g);
+       ->
+           int inline$0 = a + g;   y = inline$0 * inline$0;
+
+       Параметры заменяются аргументами, если это литералы, локальные переменные и параметры, а также
+       однократно используемые выражения, которые не зависят от вычисления остальной части выражения
+       (нет вызовов, обращений к глобальным переменным и операций, которые могут завершиться исключением).
+       Остальные аргументы по порядку вычисляются в новые временные переменные перед инструкцией с вызовом,
+       поэтому такое встраивание выполняется, только если вызов выполняется безусловно и один раз (не в условии
+       цикла и не во втором операнде && и ||) и все, что вычисляется в инструкции до него, от этого не зависит.
+
+       Функции обрабатываются начиная с вызываемых (тела вызываемых функций уже содержат встроенные вызовы),
+       функции, все вызовы которых встроены, удаляются.
+
+       Обработчик инструкции возвращает узел, которым нужно заменить исходный (или сам узел),
+       обработчик выражения - (выражение, признак независимости вычисления от остальной части выражения).
+    """
+
+    def __init__(self, max_size: int = INLINE_MAX_SIZE) -> None:
+        self.max_size = max_size
+
+    def inline(self, prog: StmtListNode) -> StmtListNode:
+        self.funcs: Dict[IdentDesc, FuncNode] = {stmt.name.node_ident: stmt for stmt in prog.stmts
+                                                 if isinstance(stmt, FuncNode)}
+        self.callees: Dict[IdentDesc, List[IdentDesc]] = {}
+        for ident, func in self.funcs.items():
+            calls = find_user_calls(func.body)
+            self.callees[ident] = [callee for callee in self.funcs if callee in calls]
+        self.bodies: Dict[IdentDesc, Optional[Tuple[AstNode, ...]]] = {}
+        self.inlined: Set[IdentDesc] = set()
+        self.temp_vars = TempVars(prog, INLINE_TEMP_NAME)
+        self.decls: List[VarsNode] = []
+        self.allowed = False
+        self.replacements: Dict[IdentDesc, AstNode] = {}
+
+        for ident in self.callees_first():
+            func = self.funcs[ident]
+            self.temp_vars.enter_func(func)
+            func.body = run(self.inline_node(func.body))
+        self.temp_vars.enter_func(None)
+        stmts = []
+        for stmt in prog.stmts:
+            if not isinstance(stmt, FuncNode):
+                stmt = run(self.inline_node(stmt))
+                if is_empty_stmt(stmt):
+                    continue
+            stmts.append(stmt)
+        called: Set[IdentDesc] = set()
+        for stmt in stmts:
+            called |= find_user_calls(stmt)
+        prog.stmts = tuple(stmt for stmt in stmts if not isinstance(stmt, FuncNode) or
+                           stmt.name.node_ident not in self.inlined or stmt.name.node_ident in called)
+        return prog
+
+    def callees_first(self) -> List[IdentDesc]:
+        # обход графа вызовов в глубину: функция после всех вызываемых ею (кроме рекурсивных вызовов)
+        order: List[IdentDesc] = []
+        visited: Set[IdentDesc] = set()
+        for root in self.funcs:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self.callees[root]))]
+            while stack:
+                ident, callees = stack[-1]
+                callee = next(callees, None)
+                if callee is None:
+                    stack.pop()
+                    order.append(ident)
+                elif callee not in visited:
+                    visited.add(callee)
+                    stack.append((callee, iter(self.callees[callee])))
+        return order
+
+    def is_recursive(self, ident: IdentDesc) -> bool:
+        visited: Set[IdentDesc] = set()
+        stack = list(self.callees[ident])
+        while stack:
+            callee = stack.pop()
+            if callee is ident:
+                return True
+            if callee not in visited:
+                visited.add(callee)
+                stack.extend(self.callees[callee])
+        return False
+
+    def inlinable_body(self, ident: IdentDesc) -> Optional[Tuple[AstNode, ...]]:
+        """Тело функции, если функция может быть встроена
+        :return: выражение из return или инструкции тела void-функции
+        """
+
+        if ident in self.bodies:
+            return self.bodies[ident]
+        func = self.funcs.get(ident)
+        body = None
+        if func is not None and not self.is_recursive(ident):
+            stmts = func.body.stmts if isinstance(func.body, StmtListNode) else (func.body, )
+            if ident.type.return_type is not TypeDesc.VOID:
+                if len(stmts) == 1 and isinstance(stmts[0], ReturnNode):
+                    body = (stmts[0].val, )
+            elif all(isinstance(stmt, CallNode) or isinstance(stmt, AssignNode) and
+                     stmt.var.node_ident.scope == ScopeType.GLOBAL for stmt in stmts):
+                body = stmts
+            if body is not None and sum(expr_size(expr) for expr in body) > self.max_size:
+                body = None
+        self.bodies[ident] = body
+        return body
+
+    def expand(self, call: CallNode, body: Tuple[AstNode, ...], stable_params: List[bool],
+               allowed: bool) -> Optional[Tuple[List[AstNode], bool]]:
+        """Подстановка тела функции в место вызова
+        :param call: вызов
+        :param body: тело функции
+        :param stable_params: признаки независимости вычисления аргументов от остальной части выражения
+        :param allowed: можно ли вычислить аргументы во временные переменные перед инструкцией
+        :return: копии выражений (инструкций) тела функции и признак независимости их вычисления
+                 от остальной части выражения или None, если встраивание невозможно
+        """
+
+        func = self.funcs[call.func.node_ident]
+        uses: Dict[IdentDesc, int] = {param.node_ident: 0 for param in func.params}
+
+        def count(node: AstNode) -> None:
+            if isinstance(node, IdentNode) and node.node_ident in uses:
+                uses[node.node_ident] += 1
+
+        for expr in body:
+            walk(expr, count)
+        # если ни тело, ни аргументы не имеют побочных эффектов, глобальные переменные при вычислении
+        # вызова не изменяются, и аргументы, зависящие от них, тоже можно подставлять
+        body_stable = self.is_stable_body(body)
+        effect_free = body_stable and all(is_safe(arg) for arg in call.params)
+        stable_result = body_stable
+        replacements: Dict[IdentDesc, AstNode] = {}
+        temps = []
+        for param, arg, stable in zip(func.params, call.params, stable_params):
+            if isinstance(arg, LiteralNode) or isinstance(arg, IdentNode) and \
+                    (effect_free or arg.node_ident.scope in (ScopeType.LOCAL, ScopeType.PARAM)) or \
+                    (stable or effect_free) and uses[param.node_ident] <= 1:
+                replacements[param.node_ident] = arg
+                stable_result = stable_result and stable
+            else:
+                temps.append((param.node_ident, arg))
+        if temps and not allowed:
+            return None
+        for param, arg in temps:
+            decl, ident = self.temp_vars.decl(arg)
+            self.decls.append(decl)
+            replacements[param] = ident_node(ident, arg)
+
+        self.inlined.add(call.func.node_ident)
+        self.replacements = replacements
+        return [run(self.clone_node(expr)) for expr in body], stable_result
+
+    def is_stable_body(self, body: Tuple[AstNode, ...]) -> bool:
+        # вычисление тела зависит только от параметров (нет вызовов, глобальных переменных и исключений)
+        stable = True
+
+        def check(node: AstNode) -> bool:
+            nonlocal stable
+            if isinstance(node, CallNode) or isinstance(node, BinOpNode) and may_throw(node) or \
+                    isinstance(node, IdentNode) and node.node_ident.scope in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
+                stable = False
+            return stable
+
+        for expr in body:
+            walk(expr, check)
+        return stable
+
+    @visitor.on('AstNode')
+    def clone_node(self, AstNode):
+        """
+        Копирование выражения (инструкции) тела встраиваемой функции с заменой параметров
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def clone_node(self, node: AstNode) -> AstNode:
+        return copy.copy(node)
+
+    @visitor.when(IdentNode)
+    def clone_node(self, node: IdentNode) -> AstNode:
+        if node.node_ident in self.replacements:
+            return (yield self.clone_node(self.replacements[node.node_ident]))
+        return copy.copy(node)
+
+    @visitor.when(BinOpNode)
+    def clone_node(self, node: BinOpNode) -> AstNode:
+        node = copy.copy(node)
+        node.arg1 = yield self.clone_node(node.arg1)
+        node.arg2 = yield self.clone_node(node.arg2)
+        return node
+
+    @visitor.when(TypeConvertNode)
+    def clone_node(self, node: TypeConvertNode) -> AstNode:
+        node = copy.copy(node)
+        node.expr = yield self.clone_node(node.expr)
+        return node
+
+    @visitor.when(CallNode)
+    def clone_node(self, node: CallNode) -> AstNode:
+        node = copy.copy(node)
+        node.func = copy.copy(node.func)
+        params = []
+        for param in node.params:
+            params.append((yield self.clone_node(param)))
+        node.params = tuple(params)
+        return node
+
+    @visitor.when(AssignNode)
+    def clone_node(self, node: AssignNode) -> AstNode:
+        node = copy.copy(node)
+        node.var = copy.copy(node.var)
+        node.val = yield self.clone_node(node.val)
+        return node
+
+    def inline_value(self, expr: AstNode, allowed: bool) -> AstNode:
+        """Встраивание вызовов в выражение, вычисляемое инструкцией
+        :param allowed: можно ли вычислять аргументы во временные переменные перед инструкцией
+        """
+
+        self.allowed = allowed
+        expr, _ = yield self.inline_expr(expr)
+        return expr
+
+    def with_decls(self, decls: List[VarsNode], stmt: AstNode) -> AstNode:
+        # инструкция с предшествующими объявлениями временных переменных для аргументов встроенных функций
+        if not decls:
+            return stmt
+        block = StmtListNode(*decls, stmt, row=stmt.row, col=stmt.col)
+        block.node_type = TypeDesc.VOID
+        return block
+
+    @visitor.on('AstNode')
+    def inline_expr(self, AstNode):
+        """
+        Нужен для работы модуля visitor (инициализации диспетчера)
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def inline_expr(self, node: AstNode) -> Tuple[AstNode, bool]:
+        self.allowed = False
+        return node, False
+
+    @visitor.when(LiteralNode)
+    def inline_expr(self, node: LiteralNode) -> Tuple[AstNode, bool]:
+        return node, True
+
+    @visitor.when(IdentNode)
+    def inline_expr(self, node: IdentNode) -> Tuple[AstNode, bool]:
+        stable = node.node_ident.scope in (ScopeType.LOCAL, ScopeType.PARAM)
+        self.allowed = self.allowed and stable
+        return node, stable
+
+    @visitor.when(TypeConvertNode)
+    def inline_expr(self, node: TypeConvertNode) -> Tuple[AstNode, bool]:
+        node.expr, stable = yield self.inline_expr(node.expr)
+        return node, stable
+
+    @visitor.when(BinOpNode)
+    def inline_expr(self, node: BinOpNode) -> Tuple[AstNode, bool]:
+        node.arg1, stable1 = yield self.inline_expr(node.arg1)
+        if node.op in (BinOp.LOGICAL_AND, BinOp.LOGICAL_OR):
+            # второй операнд вычисляется не всегда
+            allowed = self.allowed
+            self.allowed = False
+            node.arg2, stable2 = yield self.inline_expr(node.arg2)
+            self.allowed = allowed and stable2
+        else:
+            node.arg2, stable2 = yield self.inline_expr(node.arg2)
+        stable = stable1 and stable2 and not may_throw(node)
+        self.allowed = self.allowed and stable
+        return node, stable
+
+    def inline_params(self, node: CallNode) -> List[bool]:
+        stable_params = []
+        params = []
+        for param in node.params:
+            param, stable = yield self.inline_expr(param)
+            params.append(param)
+            stable_params.append(stable)
+        node.params = tuple(params)
+        return stable_params
+
+    @visitor.when(CallNode)
+    def inline_expr(self, node: CallNode) -> Tuple[AstNode, bool]:
+        allowed = self.allowed
+        stable_params = yield self.inline_params(node)
+        body = self.inlinable_body(node.func.node_ident)
+        if body is not None and node.node_type is not TypeDesc.VOID:
+            expanded = self.expand(node, body, stable_params, allowed)
+            if expanded is not None:
+                (expr, ), stable = expanded
+                self.allowed = self.allowed and stable
+                return expr, stable
+        self.allowed = False
+        return node, False
+
+    @visitor.on('AstNode')
+    def inline_node(self, AstNode):
+        """
+        Нужен для работы модуля visitor (инициализации диспетчера)
+        """
+        pass
+
+    @visitor.when(AstNode)
+    def inline_node(self, node: AstNode) -> AstNode:
+        return node
+
+    @visitor.when(CallNode)
+    def inline_node(self, node: CallNode) -> AstNode:
+        self.decls = []
+        self.allowed = True
+        stable_params = yield self.inline_params(node)
+        body = self.inlinable_body(node.func.node_ident)
+        if body is not None and node.node_type is TypeDesc.VOID:
+            stmts, _ = self.expand(node, body, stable_params, True)
+            block = StmtListNode(*self.decls, *stmts, row=node.row, col=node.col)
+            block.node_type = TypeDesc.VOID
+            return block if block.stmts else EMPTY_STMT
+        return self.with_decls(self.decls, node)
+
+    @visitor.when(AssignNode)
+    def inline_node(self, node: AssignNode) -> AstNode:
+        self.decls = []
+        node.val = yield self.inline_value(node.val, True)
+        return self.with_decls(self.decls, node)
+
+    @visitor.when(VarsNode)
+    def inline_node(self, node: VarsNode) -> AstNode:
+        self.decls = []
+        allowed = True
+        for var in node.vars:
+            if isinstance(var, AssignNode):
+                var.val = yield self.inline_value(var.val, allowed)
+                # аргументы нельзя вычислять до инициализации предыдущих переменных
+                allowed = False
+        return self.with_decls(self.decls, node)
+
+    @visitor.when(ReturnNode)
+    def inline_node(self, node: ReturnNode) -> AstNode:
+        self.decls = []
+        node.val = yield self.inline_value(node.val, True)
+        return self.with_decls(self.decls, node)
+
+    @visitor.when(IfNode)
+    def inline_node(self, node: IfNode) -> AstNode:
+        self.decls = []
+        node.cond = yield self.inline_value(node.cond, True)
+        decls = self.decls
+        node.then_stmt = yield self.inline_node(node.then_stmt)
+        if node.else_stmt:
+            node.else_stmt = yield self.inline_node(node.else_stmt)
+        return self.with_decls(decls, node)
+
+    @visitor.when(WhileNode)
+    def inline_node(self, node: WhileNode) -> AstNode:
+        node.cond = yield self.inline_value(node.cond, False)
+        node.body = yield self.inline_node(node.body)
+        return node
+
+    @visitor.when(ForNode)
+    def inline_node(self, node: ForNode) -> AstNode:
+        node.init = yield self.inline_node(node.init)
+        node.cond = yield self.inline_value(node.cond, False)
+        node.step = yield self.inline_node(node.step)
+        node.body = yield self.inline_node(node.body)
+        return node
+
+    @visitor.when(StmtListNode)
+    def inline_node(self, node: StmtListNode) -> AstNode:
+        stmts = []
+        for stmt in node.stmts:
+            stmt = yield self.inline_node(stmt)
+            if not is_empty_stmt(stmt):
+                stmts.append(stmt)
+        node.stmts = tuple(stmts)
+        return node
+
+
+def optimize(prog: StmtListNode, inline_max_size: int = INLINE_MAX_SIZE) -> StmtListNode:
+    """Оптимизация проверенного AST-дерева перед генерацией кода
+    :param prog: корень AST-дерева (после семантического анализа)
+    :param inline_max_size: максимальный размер тела встраиваемой функции (0 - без встраивания)
+    :return: корень оптимизированного AST-дерева
+    """
+
+    prog = ConstantFolder().fold(prog)
+    prog = DeadCodeEliminator().eliminate(prog)
+    if inline_max_size > 0:
+        prog = FunctionInliner(inline_max_size).inline(prog)
+        # встроенные тела функций оптимизируются вместе с местом вызова
+        prog = ConstantFolder().fold(prog)
+        prog = DeadCodeEliminator().eliminate(prog)
+    prog = TailRecursionAccumulator().transform(prog)
+    prog = LoopInvariantCodeMotion().move(prog)
+    return prog
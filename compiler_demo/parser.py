@@ -1,5 +1,6 @@
 import inspect
-from typing import Type
+from contextlib import contextmanager
+from typing import Type, Tuple, Optional, Iterator
 
 import pyparsing as pp
 from pyparsing import pyparsing_common as ppc
@@ -7,8 +8,17 @@ from pyparsing import pyparsing_common as ppc
 from compiler_demo.ast import *
 
 
+PACKRAT_CACHE_SIZE = 128
+
+
 # noinspection PyPep8Naming
-def make_parser():
+def make_parser(packrat: bool = False, packrat_cache_size: int = PACKRAT_CACHE_SIZE):
+    """Построение грамматики языка
+    :param packrat: включить packrat-мемоизацию (кэширование результатов разбора элементов грамматики по позиции)
+    :param packrat_cache_size: ограничение размера кэша (при переполнении вытесняются самые старые записи)
+    :return: стартовый элемент грамматики
+    """
+
     IF = pp.Keyword('if')
     FOR = pp.Keyword('for')
     WHILE = pp.Keyword('while')
@@ -154,36 +164,74 @@ def make_parser():
         if isinstance(value, pp.ParserElement):
             set_parse_action_magic(var_name, value)
 
+    # настройка мемоизации хранится в грамматике (в pyparsing она глобальная и включается только на время разбора)
+    start.packrat_cache_size = packrat_cache_size if packrat else None
     return start
 
 
 parser = make_parser()
 
+# статистика packrat-кэша последнего разбора: кол-во попаданий, кол-во промахов
+last_packrat_stats: Tuple[int, int] = (0, 0)
+
+
+def enable_packrat(cache_size: int = PACKRAT_CACHE_SIZE) -> None:
+    parser.packrat_cache_size = cache_size
+
+
+def disable_packrat() -> None:
+    parser.packrat_cache_size = None
+
+
+def packrat_stats() -> Tuple[int, int, float]:
+    """Статистика packrat-кэша для последнего разбора
+    :return: кол-во попаданий, кол-во промахов, доля попаданий
+    """
+
+    hits, misses = last_packrat_stats
+    total = hits + misses
+    return hits, misses, hits / total if total else 0.0
+
+
+@contextmanager
+def memoization(cache_size: Optional[int]) -> Iterator[None]:
+    """Включение (или выключение) packrat-мемоизации pyparsing на время разбора:
+       в pyparsing она включается глобально для всех грамматик, поэтому после разбора
+       восстанавливаются предыдущие настройки
+    :param cache_size: размер кэша (None - мемоизация выключена)
+    """
+
+    global last_packrat_stats
+
+    element = pp.ParserElement
+    saved = element._packratEnabled, element.packrat_cache, element._parse, list(element.packrat_cache_stats)
+    try:
+        element._packratEnabled = False
+        element._parse = element._parseNoCache
+        if cache_size is not None:
+            element.enablePackrat(cache_size)
+        element.packrat_cache_stats[:] = [0] * len(element.packrat_cache_stats)
+        yield
+    finally:
+        last_packrat_stats = tuple(element.packrat_cache_stats[:2])
+        element._packratEnabled, element.packrat_cache, element._parse, element.packrat_cache_stats[:] = saved
+
 
 def parse(prog: str) -> StmtListNode:
-    locs = []
-    row, col = 0, 0
-    for ch in prog:
-        if ch == '\n':
-            row += 1
-            col = 0
-        elif ch == '\r':
-            pass
-        else:
-            col += 1
-        locs.append((row, col))
+    prog = str(prog)
+    # строка и позиция узлов вычисляются по смещению (loc) только при обращении к ним
+    positions = SourcePositions(prog)
 
     old_init_action = AstNode.init_action
 
     def init_action(node: AstNode) -> None:
-        loc = getattr(node, 'loc', None)
-        if isinstance(loc, int):
-            node.row = locs[loc][0] + 1
-            node.col = locs[loc][1] + 1
+        if isinstance(node.loc, int):
+            node.positions = positions
 
     AstNode.init_action = init_action
     try:
-        prog: StmtListNode = parser.parseString(str(prog))[0]
+        with memoization(parser.packrat_cache_size):
+            prog: StmtListNode = parser.parseString(prog)[0]
         prog.program = True
         return prog
     finally:
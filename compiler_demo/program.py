@@ -1,60 +1,111 @@
 import sys
+import time
 import traceback
 import os
+from typing import Optional, TextIO
 
 from compiler_demo import parser
+from compiler_demo import rd_parser
 from compiler_demo import semantic_base
 from compiler_demo import semantic_checker
+from compiler_demo import optimizer
+from compiler_demo import ir
 from compiler_demo import msil
 from compiler_demo import jbc
+from compiler_demo import class_file
 
 
-def execute(prog: str, msil_only: bool = False, jbc_only: bool = False, file_name: str = None) -> None:
+PARSERS = {
+    'pyparsing': parser.parse,
+    'rd': rd_parser.parse,
+}
+
+
+def execute(prog: str, msil_only: bool = False, jbc_only: bool = False, file_name: str = None,
+            packrat_cache_size: Optional[int] = None, parse_stats: bool = False,
+            parser_engine: str = 'pyparsing', optimize: bool = True, msil_tail_prefix: bool = False,
+            inline_max_size: int = optimizer.INLINE_MAX_SIZE, jar_file: Optional[str] = None,
+            out: Optional[TextIO] = None, dump_ir: bool = False) -> None:
+    if out is None:
+        out = sys.stdout
+    # при записи jar-файла генерируется только java byte code (ast, msil и т.д. не выводятся)
+    if jar_file is not None:
+        msil_only, jbc_only = False, True
+    if packrat_cache_size is not None:
+        parser.enable_packrat(packrat_cache_size)
+    else:
+        parser.disable_packrat()
     try:
-        prog = parser.parse(prog)
+        parse_start = time.perf_counter()
+        prog = PARSERS[parser_engine](prog)
+        if parse_stats:
+            print('parse: {:.3f} s'.format(time.perf_counter() - parse_start), file=sys.stderr)
+            if packrat_cache_size is not None and parser_engine == 'pyparsing':
+                print('packrat cache: hits {}, misses {}, hit rate {:.1%}'.format(*parser.packrat_stats()),
+                      file=sys.stderr)
     except Exception as e:
         print('Ошибка: {}'.format(e.message), file=sys.stderr)
         traceback.print_exc(file=sys.stderr)
         exit(1)
 
     if not (msil_only or jbc_only):
-        print('ast:')
-        print(*prog.tree, sep=os.linesep)
+        print('ast:', file=out)
+        print(*prog.tree, sep=os.linesep, file=out)
 
     if not (msil_only or jbc_only):
-        print()
-        print('semantic-check:')
+        print(file=out)
+        print('semantic-check:', file=out)
     try:
         checker = semantic_checker.SemanticChecker()
         scope = semantic_checker.prepare_global_scope()
-        checker.semantic_check(prog, scope)
+        checker.check(prog, scope)
         if not (msil_only or jbc_only):
-            print(*prog.tree, sep=os.linesep)
-            print()
+            print(*prog.tree, sep=os.linesep, file=out)
+            print(file=out)
     except semantic_base.SemanticException as e:
         print('Ошибка: {}'.format(e.message), file=sys.stderr)
         exit(2)
 
+    if optimize:
+        prog = optimizer.optimize(prog, inline_max_size=inline_max_size)
+
+    # промежуточное представление строится один раз и используется обоими генераторами кода
+    ir_prog = ir.build_ir(prog, promote_globals=optimize)
+    if dump_ir:
+        # при выводе только кода (--msil-only, --jbc-only, --jar) дамп выводится в stderr, чтобы не портить код
+        dump_file = sys.stderr if msil_only or jbc_only else out
+        print('ir:', file=dump_file)
+        print(*ir_prog.tree, sep=os.linesep, file=dump_file)
+
     if not (msil_only or jbc_only):
-        print()
-        print('msil:')
+        print(file=out)
+        print('msil:', file=out)
     if not jbc_only:
         try:
-            gen = msil.MsilCodeGenerator()
-            gen.gen_program(prog)
-            print(*gen.code, sep=os.linesep)
+            gen = msil.MsilCodeGenerator(tail_prefix=msil_tail_prefix, tail_recursion=optimize)
+            gen.gen_program(ir_prog)
+            if optimize:
+                gen.peephole()
+            gen.write(out)
         except msil.MsilException or Exception as e:
             print('Ошибка: {}'.format(e.message), file=sys.stderr)
             exit(3)
 
     if not (msil_only or jbc_only):
-        print()
-        print('jbc:')
+        print(file=out)
+        print('jbc:', file=out)
     if not msil_only:
         try:
-            gen = jbc.JbcCodeGenerator(file_name)
-            gen.gen_program(prog)
-            print(*gen.code, sep=os.linesep)
+            gen = jbc.JbcCodeGenerator(file_name, tail_recursion=optimize)
+            gen.gen_program(ir_prog)
+            if optimize:
+                gen.peephole()
+            if jar_file is not None:
+                # class-файл и jar-файл записываются без внешнего ассемблера и утилиты jar
+                class_bytes = class_file.ClassFileWriter().write(gen.code_lines)
+                class_file.write_jar(jar_file, gen.class_name, class_bytes)
+            else:
+                gen.write(out)
         except jbc.JbcException or Exception as e:
             print('Ошибка: {}'.format(e.message), file=sys.stderr)
             exit(4)
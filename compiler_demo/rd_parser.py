@@ -0,0 +1,439 @@
+import re
+from typing import List, NamedTuple, Any
+
+from compiler_demo.ast import *
+
+
+class SyntaxException(Exception):
+    """Класс для исключений во время синтаксического анализа
+    """
+
+    def __init__(self, message, row: int = None, col: int = None, **kwargs: Any) -> None:
+        if row or col:
+            message += ' (строка: {}, позиция: {})'.format(row, col)
+        self.message = message
+
+
+NUM, STR, IDENT, OP, EOF = 'num', 'str', 'ident', 'op', 'eof'
+
+# ключевые слова, которые не могут быть идентификаторами (остальные, как и в грамматике pyparsing, контекстные)
+KEYWORDS = ('if', 'for', 'return')
+
+# регулярные выражения совпадают с используемыми в грамматике pyparsing (см. parser.py)
+TOKEN_RE = re.compile(r'''
+    (?P<skip>[ \t\r\n]+|/\*(?:[^*]|\*(?!/))*\*/|//(?:\\\n|[^\n])*)
+  | (?P<num>\d+\.?\d*(?:[eE][+-]?\d+)?)
+  | (?P<str>"(?:\\.|[^"\n\r\\])*")
+  | (?P<ident>[^\W\d]\w*)
+  | (?P<op>&&|\|\||>=|<=|==|!=|[-+*/%<>=(){}\[\];,])
+''', re.VERBOSE)
+
+# уровни бинарных операций от низшего приоритета к высшему; False - операция неассоциативна
+# (в грамматике pyparsing сравнения описаны через Optional, т.е. a < b < c не разбирается)
+BIN_OP_LEVELS = (
+    (('||',), True),
+    (('&&',), True),
+    (('==', '!='), False),
+    (('>=', '<=', '>', '<'), False),
+    (('+', '-'), True),
+    (('*', '/', '%'), True),
+)
+BIN_OP_PRIORITIES = {op: (priority, assoc) for priority, (ops, assoc) in enumerate(BIN_OP_LEVELS) for op in ops}
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    pos: int
+
+
+def tokenize(prog: str) -> List[Token]:
+    """Разбиение исходного кода на лексемы за один проход
+    :param prog: исходный код
+    :return: список лексем (последняя - EOF)
+    """
+
+    tokens: List[Token] = []
+    pos, length = 0, len(prog)
+    match = TOKEN_RE.match
+    while pos < length:
+        m = match(prog, pos)
+        if m is None:
+            raise SyntaxException('Неизвестный символ {!r}'.format(prog[pos]), *SourcePositions(prog).row_col(pos))
+        kind = m.lastgroup
+        if kind != 'skip':
+            tokens.append(Token(kind, m.group(), pos))
+        pos = m.end()
+    tokens.append(Token(EOF, '', length))
+    return tokens
+
+
+class _Backtrack(Exception):
+    """Неудача при разборе альтернативы (для возврата и перебора следующей альтернативы)
+    """
+
+    pass
+
+
+class Parser:
+    """Синтаксический анализатор методом рекурсивного спуска, бинарные операции разбираются
+       методом "precedence climbing".
+
+       Строит AST-дерево из тех же классов, что и грамматика pyparsing (порядок перебора альтернатив тот же,
+       но большинство альтернатив отсекается по первым лексемам); позиция узла - начало его первой лексемы.
+    """
+
+    def __init__(self, tokens: List[Token], positions: SourcePositions) -> None:
+        self.tokens = tokens
+        self.positions = positions
+        self.index = 0
+        # самая дальняя позиция неудачного разбора (для сообщения об ошибке)
+        self.error_index = 0
+        self.error_expected: List[str] = []
+
+    def peek(self, offset: int = 0) -> Token:
+        index = self.index + offset
+        return self.tokens[index] if index < len(self.tokens) else self.tokens[-1]
+
+    def fail(self, expected: str) -> None:
+        if self.index > self.error_index:
+            self.error_index = self.index
+            self.error_expected = []
+        if self.index == self.error_index and expected not in self.error_expected:
+            self.error_expected.append(expected)
+        raise _Backtrack()
+
+    def is_op(self, text: str, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token.kind == OP and token.text == text
+
+    def is_word(self, text: str, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token.kind == IDENT and token.text == text
+
+    def is_ident(self, offset: int = 0) -> bool:
+        token = self.peek(offset)
+        return token.kind == IDENT and token.text not in KEYWORDS
+
+    def expect_op(self, text: str) -> Token:
+        token = self.peek()
+        if token.kind != OP or token.text != text:
+            self.fail(repr(text))
+        self.index += 1
+        return token
+
+    def expect_word(self, text: str) -> Token:
+        token = self.peek()
+        if token.kind != IDENT or token.text != text:
+            self.fail(repr(text))
+        self.index += 1
+        return token
+
+    def ident(self, cls=IdentNode) -> IdentNode:
+        token = self.peek()
+        if not self.is_ident():
+            self.fail('ident' if cls is IdentNode else 'type')
+        self.index += 1
+        return cls(token.text, loc=token.pos)
+
+    def type_(self) -> TypeNode:
+        return self.ident(TypeNode)
+
+    def primary(self) -> ExprNode:
+        token = self.peek()
+        if token.kind in (NUM, STR):
+            self.index += 1
+            return LiteralNode(token.text, loc=token.pos)
+        if token.kind == OP and token.text in ('+', '-'):
+            # знак является частью числового литерала, только если записан слитно с числом
+            num = self.peek(1)
+            if num.kind == NUM and num.pos == token.pos + 1:
+                self.index += 2
+                return LiteralNode(token.text + num.text, loc=token.pos)
+        elif token.kind == IDENT:
+            if token.text in ('true', 'false'):
+                self.index += 1
+                return LiteralNode(token.text, loc=token.pos)
+            if self.is_op('(', 1):
+                start = self.index
+                try:
+                    return self.call()
+                except _Backtrack:
+                    self.index = start
+            return self.ident()
+        elif token.kind == OP and token.text == '(':
+            self.index += 1
+            expr = self.expr()
+            self.expect_op(')')
+            return expr
+        self.fail('expr')
+
+    def expr(self, min_priority: int = 0) -> ExprNode:
+        start = self.peek()
+        node = self.primary()
+        # после неассоциативной операции (и любой операции с более низким приоритетом) продолжать
+        # можно только операциями с более низким приоритетом
+        max_priority = len(BIN_OP_LEVELS)
+        while True:
+            token = self.peek()
+            if token.kind != OP or token.text not in BIN_OP_PRIORITIES:
+                break
+            priority, assoc = BIN_OP_PRIORITIES[token.text]
+            if priority < min_priority or priority > max_priority:
+                break
+            self.index += 1
+            arg2 = self.expr(priority + 1)
+            node = BinOpNode(BinOp(token.text), node, arg2, loc=start.pos)
+            max_priority = priority if assoc else priority - 1
+        return node
+
+    def call(self) -> CallNode:
+        start = self.peek()
+        func = self.ident()
+        self.expect_op('(')
+        params = []
+        if not self.is_op(')'):
+            params.append(self.expr())
+            while self.is_op(','):
+                self.index += 1
+                params.append(self.expr())
+        self.expect_op(')')
+        return CallNode(func, *params, loc=start.pos)
+
+    def assign(self) -> AssignNode:
+        start = self.peek()
+        var = self.ident()
+        self.expect_op('=')
+        return AssignNode(var, self.expr(), loc=start.pos)
+
+    def simple_stmt(self) -> StmtNode:
+        return self.assign() if self.is_op('=', 1) else self.call()
+
+    def vars_(self) -> VarsNode:
+        start = self.peek()
+        type_ = self.type_()
+        vars_ = [self.var_inner()]
+        while self.is_op(','):
+            index = self.index
+            self.index += 1
+            try:
+                vars_.append(self.var_inner())
+            except _Backtrack:
+                self.index = index
+                break
+        return VarsNode(type_, *vars_, loc=start.pos)
+
+    def var_inner(self) -> Union[IdentNode, AssignNode]:
+        if self.is_op('=', 1):
+            index = self.index
+            try:
+                return self.assign()
+            except _Backtrack:
+                self.index = index
+        return self.ident()
+
+    def for_stmt_list(self) -> StmtNode:
+        if self.is_ident() and self.is_ident(1):
+            index = self.index
+            try:
+                return self.vars_()
+            except _Backtrack:
+                self.index = index
+        start = self.peek()
+        stmts = []
+        index = self.index
+        try:
+            stmts.append(self.simple_stmt())
+            while self.is_op(','):
+                index = self.index
+                self.index += 1
+                stmts.append(self.simple_stmt())
+        except _Backtrack:
+            self.index = index
+        return StmtListNode(*stmts, loc=start.pos)
+
+    def if_(self) -> IfNode:
+        start = self.expect_word('if')
+        self.expect_op('(')
+        cond = self.expr()
+        self.expect_op(')')
+        then_stmt = self.stmt()
+        else_stmt = None
+        if self.is_word('else'):
+            index = self.index
+            self.index += 1
+            try:
+                else_stmt = self.stmt()
+            except _Backtrack:
+                self.index = index
+        return IfNode(cond, then_stmt, else_stmt, loc=start.pos)
+
+    def while_(self) -> WhileNode:
+        start = self.expect_word('while')
+        self.expect_op('(')
+        cond = self.expr()
+        self.expect_op(')')
+        return WhileNode(cond, self.stmt(), loc=start.pos)
+
+    def for_(self) -> ForNode:
+        start = self.expect_word('for')
+        self.expect_op('(')
+        init = self.for_stmt_list()
+        self.expect_op(';')
+        cond = None
+        index = self.index
+        try:
+            cond = self.expr()
+        except _Backtrack:
+            self.index = index
+        self.expect_op(';')
+        step = self.for_stmt_list()
+        self.expect_op(')')
+        body = None
+        index = self.index
+        try:
+            body = self.stmt()
+        except _Backtrack:
+            self.index = index
+            self.expect_op(';')
+        return ForNode(init, cond, step, body, loc=start.pos)
+
+    def return_(self) -> ReturnNode:
+        start = self.expect_word('return')
+        return ReturnNode(self.expr(), loc=start.pos)
+
+    def map_(self) -> MapDeclarationNode:
+        start = self.expect_word('map')
+        self.expect_op('<')
+        key_type = self.type_()
+        self.expect_op(',')
+        value_type = self.type_()
+        self.expect_op('>')
+        return MapDeclarationNode(key_type, value_type, self.expr(), loc=start.pos)
+
+    def map_access(self) -> MapAccessNode:
+        start = self.peek()
+        name = self.expr()
+        self.expect_op('[')
+        key_expr = self.expr()
+        self.expect_op(']')
+        self.expect_op('=')
+        return MapAccessNode(name, key_expr, self.expr(), loc=start.pos)
+
+    def composite(self) -> StmtListNode:
+        self.expect_op('{')
+        stmt_list = self.stmt_list()
+        self.expect_op('}')
+        return stmt_list
+
+    def func(self) -> FuncNode:
+        start = self.peek()
+        type_ = self.type_()
+        name = self.ident()
+        self.expect_op('(')
+        params = []
+        if self.is_ident():
+            params.append(self.param())
+            while self.is_op(','):
+                self.index += 1
+                params.append(self.param())
+        self.expect_op(')')
+        body = self.composite()
+        return FuncNode(type_, name, tuple(params), body, loc=start.pos)
+
+    def param(self) -> ParamNode:
+        start = self.peek()
+        return ParamNode(self.type_(), self.ident(), loc=start.pos)
+
+    def stmt(self) -> StmtNode:
+        # if, for и return не могут быть идентификаторами, поэтому других альтернатив для них нет
+        if self.is_word('if'):
+            return self.if_()
+        if self.is_word('for'):
+            return self.for_()
+        if self.is_word('return'):
+            return self.return_()
+
+        # остальные альтернативы перебираются в том же порядке, что и в грамматике pyparsing
+        alternatives = []
+        if self.is_word('while') and self.is_op('(', 1):
+            alternatives.append(self.while_)
+        if self.is_ident() and (self.is_op('=', 1) or self.is_op('(', 1)):
+            alternatives.append(self.simple_stmt_semi)
+        if self.is_word('map') and self.is_op('<', 1):
+            alternatives.append(self.map_)
+        token = self.peek()
+        if token.kind in (NUM, STR) or self.is_ident() or token.kind == OP and token.text in ('(', '+', '-'):
+            alternatives.append(self.map_access)
+        if self.is_ident() and self.is_ident(1):
+            alternatives.append(self.vars_semi)
+            if self.is_op('(', 2):
+                alternatives.append(self.func)
+        if self.is_op('{'):
+            alternatives.append(self.composite)
+
+        index = self.index
+        for alternative in alternatives:
+            try:
+                return alternative()
+            except _Backtrack:
+                self.index = index
+        self.fail('stmt')
+
+    def simple_stmt_semi(self) -> StmtNode:
+        stmt = self.simple_stmt()
+        self.expect_op(';')
+        return stmt
+
+    def vars_semi(self) -> VarsNode:
+        stmt = self.vars_()
+        self.expect_op(';')
+        return stmt
+
+    def stmt_list(self) -> StmtListNode:
+        start = self.peek()
+        stmts = []
+        while True:
+            index = self.index
+            try:
+                stmts.append(self.stmt())
+            except _Backtrack:
+                self.index = index
+                break
+            while self.is_op(';'):
+                self.index += 1
+        return StmtListNode(*stmts, loc=start.pos)
+
+    def program(self) -> StmtListNode:
+        prog = self.stmt_list()
+        if self.peek().kind != EOF:
+            self.fail('end of text')
+        return prog
+
+    def syntax_error(self) -> SyntaxException:
+        token = self.tokens[min(self.error_index, len(self.tokens) - 1)]
+        found = repr(token.text) if token.kind != EOF else 'конец текста'
+        return SyntaxException('Ожидалось {}, найдено {}'.format(' или '.join(self.error_expected), found),
+                               *self.positions.row_col(token.pos))
+
+
+def parse(prog: str) -> StmtListNode:
+    prog = str(prog)
+    positions = SourcePositions(prog)
+    parser = Parser(tokenize(prog), positions)
+
+    old_init_action = AstNode.init_action
+
+    def init_action(node: AstNode) -> None:
+        if node.loc is not None:
+            node.positions = positions
+
+    AstNode.init_action = init_action
+    try:
+        prog: StmtListNode = parser.program()
+    except _Backtrack:
+        raise parser.syntax_error() from None
+    finally:
+        AstNode.init_action = old_init_action
+    prog.program = True
+    return prog
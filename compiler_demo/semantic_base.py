@@ -1,4 +1,5 @@
-from typing import Any, Dict, Optional, Tuple
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 from enum import Enum
 
 
@@ -51,17 +52,43 @@ class TypeDesc:
        Для поддержки сложных типов (массивы и т.п.) должен быть рассширен
     """
 
+    __slots__ = ('base_type', 'return_type', 'params')
+
     VOID: 'TypeDesc'
     INT: 'TypeDesc'
     FLOAT: 'TypeDesc'
     BOOL: 'TypeDesc'
     STR: 'TypeDesc'
 
-    def __init__(self, base_type_: Optional[BaseType] = None,
-                 return_type: Optional['TypeDesc'] = None, params: Optional[Tuple['TypeDesc']] = None) -> None:
-        self.base_type = base_type_
-        self.return_type = return_type
-        self.params = params
+    # все экземпляры TypeDesc канонические (hash consing): один экземпляр на каждое сочетание
+    # (base_type, return_type, params), поэтому типы сравниваются по ссылке и могут быть ключами словарей
+    _instances: Dict[Tuple[Optional[BaseType], Optional['TypeDesc'], Optional[Tuple['TypeDesc', ...]]], 'TypeDesc'] = {}
+
+    def __new__(cls, base_type_: Optional[BaseType] = None,
+                return_type: Optional['TypeDesc'] = None, params: Optional[Tuple['TypeDesc']] = None) -> 'TypeDesc':
+        if params is not None:
+            params = tuple(params)
+        key = (base_type_, return_type, params)
+        type_ = cls._instances.get(key)
+        if type_ is None:
+            type_ = super().__new__(cls)
+            object.__setattr__(type_, 'base_type', base_type_)
+            object.__setattr__(type_, 'return_type', return_type)
+            object.__setattr__(type_, 'params', params)
+            cls._instances[key] = type_
+        return type_
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError('TypeDesc не может изменяться')
+
+    def __copy__(self) -> 'TypeDesc':
+        return self
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> 'TypeDesc':
+        return self
+
+    def __reduce__(self):
+        return TypeDesc, (self.base_type, self.return_type, self.params)
 
     @property
     def func(self) -> bool:
@@ -71,20 +98,15 @@ class TypeDesc:
     def is_simple(self) -> bool:
         return not self.func
 
-    def __eq__(self, other: 'TypeDesc'):
-        if self.func != other.func:
-            return False
-        if not self.func:
-            return self.base_type == other.base_type
-        else:
-            if self.return_type != other.return_type:
-                return False
-            if len(self.params) != len(other.params):
-                return False
-            for i in range(len(self.params)):
-                if self.params[i] != other.params[i]:
-                    return False
-            return True
+    @staticmethod
+    def func_type(return_type: 'TypeDesc', params: Tuple['TypeDesc', ...]) -> 'TypeDesc':
+        """Канонический тип функции
+        :param return_type: тип возвращаемого значения
+        :param params: типы параметров
+        :return: тип функции
+        """
+
+        return TypeDesc(None, return_type, tuple(params))
 
     @staticmethod
     def from_base_type(base_type_: BaseType) -> 'TypeDesc':
@@ -133,12 +155,16 @@ class IdentDesc:
     """Класс для описания переменых
     """
 
+    # jbc_offset - смещение переменной во фрейме метода (заполняется генератором Java Byte Code)
+    __slots__ = ('name', 'type', 'scope', 'index', 'built_in', 'jbc_offset')
+
     def __init__(self, name: str, type_: TypeDesc, scope: ScopeType = ScopeType.GLOBAL, index: int = 0) -> None:
         self.name = name
         self.type = type_
         self.scope = scope
         self.index = index
         self.built_in = False
+        self.jbc_offset: Optional[int] = None
 
     def __str__(self) -> str:
         return '{}, {}, {}'.format(self.type, self.scope, 'built-in' if self.built_in else self.index)
@@ -148,12 +174,25 @@ class IdentScope:
     """Класс для представлений областей видимости переменных во время семантического анализа
     """
 
+    # frozen - область видимости не может изменяться (например, область встроенных функций, общая для всех компиляций)
+    __slots__ = ('idents', 'func', 'parent', 'var_index', 'param_index', 'frozen')
+
     def __init__(self, parent: Optional['IdentScope'] = None) -> None:
-        self.idents: Dict[str, IdentDesc] = {}
+        self.idents: Mapping[str, IdentDesc] = {}
         self.func: Optional[IdentDesc] = None
         self.parent = parent
         self.var_index = 0
         self.param_index = 0
+        self.frozen = False
+
+    def freeze(self) -> 'IdentScope':
+        """Запрет изменения области видимости
+        :return: эта же область видимости
+        """
+
+        self.idents = MappingProxyType(self.idents)
+        self.frozen = True
+        return self
 
     @property
     def is_global(self) -> bool:
@@ -174,6 +213,9 @@ class IdentScope:
         return curr
 
     def add_ident(self, ident: IdentDesc) -> IdentDesc:
+        if self.frozen:
+            raise SemanticException('Идентификатор {} не может быть объявлен в неизменяемой области видимости'.format(ident.name))
+
         func_scope = self.curr_func
         global_scope = self.curr_global
 
@@ -218,6 +260,121 @@ class IdentScope:
         return ident
 
 
+class SymbolTable:
+    """Таблица символов для семантического анализа: одна хеш-таблица со стеками объявлений для каждого имени
+       и стек областей видимости (в каждой - список объявленных в ней имен).
+
+       Правила видимости и перекрытия такие же, как у IdentScope, но поиск идентификатора, вход в область
+       видимости и выход из нее (с учетом объявленных в ней имен) не зависят от глубины вложенности.
+    """
+
+    __slots__ = ('built_ins', 'symbols', 'frames', 'func', 'func_frame', 'var_index', 'param_index', 'global_var_index')
+
+    def __init__(self, built_ins: Optional[Mapping[str, IdentDesc]] = None) -> None:
+        # встроенные идентификаторы (не изменяются, поэтому используются без копирования)
+        self.built_ins: Mapping[str, IdentDesc] = built_ins if built_ins is not None else {}
+        self.symbols: Dict[str, List[IdentDesc]] = {}
+        # глобальная область видимости - frames[0]
+        self.frames: List[List[str]] = [[]]
+        # текущая функция, номер ее области видимости и счетчики индексов ее параметров и переменных
+        self.func: Optional[IdentDesc] = None
+        self.func_frame = 0
+        self.var_index = 0
+        self.param_index = 0
+        self.global_var_index = 0
+
+    @property
+    def is_global(self) -> bool:
+        return len(self.frames) == 1
+
+    @property
+    def curr_func(self) -> Optional[IdentDesc]:
+        return self.func
+
+    def enter_scope(self, func: Optional[IdentDesc] = None) -> None:
+        """Вход во вложенную область видимости
+        :param func: функция, если это область видимости функции (параметров)
+        """
+
+        self.frames.append([])
+        if func is not None:
+            self.func = func
+            self.func_frame = len(self.frames)
+            self.var_index = 0
+            self.param_index = 0
+
+    def exit_scope(self) -> None:
+        """Выход из области видимости (объявленные в ней идентификаторы перестают быть видны)
+        """
+
+        if len(self.frames) == self.func_frame:
+            self.func = None
+            self.func_frame = 0
+        symbols = self.symbols
+        for name in self.frames.pop():
+            stack = symbols[name]
+            stack.pop()
+            if not stack:
+                del symbols[name]
+
+    def add_ident(self, ident: IdentDesc) -> IdentDesc:
+        if ident.scope != ScopeType.PARAM:
+            ident.scope = ScopeType.LOCAL if self.func else \
+                ScopeType.GLOBAL if self.is_global else ScopeType.GLOBAL_LOCAL
+
+        old_ident = self.get_ident(ident.name)
+        if old_ident:
+            error = False
+            if ident.scope == ScopeType.PARAM:
+                if old_ident.scope == ScopeType.PARAM:
+                    error = True
+            elif ident.scope == ScopeType.LOCAL:
+                if old_ident.scope not in (ScopeType.GLOBAL, ScopeType.GLOBAL_LOCAL):
+                    error = True
+            else:
+                error = True
+            if error:
+                raise SemanticException('Идентификатор {} уже объявлен'.format(ident.name))
+
+        if not ident.type.func:
+            if ident.scope == ScopeType.PARAM:
+                ident.index = self.param_index
+                self.param_index += 1
+            elif self.func:
+                ident.index = self.var_index
+                self.var_index += 1
+            else:
+                ident.index = self.global_var_index
+                self.global_var_index += 1
+
+        self.symbols.setdefault(ident.name, []).append(ident)
+        self.frames[-1].append(ident.name)
+        return ident
+
+    def add_global_ident(self, ident: IdentDesc) -> IdentDesc:
+        """Добавление идентификатора (функции) в глобальную область видимости из любой вложенной
+           (аналог curr_global.add_ident для IdentScope)
+        """
+
+        ident.scope = ScopeType.GLOBAL
+        stack = self.symbols.get(ident.name)
+        # в глобальной области видимости объявлены только идентификаторы GLOBAL, они всегда в начале стека
+        if stack and stack[0].scope == ScopeType.GLOBAL or ident.name in self.built_ins:
+            raise SemanticException('Идентификатор {} уже объявлен'.format(ident.name))
+        if not ident.type.func:
+            ident.index = self.global_var_index
+            self.global_var_index += 1
+        self.symbols.setdefault(ident.name, []).insert(0, ident)
+        self.frames[0].append(ident.name)
+        return ident
+
+    def get_ident(self, name: str) -> Optional[IdentDesc]:
+        stack = self.symbols.get(name)
+        if stack:
+            return stack[-1]
+        return self.built_ins.get(name)
+
+
 class SemanticException(Exception):
     """Класс для исключений во время семантического анализа
     """
@@ -318,3 +475,31 @@ BIN_OP_TYPE_COMPATIBILITY = {
         (BOOL, BOOL): BOOL,
     },
 }
+
+
+def _resolve_bin_op(op: BinOp, arg1_type: BaseType, arg2_type: BaseType) \
+        -> Optional[Tuple[TypeDesc, Optional[TypeDesc], Optional[TypeDesc]]]:
+    compatibility = BIN_OP_TYPE_COMPATIBILITY[op]
+    if (arg1_type, arg2_type) in compatibility:
+        return TypeDesc.from_base_type(compatibility[(arg1_type, arg2_type)]), None, None
+    # сначала пробуем привести второй операнд, затем первый (в порядке TYPE_CONVERTIBILITY)
+    for conv_type in TYPE_CONVERTIBILITY.get(arg2_type, ()):
+        if (arg1_type, conv_type) in compatibility:
+            return TypeDesc.from_base_type(compatibility[(arg1_type, conv_type)]), None, TypeDesc.from_base_type(conv_type)
+    for conv_type in TYPE_CONVERTIBILITY.get(arg1_type, ()):
+        if (conv_type, arg2_type) in compatibility:
+            return TypeDesc.from_base_type(compatibility[(conv_type, arg2_type)]), TypeDesc.from_base_type(conv_type), None
+    return None
+
+
+# (операция, базовый тип 1-го операнда, базовый тип 2-го операнда) ->
+# (тип результата, тип, к которому надо привести 1-й операнд или None, тип, к которому надо привести 2-й операнд или None);
+# сочетания, к которым операция не применима, отсутствуют
+BIN_OP_RESOLUTION: Dict[Tuple[BinOp, BaseType, BaseType], Tuple[TypeDesc, Optional[TypeDesc], Optional[TypeDesc]]] = {
+    (op, arg1_type, arg2_type): resolution
+    for op in BIN_OP_TYPE_COMPATIBILITY
+    for arg1_type in BaseType
+    for arg2_type in BaseType
+    for resolution in (_resolve_bin_op(op, arg1_type, arg2_type), )
+    if resolution is not None
+}
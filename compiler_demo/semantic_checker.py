@@ -1,19 +1,33 @@
+from functools import lru_cache
 from typing import List, Optional
 
 from compiler_demo import visitor
-from compiler_demo.semantic_base import TypeDesc, ScopeType, SemanticException, BIN_OP_TYPE_COMPATIBILITY, TYPE_CONVERTIBILITY
+from compiler_demo.traversal import run
+from compiler_demo.semantic_base import BaseType, TypeDesc, ScopeType, SemanticException, SymbolTable, BIN_OP_RESOLUTION, TYPE_CONVERTIBILITY
 from compiler_demo.ast import IdentDesc, IdentScope, EMPTY_STMT, EMPTY_IDENT, \
     AstNode, LiteralNode, IdentNode, TypeNode, BinOpNode, ExprNode, TypeConvertNode, CallNode, \
     VarsNode, FuncNode, ParamNode, AssignNode, ReturnNode, IfNode, WhileNode, ForNode, StmtListNode
 
 
-BUILT_IN_OBJECTS = '''
-    string read() { }
-    void print(string p0) { }
-    void println(string p0) { }
-    int to_int(string p0) { }
-    float to_float(string p0) { }
-'''
+# встроенные функции (реализованы в runtime-java/CompilerDemo/Runtime.java и runtime-net/runtime.cs):
+# имя, возвращаемый тип, типы параметров
+BUILT_IN_FUNCTIONS = (
+    ('read', BaseType.STR, ()),
+    ('print', BaseType.VOID, (BaseType.STR, )),
+    ('println', BaseType.VOID, (BaseType.STR, )),
+    ('to_int', BaseType.INT, (BaseType.STR, )),
+    ('to_float', BaseType.FLOAT, (BaseType.STR, )),
+)
+
+# свойства встроенных функций для оптимизатора: имя -> (без побочных эффектов, может завершиться исключением);
+# read, print и println выполняют ввод-вывод, to_int и to_float - исключение при неверном формате строки
+BUILT_IN_FUNCTIONS_PURITY = {
+    'read': (False, True),
+    'print': (False, True),
+    'println': (False, True),
+    'to_int': (True, True),
+    'to_float': (True, True),
+}
 
 
 def type_convert(expr: ExprNode, type_: TypeDesc, except_node: Optional[AstNode] = None, comment: Optional[str] = None) -> ExprNode:
@@ -27,7 +41,7 @@ def type_convert(expr: ExprNode, type_: TypeDesc, except_node: Optional[AstNode]
 
     if expr.node_type is None:
         except_node.semantic_error('Тип выражения не определен')
-    if expr.node_type == type_:
+    if expr.node_type is type_:
         return expr
     if expr.node_type.is_simple and type_.is_simple and \
             expr.node_type.base_type in TYPE_CONVERTIBILITY and type_.base_type in TYPE_CONVERTIBILITY[expr.node_type.base_type]:
@@ -45,6 +59,15 @@ class SemanticChecker:
        Для поддержки сложных типов (массивы и т.п.) должен быть доработан.
     """
 
+    def check(self, node: AstNode, scope: SymbolTable) -> None:
+        """Проверка семантики поддерева (обработчики узлов - генераторы, которые через yield
+           передают обработку потомков, поэтому глубина дерева не ограничена глубиной рекурсии Python)
+        :param node: корень поддерева
+        :param scope: область видимости
+        """
+
+        run(self.semantic_check(node, scope))
+
     @visitor.on('AstNode')
     def semantic_check(self, AstNode):
         """
@@ -53,7 +76,7 @@ class SemanticChecker:
         pass
 
     @visitor.when(LiteralNode)
-    def semantic_check(self, node: LiteralNode, scope: IdentScope):
+    def semantic_check(self, node: LiteralNode, scope: SymbolTable):
         if isinstance(node.value, bool):
             node.node_type = TypeDesc.BOOL
         # проверка должна быть позже bool, т.к. bool наследник от int
@@ -67,7 +90,7 @@ class SemanticChecker:
             node.semantic_error('Неизвестный тип {} для {}'.format(type(node.value), node.value))
 
     @visitor.when(IdentNode)
-    def semantic_check(self, node: IdentNode, scope: IdentScope):
+    def semantic_check(self, node: IdentNode, scope: SymbolTable):
         ident = scope.get_ident(node.name)
         if ident is None:
             node.semantic_error('Идентификатор {} не найден'.format(node.name))
@@ -75,43 +98,30 @@ class SemanticChecker:
         node.node_ident = ident
 
     @visitor.when(TypeNode)
-    def semantic_check(self, node: TypeNode, scope: IdentScope):
+    def semantic_check(self, node: TypeNode, scope: SymbolTable):
         if node.type is None:
             node.semantic_error('Неизвестный тип {}'.format(node.name))
 
     @visitor.when(BinOpNode)
-    def semantic_check(self, node: BinOpNode, scope: IdentScope):
-        node.arg1.semantic_check(self, scope)
-        node.arg2.semantic_check(self, scope)
-
-        if node.arg1.node_type.is_simple or node.arg2.node_type.is_simple:
-            compatibility = BIN_OP_TYPE_COMPATIBILITY[node.op]
-            args_types = (node.arg1.node_type.base_type, node.arg2.node_type.base_type)
-            if args_types in compatibility:
-                node.node_type = TypeDesc.from_base_type(compatibility[args_types])
-                return
-
-            if node.arg2.node_type.base_type in TYPE_CONVERTIBILITY:
-                for arg2_type in TYPE_CONVERTIBILITY[node.arg2.node_type.base_type]:
-                    args_types = (node.arg1.node_type.base_type, arg2_type)
-                    if args_types in compatibility:
-                        node.arg2 = type_convert(node.arg2, TypeDesc.from_base_type(arg2_type))
-                        node.node_type = TypeDesc.from_base_type(compatibility[args_types])
-                        return
-            if node.arg1.node_type.base_type in TYPE_CONVERTIBILITY:
-                for arg1_type in TYPE_CONVERTIBILITY[node.arg1.node_type.base_type]:
-                    args_types = (arg1_type, node.arg2.node_type.base_type)
-                    if args_types in compatibility:
-                        node.arg1 = type_convert(node.arg1, TypeDesc.from_base_type(arg1_type))
-                        node.node_type = TypeDesc.from_base_type(compatibility[args_types])
-                        return
+    def semantic_check(self, node: BinOpNode, scope: SymbolTable):
+        yield node.arg1.semantic_check(self, scope)
+        yield node.arg2.semantic_check(self, scope)
+
+        resolution = BIN_OP_RESOLUTION.get((node.op, node.arg1.node_type.base_type, node.arg2.node_type.base_type))
+        if resolution is not None:
+            node.node_type, arg1_type, arg2_type = resolution
+            if arg1_type is not None:
+                node.arg1 = type_convert(node.arg1, arg1_type)
+            if arg2_type is not None:
+                node.arg2 = type_convert(node.arg2, arg2_type)
+            return
 
         node.semantic_error("Оператор {} не применим к типам ({}, {})".format(
             node.op, node.arg1.node_type, node.arg2.node_type
         ))
 
     @visitor.when(CallNode)
-    def semantic_check(self, node: CallNode, scope: IdentScope):
+    def semantic_check(self, node: CallNode, scope: SymbolTable):
         func = scope.get_ident(node.func.name)
         if func is None:
             node.semantic_error('Функция {} не найдена'.format(node.func.name))
@@ -126,7 +136,7 @@ class SemanticChecker:
         decl_params_str = fact_params_str = ''
         for i in range(len(node.params)):
             param: ExprNode = node.params[i]
-            param.semantic_check(self, scope)
+            yield param.semantic_check(self, scope)
             if len(decl_params_str) > 0:
                 decl_params_str += ', '
             decl_params_str += str(func.type.params[i])
@@ -149,64 +159,73 @@ class SemanticChecker:
             node.node_type = func.type.return_type
 
     @visitor.when(AssignNode)
-    def semantic_check(self, node: AssignNode, scope: IdentScope):
-        node.var.semantic_check(self, scope)
-        node.val.semantic_check(self, scope)
+    def semantic_check(self, node: AssignNode, scope: SymbolTable):
+        yield node.var.semantic_check(self, scope)
+        yield node.val.semantic_check(self, scope)
         node.val = type_convert(node.val, node.var.node_type, node, 'присваиваемое значение')
         node.node_type = node.var.node_type
 
     @visitor.when(VarsNode)
-    def semantic_check(self, node: VarsNode, scope: IdentScope):
-        node.type.semantic_check(self, scope)
+    def semantic_check(self, node: VarsNode, scope: SymbolTable):
+        yield node.type.semantic_check(self, scope)
         for var in node.vars:
             var_node: IdentNode = var.var if isinstance(var, AssignNode) else var
             try:
                 scope.add_ident(IdentDesc(var_node.name, node.type.type))
             except SemanticException as e:
                 var_node.semantic_error(e.message)
-            var.semantic_check(self, scope)
+            yield var.semantic_check(self, scope)
         node.node_type = TypeDesc.VOID
 
     @visitor.when(ReturnNode)
-    def semantic_check(self, node: ReturnNode, scope: IdentScope):
-        node.val.semantic_check(self, IdentScope(scope))
+    def semantic_check(self, node: ReturnNode, scope: SymbolTable):
+        yield node.val.semantic_check(self, scope)
         func = scope.curr_func
         if func is None:
             node.semantic_error('Оператор return применим только к функции')
-        node.val = type_convert(node.val, func.func.type.return_type, node, 'возвращаемое значение')
+        node.val = type_convert(node.val, func.type.return_type, node, 'возвращаемое значение')
         node.node_type = TypeDesc.VOID
 
     @visitor.when(IfNode)
-    def semantic_check(self, node: IfNode, scope: IdentScope):
-        node.cond.semantic_check(self, scope)
+    def semantic_check(self, node: IfNode, scope: SymbolTable):
+        yield node.cond.semantic_check(self, scope)
         node.cond = type_convert(node.cond, TypeDesc.BOOL, None, 'условие')
-        node.then_stmt.semantic_check(self, IdentScope(scope))
+        scope.enter_scope()
+        yield node.then_stmt.semantic_check(self, scope)
+        scope.exit_scope()
         if node.else_stmt:
-            node.else_stmt.semantic_check(self, IdentScope(scope))
+            scope.enter_scope()
+            yield node.else_stmt.semantic_check(self, scope)
+            scope.exit_scope()
         node.node_type = TypeDesc.VOID
 
     @visitor.when(WhileNode)
-    def semantic_check(self, node: WhileNode, scope: IdentScope):
-        node.cond.semantic_check(self, scope)
+    def semantic_check(self, node: WhileNode, scope: SymbolTable):
+        yield node.cond.semantic_check(self, scope)
         node.cond = type_convert(node.cond, TypeDesc.BOOL, None, 'условие')
-        node.body.semantic_check(self, IdentScope(scope))
+        scope.enter_scope()
+        yield node.body.semantic_check(self, scope)
+        scope.exit_scope()
         node.node_type = TypeDesc.VOID
 
     @visitor.when(ForNode)
-    def semantic_check(self, node: ForNode, scope: IdentScope):
-        scope = IdentScope(scope)
-        node.init.semantic_check(self, scope)
+    def semantic_check(self, node: ForNode, scope: SymbolTable):
+        scope.enter_scope()
+        yield node.init.semantic_check(self, scope)
         if node.cond == EMPTY_STMT:
             node.cond = LiteralNode('true')
-        node.cond.semantic_check(self, scope)
+        yield node.cond.semantic_check(self, scope)
         node.cond = type_convert(node.cond, TypeDesc.BOOL, None, 'условие')
-        node.step.semantic_check(self, scope)
-        node.body.semantic_check(self, IdentScope(scope))
+        yield node.step.semantic_check(self, scope)
+        scope.enter_scope()
+        yield node.body.semantic_check(self, scope)
+        scope.exit_scope()
+        scope.exit_scope()
         node.node_type = TypeDesc.VOID
 
     @visitor.when(ParamNode)
-    def semantic_check(self, node: ParamNode, scope: IdentScope):
-        node.type.semantic_check(self, scope)
+    def semantic_check(self, node: ParamNode, scope: SymbolTable):
+        yield node.type.semantic_check(self, scope)
         node.name.node_type = node.type.type
         try:
             node.name.node_ident = scope.add_ident(IdentDesc(node.name.name, node.type.type, ScopeType.PARAM))
@@ -215,51 +234,59 @@ class SemanticChecker:
         node.node_type = TypeDesc.VOID
 
     @visitor.when(FuncNode)
-    def semantic_check(self, node: FuncNode, scope: IdentScope):
+    def semantic_check(self, node: FuncNode, scope: SymbolTable):
         if scope.curr_func:
             node.semantic_error("Объявление функции ({}) внутри другой функции не поддерживается".format(node.name.name))
-        parent_scope = scope
-        node.type.semantic_check(self, scope)
-        scope = IdentScope(scope)
+        yield node.type.semantic_check(self, scope)
 
         # временно хоть какое-то значение, чтобы при добавлении параметров находить scope функции
-        scope.func = EMPTY_IDENT
+        scope.enter_scope(EMPTY_IDENT)
         params: List[TypeDesc] = []
         for param in node.params:
             # при проверке параметров происходит их добавление в scope
-            param.semantic_check(self, scope)
+            yield param.semantic_check(self, scope)
             param.node_ident = scope.get_ident(param.name.name)
             params.append(param.type.type)
 
-        type_ = TypeDesc(None, node.type.type, tuple(params))
+        type_ = TypeDesc.func_type(node.type.type, params)
         func_ident = IdentDesc(node.name.name, type_)
         scope.func = func_ident
         node.name.node_type = type_
         try:
-            node.name.node_ident = parent_scope.curr_global.add_ident(func_ident)
+            node.name.node_ident = scope.add_global_ident(func_ident)
         except SemanticException as e:
             node.name.semantic_error("Повторное объявление функции {}".format(node.name.name))
-        node.body.semantic_check(self, scope)
+        yield node.body.semantic_check(self, scope)
+        scope.exit_scope()
         node.node_type = TypeDesc.VOID
 
     @visitor.when(StmtListNode)
-    def semantic_check(self, node: StmtListNode, scope: IdentScope):
+    def semantic_check(self, node: StmtListNode, scope: SymbolTable):
         if not node.program:
-            scope = IdentScope(scope)
+            scope.enter_scope()
         for stmt in node.stmts:
-            stmt.semantic_check(self, scope)
+            yield stmt.semantic_check(self, scope)
+        if not node.program:
+            scope.exit_scope()
         node.node_type = TypeDesc.VOID
 
 
-def prepare_global_scope() -> IdentScope:
-    from .parser import parse
+@lru_cache(maxsize=None)
+def built_in_scope() -> IdentScope:
+    """Неизменяемая область видимости встроенных функций (создается один раз)
+    """
 
-    prog = parse(BUILT_IN_OBJECTS)
-    checker = SemanticChecker()
     scope = IdentScope()
-    checker.semantic_check(prog, scope)
-    # prog.semantic_check(scope)
-    for name, ident in scope.idents.items():
-        ident.built_in = True
-    scope.var_index = 0
-    return scope
+    for name, return_type, param_types in BUILT_IN_FUNCTIONS:
+        type_ = TypeDesc.func_type(TypeDesc.from_base_type(return_type),
+                                   tuple(TypeDesc.from_base_type(param_type) for param_type in param_types))
+        scope.add_ident(IdentDesc(name, type_)).built_in = True
+    return scope.freeze()
+
+
+def prepare_global_scope() -> SymbolTable:
+    """Таблица символов для очередной компиляции
+       (встроенные функции берутся из общей неизменяемой области видимости без копирования)
+    """
+
+    return SymbolTable(built_in_scope().idents)
@@ -0,0 +1,71 @@
+from types import GeneratorType
+from typing import Any, Callable, Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from compiler_demo.ast import AstNode
+
+
+def walk(root: 'AstNode', pre: Optional[Callable[['AstNode'], Optional[bool]]] = None,
+         post: Optional[Callable[['AstNode'], None]] = None,
+         childs: Callable[['AstNode'], Iterable['AstNode']] = lambda node: node.childs) -> None:
+    """Обход AST-дерева в глубину с явным стеком (глубина дерева не ограничена глубиной рекурсии Python)
+    :param root: корень обхода
+    :param pre: вызывается до обхода потомков узла; если возвращает False, потомки узла не обходятся
+    :param post: вызывается после обхода всех потомков узла (в т.ч. если они пропущены)
+    :param childs: функция получения потомков узла
+    """
+
+    # элементы стека: (узел, признак того, что потомки уже добавлены в стек)
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            post(node)
+            continue
+        if post is not None:
+            stack.append((node, True))
+        if pre is not None and pre(node) is False:
+            continue
+        stack.extend((child, False) for child in reversed(tuple(childs(node) or ())))
+
+
+def run(gen: Any) -> Any:
+    """Выполнение обхода, записанного в виде генераторов (без рекурсии Python)
+
+       Обработчик узла (например, метод visitor'а) вместо рекурсивного вызова для потомка
+       возвращает через yield результат вызова обработчика потомка:
+           value = yield node.arg1.semantic_check(self, scope)
+       Если это генератор, он выполняется до конца (с использованием явного стека), после чего его
+       результат (return) передается обратно в yield, иначе в yield сразу возвращается само значение.
+       Исключения из обработчиков потомков передаются в обработчик родителя (через throw).
+    :param gen: результат вызова обработчика корня обхода
+    :return: результат обработчика корня обхода
+    """
+
+    if not isinstance(gen, GeneratorType):
+        return gen
+    stack = [gen]
+    value, error = None, None
+    while stack:
+        top = stack[-1]
+        try:
+            if error is not None:
+                child, error = top.throw(error), None
+            else:
+                child = top.send(value)
+        except StopIteration as e:
+            stack.pop()
+            value = e.value
+            continue
+        except BaseException as e:
+            stack.pop()
+            if not stack:
+                raise
+            error = e
+            continue
+        if isinstance(child, GeneratorType):
+            stack.append(child)
+            value = None
+        else:
+            value = child
+    return value
@@ -22,12 +22,18 @@
 
 import inspect
 
-__all__ = ['on', 'when']
+__all__ = ['on', 'when', 'DispatchError']
+
+
+# диспетчеры по имени метода, для которого они созданы (модуль, класс.метод), чтобы when находил
+# диспетчер без разбора фреймов вызывающего кода
+_dispatchers = {}
 
 
 def on(param_name):
     def f(fn):
         dispatcher = Dispatcher(param_name, fn)
+        _dispatchers[(fn.__module__, fn.__qualname__)] = dispatcher
         return dispatcher
 
     return f
@@ -35,43 +41,65 @@ def on(param_name):
 
 def when(param_type):
     def f(fn):
-        frame = inspect.currentframe().f_back
-        func_name = fn.func_name if 'func_name' in dir(fn) else fn.__name__
-        dispatcher = frame.f_locals[func_name]
-        if not isinstance(dispatcher, Dispatcher):
-            dispatcher = dispatcher.dispatcher
+        dispatcher = _dispatchers[(fn.__module__, fn.__qualname__)]
         dispatcher.add_target(param_type, fn)
+        return dispatcher.dispatch
 
-        def ff(*args, **kw):
-            return dispatcher(*args, **kw)
+    return f
 
-        ff.dispatcher = dispatcher
-        return ff
 
-    return f
+class DispatchError(TypeError):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
 
 
 class Dispatcher(object):
     def __init__(self, param_name, fn):
-        frame = inspect.currentframe().f_back.f_back
-        top_level = frame.f_locals == frame.f_globals
         self.param_index = self.__argspec(fn).args.index(param_name)
         self.param_name = param_name
+        self.name = fn.__qualname__
         self.targets = {}
+        # обработчики, найденные по MRO, для каждого конкретного типа
+        self.cache = {}
+        self.dispatch = self.__make_dispatch()
 
     def __call__(self, *args, **kw):
         typ = args[self.param_index].__class__
-        d = self.targets.get(typ)
-        if d is not None:
-            return d(*args, **kw)
-        else:
-            issub = issubclass
-            t = self.targets
-            ks = iter(t)
-            return [t[k](*args, **kw) for k in ks if issub(typ, k)]
+        target = self.cache.get(typ)
+        if target is None:
+            target = self.resolve(typ)
+        return target(*args, **kw)
+
+    def resolve(self, typ):
+        for cls in typ.__mro__:
+            target = self.targets.get(cls)
+            if target is not None:
+                self.cache[typ] = target
+                return target
+        raise DispatchError('{}: нет обработчика для типа {}'.format(self.name, typ.__name__))
 
     def add_target(self, typ, target):
         self.targets[typ] = target
+        self.cache.clear()
+
+    def __make_dispatch(self):
+        cache_get = self.cache.get
+        resolve = self.resolve
+        if self.param_index == 1:
+            # частый случай: метод класса, диспетчеризация по первому параметру после self
+            def dispatch(self, arg, *args, **kw):
+                target = cache_get(arg.__class__)
+                if target is None:
+                    target = resolve(arg.__class__)
+                return target(self, arg, *args, **kw)
+        else:
+            call = self.__call__
+
+            def dispatch(*args, **kw):
+                return call(*args, **kw)
+        dispatch.dispatcher = self
+        return dispatch
 
     @staticmethod
     def __argspec(fn):
@@ -1,6 +1,7 @@
 import argparse
+import sys
 
-from compiler_demo import program
+from compiler_demo import program, optimizer
 
 
 def main() -> None:
@@ -8,12 +9,43 @@ def main() -> None:
     parser.add_argument('src', type=str, help='source code file')
     parser.add_argument('--msil-only', default=False, action='store_true', help='print only msil code (no ast)')
     parser.add_argument('--jbc-only', default=False, action='store_true', help='print only java byte code (no ast)')
+    parser.add_argument('--parser', default='pyparsing', choices=('pyparsing', 'rd'),
+                        help='parser engine: pyparsing grammar or hand-written recursive descent (rd)')
+    parser.add_argument('--packrat', type=int, default=None, metavar='CACHE_SIZE',
+                        help='enable packrat parsing with bounded cache (fifo eviction)')
+    parser.add_argument('--parse-stats', default=False, action='store_true',
+                        help='print parse time and packrat cache hit rate to stderr')
+    parser.add_argument('--no-optimize', default=False, action='store_true',
+                        help='disable optimization passes (constant folding etc.)')
+    parser.add_argument('--msil-tail-calls', default=False, action='store_true',
+                        help='emit tail. prefix for calls of user functions in return statements (msil)')
+    parser.add_argument('--inline-max-size', type=int, default=optimizer.INLINE_MAX_SIZE, metavar='SIZE',
+                        help='inline user functions with body of at most SIZE ast nodes (0 - no inlining)')
+    parser.add_argument('--dump-ir', default=False, action='store_true',
+                        help='print intermediate representation (basic blocks, ssa, liveness) before generated code '
+                             '(to stderr with --msil-only, --jbc-only and --jar)')
+    parser.add_argument('--jar', type=str, default=None, metavar='JAR_FILE',
+                        help='write runnable jar file (class file and runtime) instead of printing java byte code '
+                             '(implies --jbc-only)')
+    parser.add_argument('--out', type=str, default=None, metavar='OUT_FILE',
+                        help='write output (generated code) to file instead of stdout')
     args = parser.parse_args()
+    if args.jar is not None and args.msil_only:
+        parser.error('argument --jar: not allowed with argument --msil-only')
 
     with open(args.src, mode='r', encoding="utf-8") as f:
         src = f.read()
 
-    program.execute(src, args.msil_only, args.jbc_only, file_name=args.src)
+    out = open(args.out, mode='w', encoding='utf-8') if args.out is not None else sys.stdout
+    try:
+        program.execute(src, args.msil_only, args.jbc_only, file_name=args.src,
+                        packrat_cache_size=args.packrat, parse_stats=args.parse_stats,
+                        parser_engine=args.parser, optimize=not args.no_optimize,
+                        msil_tail_prefix=args.msil_tail_calls, inline_max_size=args.inline_max_size,
+                        jar_file=args.jar, out=out, dump_ir=args.dump_ir)
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
 
 if __name__ == "__main__":
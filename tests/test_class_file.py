@@ -0,0 +1,209 @@
+"""Проверка записи class-файлов и jar-файлов (compiler_demo.class_file)
+
+Код методов, max_stack и max_locals сравниваются с class-файлами tests/_N.class, собранными ассемблером ProGuard
+из tests/_N.jbc. Для сравнения class-файлы разбираются независимо от class_file: номера констант в инструкциях
+заменяются самими константами (порядок констант в пуле у ProGuard другой).
+"""
+
+import glob
+import os
+import re
+import struct
+import zipfile
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from compiler_demo import rd_parser, semantic_base, semantic_checker, optimizer, ir, jbc, class_file
+from compiler_demo.code_gen_base import CodeLine, CodeLabel
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_PROGRAMS = sorted(glob.glob(os.path.join(TESTS_DIR, '*.txt')))
+PROGUARD_CLASSES = sorted(glob.glob(os.path.join(TESTS_DIR, '_*.class')))
+
+# версия class-файла, которую записывает class_file (Java 6)
+CLASS_FILE_MAJOR_VERSION = 50
+
+
+def read_u2(data: bytes, pos: int) -> int:
+    return struct.unpack_from('>H', data, pos)[0]
+
+
+def parse_constant_pool(data: bytes) -> Tuple[List[Any], int]:
+    count = read_u2(data, 8)
+    pool: List[Any] = [None] * count
+    pos, i = 10, 1
+    while i < count:
+        tag = data[pos]
+        if tag == 1:
+            size = read_u2(data, pos + 1)
+            pool[i] = ('utf8', data[pos + 3:pos + 3 + size])
+            pos += 3 + size
+        elif tag in (3, 4):
+            pool[i] = (tag, data[pos + 1:pos + 5])
+            pos += 5
+        elif tag in (5, 6):
+            pool[i] = (tag, data[pos + 1:pos + 9])
+            pos += 9
+            i += 1
+        elif tag in (7, 8):
+            pool[i] = (tag, read_u2(data, pos + 1))
+            pos += 3
+        elif tag in (9, 10, 11, 12):
+            pool[i] = (tag, read_u2(data, pos + 1), read_u2(data, pos + 3))
+            pos += 5
+        else:
+            raise ValueError(f'constant pool tag {tag}')
+        i += 1
+    return pool, pos
+
+
+def resolve(pool: List[Any], index: int) -> Any:
+    """Константа со ссылками на другие константы, замененными их значениями
+    """
+
+    entry = pool[index]
+    if entry[0] == 'utf8':
+        return entry[1]
+    if entry[0] in (7, 8):
+        return entry[0], resolve(pool, entry[1])
+    if entry[0] in (9, 10, 11, 12):
+        return entry[0], resolve(pool, entry[1]), resolve(pool, entry[2])
+    return entry
+
+
+def opcode_operands(code: bytes, pos: int) -> Tuple[int, int]:
+    """Размер инструкции и размер номера константы в ней (0 - инструкция без номера константы) по спецификации JVM
+    """
+
+    op = code[pos]
+    if op == 0xc4:  # wide
+        return (6 if code[pos + 1] == 0x84 else 4), 0
+    if op == 0x12:  # ldc
+        return 2, 1
+    if op in (0x13, 0x14) or 0xb2 <= op <= 0xb8 or op in (0xbb, 0xbd, 0xc0, 0xc1):
+        return 3, 2
+    if op in (0x10, 0xa9) or 0x15 <= op <= 0x19 or 0x36 <= op <= 0x3a:
+        return 2, 0
+    if op in (0x11, 0x84) or 0x99 <= op <= 0xa8 or op in (0xc6, 0xc7):
+        return 3, 0
+    return 1, 0
+
+
+def decode_code(code: bytes, pool: List[Any]) -> List[Tuple]:
+    instrs = []
+    pos = 0
+    while pos < len(code):
+        size, index_size = opcode_operands(code, pos)
+        if index_size == 1:
+            instrs.append((code[pos], resolve(pool, code[pos + 1])))
+        elif index_size == 2:
+            instrs.append((code[pos], resolve(pool, read_u2(code, pos + 1))))
+        else:
+            instrs.append((code[pos], code[pos + 1:pos + size]))
+        pos += size
+    return instrs
+
+
+def parse_class(data: bytes) -> Dict[str, Any]:
+    """Разбор class-файла: версия, имя класса, поля, методы (дескриптор, max_stack, max_locals, код)
+    """
+
+    assert data[:4] == b'\xca\xfe\xba\xbe'
+    pool, pos = parse_constant_pool(data)
+    info: Dict[str, Any] = {'major': read_u2(data, 6), 'this': resolve(pool, read_u2(data, pos + 2))}
+    pos += 8 + 2 * read_u2(data, pos + 6)
+
+    def members(pos: int) -> Tuple[Dict[str, Any], int]:
+        result = {}
+        count = read_u2(data, pos)
+        pos += 2
+        for _ in range(count):
+            name, descriptor = resolve(pool, read_u2(data, pos + 2)), resolve(pool, read_u2(data, pos + 4))
+            member: Dict[str, Any] = {'descriptor': descriptor}
+            attrs_count = read_u2(data, pos + 6)
+            pos += 8
+            for _ in range(attrs_count):
+                attr_name, size = resolve(pool, read_u2(data, pos)), struct.unpack_from('>I', data, pos + 2)[0]
+                if attr_name == b'Code':
+                    max_stack, max_locals, code_size = struct.unpack_from('>HHI', data, pos + 6)
+                    member.update(max_stack=max_stack, max_locals=max_locals,
+                                  code=decode_code(data[pos + 14:pos + 14 + code_size], pool))
+                pos += 6 + size
+            result[name] = member
+        return result, pos
+
+    info['fields'], pos = members(pos)
+    info['methods'], pos = members(pos)
+    return info
+
+
+def jbc_text_lines(text: str) -> List[CodeLine]:
+    """Код в синтаксисе ассемблера ProGuard (tests/_N.jbc) -> строки кода генератора с объектами меток
+    """
+
+    labels: Dict[str, CodeLabel] = {}
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        label = None
+        match = re.match(r'(L_\d+):\s*(.*)$', line)
+        if match:
+            label = labels.setdefault(match.group(1), CodeLabel())
+            line = match.group(2)
+        parts = line.split(None, 1)
+        if len(parts) == 2 and re.fullmatch(r'L_\d+', parts[1]):
+            lines.append(CodeLine(parts[0], labels.setdefault(parts[1], CodeLabel()), label=label))
+        else:
+            lines.append(CodeLine(line or None, label=label))
+    return lines
+
+
+@pytest.mark.parametrize('class_path', PROGUARD_CLASSES, ids=os.path.basename)
+def test_class_file_same_as_proguard(class_path: str):
+    with open(os.path.splitext(class_path)[0] + '.jbc', encoding='utf-8') as f:
+        code_lines = jbc_text_lines(f.read())
+    with open(class_path, 'rb') as f:
+        expected = parse_class(f.read())
+    actual = parse_class(class_file.ClassFileWriter().write(code_lines))
+
+    assert actual['this'] == expected['this']
+    assert actual['fields'] == expected['fields']
+    assert actual['methods'].keys() == expected['methods'].keys()
+    for name, method in expected['methods'].items():
+        assert actual['methods'][name] == method, name
+
+
+@pytest.mark.parametrize('file_name', TEST_PROGRAMS, ids=os.path.basename)
+def test_jar(file_name: str, tmp_path):
+    with open(file_name, encoding='utf-8') as f:
+        prog = rd_parser.parse(f.read())
+    try:
+        semantic_checker.SemanticChecker().check(prog, semantic_checker.prepare_global_scope())
+    except semantic_base.SemanticException:
+        pytest.skip('program with semantic errors')
+    gen = jbc.JbcCodeGenerator(file_name, tail_recursion=True)
+    gen.gen_program(ir.build_ir(optimizer.optimize(prog)))
+    gen.peephole()
+
+    jar_file = tmp_path / 'program.jar'
+    class_file.write_jar(jar_file, gen.class_name, class_file.ClassFileWriter().write(gen.code_lines))
+
+    with zipfile.ZipFile(jar_file) as jar:
+        assert jar.testzip() is None
+        assert jar.namelist() == ['META-INF/MANIFEST.MF', f'{gen.class_name}.class', class_file.RUNTIME_CLASS_ENTRY]
+        manifest = jar.read('META-INF/MANIFEST.MF').decode('utf-8').splitlines()
+        assert manifest[0] == 'Manifest-Version: 1.0'
+        assert f'Main-Class: {gen.class_name}' in manifest
+        class_bytes = jar.read(f'{gen.class_name}.class')
+        with open(class_file.RUNTIME_CLASS_FILE, 'rb') as f:
+            assert jar.read(class_file.RUNTIME_CLASS_ENTRY) == f.read()
+
+    info = parse_class(class_bytes)
+    assert info['major'] == CLASS_FILE_MAJOR_VERSION
+    assert info['this'] == (7, gen.class_name.encode('utf-8'))
+    methods = {name.decode('utf-8'): method for name, method in info['methods'].items()}
+    assert methods['main']['descriptor'] == b'([Ljava/lang/String;)V'
+    assert methods['main']['max_locals'] >= 1
+    assert all(method['code'] for method in methods.values())
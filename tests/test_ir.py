@@ -0,0 +1,51 @@
+"""Проверка построения промежуточного представления (compiler_demo.ir)
+"""
+
+from typing import Dict
+
+from compiler_demo import rd_parser, semantic_checker, ir, msil
+from compiler_demo.semantic_base import IdentDesc, ScopeType
+
+
+# a - только в главной функции, b - читается функцией, c - используется только в функции (присваивание)
+GLOBALS_PROGRAM = '''
+int a = 1;
+int b = 2;
+int c;
+int f() { return b; }
+int g() { c = 5; return c; }
+println(a);
+println(f());
+println(g());
+'''
+
+
+def build_ir(src: str, promote_globals: bool) -> ir.IrProgram:
+    prog = rd_parser.parse(src)
+    semantic_checker.SemanticChecker().check(prog, semantic_checker.prepare_global_scope())
+    return ir.build_ir(prog, promote_globals=promote_globals)
+
+
+def idents_by_name(ir_prog: ir.IrProgram) -> Dict[str, IdentDesc]:
+    return {ident.name: ident for ident in (*ir_prog.globals, *ir_prog.main.locals)}
+
+
+def test_promote_globals_not_used_by_functions():
+    ir_prog = build_ir(GLOBALS_PROGRAM, promote_globals=True)
+    idents = idents_by_name(ir_prog)
+    assert idents['a'].scope == ScopeType.LOCAL
+    assert idents['a'] in ir_prog.main.locals
+    # переменные, к которым обращаются функции (в т.ч. используемая только в функции), остаются полями класса
+    assert [ident.name for ident in ir_prog.globals] == ['b', 'c']
+    assert all(ident.scope != ScopeType.LOCAL for ident in ir_prog.globals)
+
+    gen = msil.MsilCodeGenerator()
+    gen.gen_program(ir_prog)
+    fields = [line.strip() for line in gen.code if line.strip().startswith('.field')]
+    assert fields == [f'.field public static int32 _gv{ident.index}' for ident in ir_prog.globals]
+
+
+def test_no_promotion_without_optimization():
+    ir_prog = build_ir(GLOBALS_PROGRAM, promote_globals=False)
+    assert [ident.name for ident in ir_prog.globals] == ['a', 'b', 'c']
+    assert not ir_prog.main.locals
@@ -0,0 +1,52 @@
+"""Проверка оптимизаций дерева разбора (compiler_demo.optimizer)
+"""
+
+from compiler_demo import rd_parser, semantic_checker, optimizer
+from compiler_demo.ast import StmtListNode, IfNode, FuncNode, ReturnNode, IdentNode, BinOpNode, LiteralNode
+
+
+def optimize(src: str) -> StmtListNode:
+    prog = rd_parser.parse(src)
+    semantic_checker.SemanticChecker().check(prog, semantic_checker.prepare_global_scope())
+    return optimizer.optimize(prog)
+
+
+def if_count(prog: StmtListNode) -> int:
+    return sum(1 for stmt in prog.stmts if isinstance(stmt, IfNode))
+
+
+def test_dce_removes_empty_if_with_safe_cond():
+    prog = optimize('int z = 3; int w = z * 2; if (z > w) { } println(w);')
+    assert if_count(prog) == 0
+
+
+def test_dce_keeps_empty_if_with_throwing_cond():
+    # деление на 0 и сравнение строки со значением null завершаются исключением
+    prog = optimize('int x = 5; int y = 0; if (x / y > 0) { } string s; if (s < "a") { } println(x);')
+    assert if_count(prog) == 2
+
+
+def find_func(prog: StmtListNode, name: str) -> FuncNode:
+    return next(stmt for stmt in prog.stmts if isinstance(stmt, FuncNode) and stmt.name.name == name)
+
+
+def test_accumulator_implicit_return_int():
+    # выход без return возвращает 0: sum(3) = 3 + 2 + 1 + 0 = 6, т.е. в sum$acc - return acc$
+    prog = optimize('int sum(int n) { if (n > 0) { return n + sum(n - 1); } } println(sum(3));')
+    last = find_func(prog, 'sum$acc').body.stmts[-1]
+    assert isinstance(last, ReturnNode) and isinstance(last.val, IdentNode) and last.val.name == 'acc$'
+
+
+def test_accumulator_implicit_return_int_mul():
+    # для умножения выход без return дает 0, а не накопленное значение: return acc$ * 0
+    prog = optimize('int prod(int n) { if (n > 0) { return n * prod(n - 1); } } println(prod(3));')
+    last = find_func(prog, 'prod$acc').body.stmts[-1]
+    assert isinstance(last, ReturnNode) and isinstance(last.val, BinOpNode)
+    assert isinstance(last.val.arg1, IdentNode) and last.val.arg1.name == 'acc$'
+    assert isinstance(last.val.arg2, LiteralNode) and last.val.arg2.value == 0
+
+
+def test_accumulator_implicit_return_str():
+    prog = optimize('string rep(int n) { if (n > 0) { return "ab" + rep(n - 1); } } println(rep(3));')
+    last = find_func(prog, 'rep$acc').body.stmts[-1]
+    assert isinstance(last, ReturnNode) and isinstance(last.val, IdentNode) and last.val.name == 'acc$'
@@ -0,0 +1,28 @@
+"""Проверка эквивалентности движков синтаксического анализа (pyparsing и rd) на примерах программ из tests/*.txt
+"""
+
+import glob
+import os
+
+import pytest
+
+from compiler_demo import parser, rd_parser
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_PROGRAMS = sorted(glob.glob(os.path.join(TESTS_DIR, '*.txt')))
+
+
+def read_program(file_name: str) -> str:
+    with open(file_name, mode='r', encoding='utf-8') as f:
+        return f.read()
+
+
+def test_programs_found():
+    assert TEST_PROGRAMS
+
+
+@pytest.mark.parametrize('file_name', TEST_PROGRAMS, ids=os.path.basename)
+def test_rd_parser_same_ast(file_name: str):
+    prog = read_program(file_name)
+    assert list(rd_parser.parse(prog).tree) == list(parser.parse(prog).tree)
@@ -0,0 +1,59 @@
+"""Проверка замены хвостовых рекурсивных вызовов переходом: локальные переменные, значения которых
+могут использоваться до присваивания, при переходе получают те же значения, что и при вызове функции
+"""
+
+from typing import List
+
+from compiler_demo import rd_parser, semantic_checker, optimizer, ir, msil, jbc
+
+
+# строковая локальная переменная s присваивается не на всех путях (f(0) и f(1) должны давать одно и то же)
+TAIL_CALL_STR_LOCAL = '''
+string f(int n) {
+  string s;
+  if (n > 0) {
+    return f(n - 1);
+  }
+  return s + "!";
+}
+println(f(0));
+println(f(1));
+'''
+
+
+def build_ir(src: str) -> ir.IrProgram:
+    prog = rd_parser.parse(src)
+    semantic_checker.SemanticChecker().check(prog, semantic_checker.prepare_global_scope())
+    return ir.build_ir(optimizer.optimize(prog))
+
+
+def func_lines(lines: List[str], header: str) -> List[str]:
+    """Строки тела функции (от заголовка до закрывающей скобки) без отступов
+    """
+
+    lines = [line.strip() for line in lines]
+    start = next(i for i, line in enumerate(lines) if line.startswith(header))
+    return lines[start:lines.index('}', start) + 1]
+
+
+def test_msil_tail_call_resets_str_local_to_null():
+    gen = msil.MsilCodeGenerator(tail_recursion=True)
+    gen.gen_program(build_ir(TAIL_CALL_STR_LOCAL))
+    lines = func_lines(gen.code, '.method public static string f(')
+    # при вызове .locals init обнуляет строковую переменную (null), при переходе - ldnull
+    assert any(line.startswith('.locals init') for line in lines)
+    jump = next(i for i, line in enumerate(lines) if line.startswith('br '))
+    assert lines[jump - 2] == 'ldnull' and lines[jump - 1].startswith('stloc')
+    assert 'ldstr ""' not in lines
+
+
+def test_jbc_tail_call_resets_str_local_to_null():
+    gen = jbc.JbcCodeGenerator('tail_call.txt', tail_recursion=True)
+    gen.gen_program(build_ir(TAIL_CALL_STR_LOCAL))
+    lines = func_lines(gen.code, 'public static java.lang.String f(')
+    # инициализация в начале функции и перед переходом в начало одинаковая
+    init = lines[2:4]
+    assert init[0] == 'aconst_null' and init[1].startswith('astore')
+    jump = next(i for i, line in enumerate(lines) if line.startswith('goto '))
+    assert lines[jump - 2:jump] == init
+    assert 'ldc ""' not in lines